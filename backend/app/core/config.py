@@ -12,11 +12,67 @@ class Settings(BaseModel):
     anthropic_api_key: Optional[str] = os.getenv("ANTHROPIC_API_KEY")
     qdrant_url: str = os.getenv("QDRANT_URL", "http://localhost:6333")
     qdrant_api_key: Optional[str] = os.getenv("QDRANT_API_KEY")
+    # Search over gRPC (port QDRANT_GRPC_PORT) instead of REST/JSON
+    qdrant_prefer_grpc: bool = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+    qdrant_grpc_port: int = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    # Client timeout for request-path Qdrant calls
+    qdrant_timeout_seconds: float = float(os.getenv("QDRANT_TIMEOUT_SECONDS", "60"))
     collection: str = os.getenv("QDRANT_COLLECTION", "org_demo_chunks")
     max_context_tokens: int = int(os.getenv("MAX_CONTEXT_TOKENS", "3500"))
+    search_timeout_seconds: float = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "8"))
+    search_max_workers: int = int(os.getenv("SEARCH_MAX_WORKERS", "16"))
+    # Hits requested per dense-only collection, and per ranking (dense and
+    # sparse) for collections searched hybrid
+    search_top_k: int = int(os.getenv("SEARCH_TOP_K", "8"))
+    hybrid_top_k: int = int(os.getenv("HYBRID_TOP_K", "6"))
+    # Fuse dense and BM25 sparse rankings for collections that store both
+    hybrid_search: bool = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+    # "qdrant", "local" (memory-mapped snapshots only) or "auto" (Qdrant,
+    # falling back to snapshots for collections that fail)
+    retrieval_backend: str = os.getenv("RETRIEVAL_BACKEND", "qdrant").lower()
+    local_index_dir: str = os.getenv("LOCAL_INDEX_DIR", "local_index")
+    embed_cache_max_mb: int = int(os.getenv("EMBED_CACHE_MAX_MB", "64"))
+    catalog_ttl_seconds: float = float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+    answer_cache_max_entries: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+    answer_cache_ttl_seconds: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    # Cosine similarity for near-duplicate questions; 0 = exact matches only
+    answer_cache_similarity: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
 
     aws_region: str = os.getenv("AWS_REGION", "us-east-1")
     s3_bucket: str = os.getenv("S3_BUCKET", "clinical-rag-uploads-dev")
     s3_presign_expiry: int = int(os.getenv("S3_PRESIGN_EXPIRY", "900"))
+    # Lifetime of presigned GET URLs behind /documents/{id}/view
+    document_link_expiry: int = int(os.getenv("DOCUMENT_LINK_EXPIRY", "3600"))
+    # Public base URL of this API for citation links (e.g. https://api.example.com);
+    # defaults to the base URL of the incoming request
+    public_api_base: str = os.getenv("PUBLIC_API_BASE", "")
+
+    # Ingestion job queue (app.services.job_queue) and worker (app.worker)
+    ingest_worker_concurrency: int = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2"))
+    ingest_max_attempts: int = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+    ingest_retry_backoff_seconds: float = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "30"))
+    ingest_job_lease_seconds: float = float(os.getenv("INGEST_JOB_LEASE_SECONDS", "300"))
+    ingest_poll_seconds: float = float(os.getenv("INGEST_POLL_SECONDS", "2"))
+    ingest_drain_seconds: float = float(os.getenv("INGEST_DRAIN_SECONDS", "25"))
+    ingest_job_retention_days: float = float(os.getenv("INGEST_JOB_RETENTION_DAYS", "30"))
+    # Processes for PDF text extraction (0 = CPU count); PDFs with fewer
+    # pages are extracted in-process
+    pdf_extract_workers: int = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+    pdf_parallel_min_pages: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+    # OCR of scanned PDFs: processes (0 = CPU count) and rasterization DPI,
+    # lowered per page (down to OCR_MIN_DPI) for pages above the pixel budget
+    ocr_workers: int = int(os.getenv("OCR_WORKERS", "0"))
+    ocr_dpi: int = int(os.getenv("OCR_DPI", "300"))
+    ocr_min_dpi: int = int(os.getenv("OCR_MIN_DPI", "150"))
+    ocr_max_page_pixels: int = int(os.getenv("OCR_MAX_PAGE_PIXELS", "9000000"))
+    # Worker threads run inside the API process.  The default of 1 keeps
+    # single-service deploys ingesting; set 0 when a separate
+    # `python -m app.worker` service shares the API's DATABASE_URL.
+    ingest_inline_workers: int = int(os.getenv("INGEST_INLINE_WORKERS", "1"))
+
+    # Connection pools of the shared Qdrant/S3/OpenAI/Anthropic clients
+    http_pool_max_connections: int = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "64"))
+    http_pool_max_keepalive: int = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "32"))
+    http_keepalive_seconds: float = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
 
 settings = Settings()
@@ -0,0 +1,180 @@
+"""Prometheus metrics, exposed at ``/metrics``.
+
+Series (all in the default registry):
+
+- ``http_request_duration_seconds{method,route,status}`` — per route
+  template, recorded by :class:`MetricsMiddleware`
+- ``rag_stage_duration_seconds{stage}`` and
+  ``rag_collection_search_duration_seconds{collection}`` — from the
+  per-request :class:`~app.core.timing.StageTimer`
+- ``rag_collection_search_failures_total{reason}`` — collection searches
+  of the retrieval fan-out that timed out or raised (and were skipped)
+- ``external_call_duration_seconds{service,operation}`` and
+  ``external_call_errors_total{service,operation}`` — Qdrant, OpenAI,
+  Anthropic and S3 calls (the histogram count is the call count)
+- ``ingest_documents_total{outcome}``, ``ingest_{pages,chunks,vectors}_total``
+  and ``ingest_duration_seconds`` — throughput is ``rate()`` of the counters
+- ``question_log_write_duration_seconds``
+- ``cache_*{cache}`` — hit/miss/eviction counters and size gauges of every
+  cache registered with :func:`register_cache`, read at scrape time
+
+The app runs as a single uvicorn process, so the default (non-multiprocess)
+registry is used.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Request latencies range from cached answers (ms) to long Claude answers (tens of s)
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=_LATENCY_BUCKETS,
+)
+RAG_STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "rag_query time per pipeline stage",
+    ["stage"], buckets=_STAGE_BUCKETS,
+)
+RAG_COLLECTION_SEARCH_SECONDS = Histogram(
+    "rag_collection_search_duration_seconds", "rag_query search time per collection",
+    ["collection"], buckets=_STAGE_BUCKETS,
+)
+RAG_COLLECTION_SEARCH_FAILURES = Counter(
+    "rag_collection_search_failures_total", "Collection searches skipped after a timeout or error",
+    ["reason"],
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_duration_seconds", "Duration of calls to external services",
+    ["service", "operation"], buckets=_LATENCY_BUCKETS,
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "external_call_errors_total", "Failed calls to external services",
+    ["service", "operation"],
+)
+INGEST_DOCUMENTS = Counter("ingest_documents_total", "Documents ingested", ["outcome"])
+INGEST_PAGES = Counter("ingest_pages_total", "Pages parsed by ingestion")
+INGEST_CHUNKS = Counter("ingest_chunks_total", "Chunks produced by ingestion")
+INGEST_VECTORS = Counter("ingest_vectors_total", "Vectors upserted by ingestion")
+INGEST_SECONDS = Histogram(
+    "ingest_duration_seconds", "End-to-end ingestion time per document",
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200),
+)
+QUESTION_LOG_WRITE_SECONDS = Histogram(
+    "question_log_write_duration_seconds", "Latency of question_logs writes",
+    buckets=_STAGE_BUCKETS,
+)
+
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """Time a call to ``service`` and count it as an error if it raises."""
+    t = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_CALL_ERRORS.labels(service, operation).inc()
+        raise
+    finally:
+        EXTERNAL_CALL_SECONDS.labels(service, operation).observe(time.perf_counter() - t)
+
+
+def observe_rag_stages(timer) -> None:
+    for stage, ms in timer.stages.items():
+        RAG_STAGE_SECONDS.labels(stage).observe(ms / 1000)
+    for collection, ms in timer.collections.items():
+        RAG_COLLECTION_SEARCH_SECONDS.labels(collection).observe(ms / 1000)
+
+
+# ---------------------------------------------------------------------------
+# Cache statistics
+# ---------------------------------------------------------------------------
+
+# stats() keys exported as counters; every other numeric key is a gauge
+_COUNTER_KEYS = {"hits", "semantic_hits", "misses", "evictions", "invalidations"}
+
+_caches: Dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], dict]) -> None:
+    """Export ``stats()`` of a cache as ``cache_{key}{cache=name}`` series."""
+    _caches[name] = stats
+
+
+class _CacheCollector:
+    def collect(self):
+        by_key: Dict[str, List[Tuple[str, float]]] = {}
+        for name, stats in list(_caches.items()):
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    by_key.setdefault(key, []).append((name, value))
+        for key, samples in sorted(by_key.items()):
+            if key in _COUNTER_KEYS:
+                family = CounterMetricFamily(f"cache_{key}", f"Cache {key.replace('_', ' ')}", labels=["cache"])
+            else:
+                family = GaugeMetricFamily(f"cache_{key}", f"Cache {key.replace('_', ' ')}", labels=["cache"])
+            for name, value in samples:
+                family.add_metric([name], value)
+            yield family
+
+
+REGISTRY.register(_CacheCollector())
+
+
+# ---------------------------------------------------------------------------
+# HTTP middleware
+# ---------------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Record request latency labelled by route template (``/documents/{document_id:path}/view``
+    rather than the concrete path, to keep label cardinality bounded).
+
+    A pure ASGI middleware, so the timer stops at the last body message:
+    streamed responses (``/rag/query/stream``) are measured to their end,
+    not to the first byte.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        t = time.perf_counter()
+        status = 500
+        observed = False
+
+        def _observe() -> None:
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.perf_counter() - t)
+
+        async def _send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                _observe()
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            # Errors and disconnects end the request without a final body
+            _observe()
@@ -0,0 +1,106 @@
+"""Per-request stage timing.
+
+A :class:`StageTimer` accumulates wall-clock milliseconds per named stage.
+The request handler installs one with :func:`start`; code further down
+(including retrieval tasks spawned with ``asyncio.gather``, which inherit
+the context) records into it with :func:`lap`, :func:`stage` or
+:func:`record_collection` without the timer being passed around.  Outside
+a timed request these are no-ops.
+
+The result is emitted as ``{stage}_ms`` fields on the request's structlog
+event and as a ``Server-Timing`` response header, which browser dev tools
+show in the network panel.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+
+class StageTimer:
+    """Stage durations for one request.
+
+    Sequential pipelines mark stage boundaries with :meth:`lap`, which
+    charges the time since the previous boundary to ``name``; a block timed
+    with :meth:`stage` also counts as a boundary.  Repeated names accumulate.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._mark = self.started
+        self.stages: Dict[str, float] = {}
+        # Per-collection search times, broken out of the "search" stage
+        self.collections: Dict[str, float] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        self.add(name, (now - self._mark) * 1000)
+        self._mark = now
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._mark = time.perf_counter()
+            self.add(name, (self._mark - t) * 1000)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def log_fields(self) -> dict:
+        """Structured-log fields: ``{stage}_ms`` plus the per-collection map."""
+        fields = {f"{name}_ms": round(ms, 1) for name, ms in self.stages.items()}
+        if self.collections:
+            fields["search_ms_by_collection"] = {c: round(ms, 1) for c, ms in self.collections.items()}
+        return fields
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` header value (stages, then ``search.{collection}``)."""
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        entries += [f"search.{c};dur={ms:.1f}" for c, ms in self.collections.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def start() -> StageTimer:
+    """Install a fresh timer for the current request and return it."""
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def current() -> Optional[StageTimer]:
+    return _current.get()
+
+
+def lap(name: str) -> None:
+    """Close stage ``name`` on the current request's timer, if any."""
+    timer = _current.get()
+    if timer is not None:
+        timer.lap(name)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the current request's timer, if any."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def record_collection(collection_name: str, ms: float) -> None:
+    timer = _current.get()
+    if timer is not None:
+        timer.collections[collection_name] = timer.collections.get(collection_name, 0.0) + ms
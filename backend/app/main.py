@@ -1,12 +1,24 @@
+import asyncio
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from app.core.config import settings
 from app.core.database import init_db
+from app.core.metrics import MetricsMiddleware, register_cache
+from app.services import clients, job_queue
+from app.services.catalog import catalog
+from app.services.answer_cache import answer_cache
+from app.services.query_analysis import title_cache_stats
+from app.services.retrieval import embedding_cache
+from app.services.s3_uploads import presign_cache_stats
 from app.routers import rag, documents, questions, demo_request, informed_consent
+from app.worker import Worker
 
 
 # ---------------------------------------------------------------------------
@@ -32,9 +44,23 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create question_logs table on startup (no-op if it already exists)
+    # Create question_logs / ingestion_jobs tables on startup (no-op if they exist)
     init_db()
+    # Create the shared API clients and open their first connections
+    await clients.warm()
+    # Load the Qdrant collection catalog so the first queries don't pay for it
+    await run_in_threadpool(catalog.warm)
+    await run_in_threadpool(rag.routing.warm)
+    # Documents ingested by worker processes invalidate the catalog and answer cache
+    watch = asyncio.create_task(job_queue.watch_completions(catalog.mark_changed))
+    worker = None
+    if settings.ingest_inline_workers > 0:
+        worker = Worker(settings.ingest_inline_workers)
+        worker.start()
     yield
+    watch.cancel()
+    if worker is not None:
+        await run_in_threadpool(worker.drain, settings.ingest_drain_seconds)
 
 app = FastAPI(
     title="Clinical RAG API",
@@ -45,6 +71,7 @@ app = FastAPI(
 
 # Security headers applied first (outermost middleware runs last, so add first)
 app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -64,6 +91,16 @@ app.add_middleware(
 async def healthz():
     return {"status": "ok"}
 
+register_cache("embeddings", embedding_cache.stats)
+register_cache("answers", answer_cache.stats)
+register_cache("signed_urls", presign_cache_stats)
+register_cache("title_analysis", title_cache_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 app.include_router(documents.router, prefix="/documents", tags=["documents"])
 app.include_router(rag.router, prefix="/rag", tags=["rag"])
 app.include_router(questions.router, prefix="/rag/questions", tags=["questions"])
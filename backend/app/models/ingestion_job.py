@@ -0,0 +1,50 @@
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, Text, Integer, DateTime, Index
+from app.core.database import Base
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class IngestionJob(Base):
+    """One request to ingest a document, worked off by ``app.worker``.
+
+    Lifecycle: ``queued`` -> ``processing`` -> ``done`` | ``error``.  A failed
+    attempt goes back to ``queued`` with ``available_at`` pushed out until
+    ``max_attempts`` is reached.  A ``processing`` job whose lease expired
+    (worker crashed or was killed) can be claimed again.
+    """
+
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    created_at = Column(DateTime(timezone=True), default=_now, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=_now, onupdate=_now, nullable=False)
+
+    # What to ingest (arguments of ingestion.process_document)
+    document_id = Column(String, nullable=False, index=True)  # S3 key
+    source_type = Column(String, nullable=False, default="OTHER")
+    org_id = Column(String, nullable=False, default="demo")
+    collection_name = Column(String, nullable=False)
+
+    # Scheduling
+    state = Column(String, nullable=False, default="queued")  # queued | processing | done | error
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime(timezone=True), default=_now, nullable=False)
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Outcome
+    chunks = Column(Integer, nullable=True)
+    vectors = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingestion_jobs_state_available", "state", "available_at"),
+        Index("ix_ingestion_jobs_finished_at", "finished_at"),
+    )
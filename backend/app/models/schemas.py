@@ -18,6 +18,7 @@ class Answer(BaseModel):
     latency_ms: int
     follow_up_question: Optional[str] = None
     clarifying_questions: Optional[List[str]] = None  # Shown BEFORE the answer for patient mode
+    cached: bool = False  # Served from the answer cache
 
 class QueryRequest(BaseModel):
     question: str
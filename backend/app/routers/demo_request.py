@@ -4,6 +4,7 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 
 from app.core.logging import logger
@@ -17,6 +18,14 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 
 
+def _send_email(recipients: list[str], msg: MIMEMultipart) -> None:
+    """Deliver ``msg`` over SMTP.  Blocking — call via ``run_in_threadpool``."""
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+        server.starttls()
+        server.login(SMTP_USER, SMTP_PASSWORD)
+        server.sendmail(SMTP_USER, recipients, msg.as_string())
+
+
 class DemoRequestBody(BaseModel):
     name: str
     email: EmailStr
@@ -60,10 +69,7 @@ async def submit_demo_request(body: DemoRequestBody):
         msg["Subject"] = subject
         msg.attach(MIMEText(text, "plain"))
 
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_USER, recipients, msg.as_string())
+        await run_in_threadpool(_send_email, recipients, msg)
 
         logger.info(f"Demo request email sent to {DEMO_RECIPIENT} for {body.email}")
         return {"status": "ok", "emailed": True}
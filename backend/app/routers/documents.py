@@ -1,38 +1,30 @@
 import re
 import os
+import asyncio
 import logging
 from typing import Optional, List
-from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
-import boto3
-from botocore.config import Config as BotoConfig
-from qdrant_client import QdrantClient
+from sqlalchemy.orm import Session
 from qdrant_client.http import models as qmodels
-from app.services.s3_uploads import presign_post, new_object_key
+from app.core.database import get_db
+from app.services import clients, job_queue
+from app.services.s3_uploads import presign_post, presign_get_cached, new_object_key
 from app.services.ingestion import (
-    process_document,
-    STATUS,
     _filename_to_title,
     _extract_metadata,
     _extract_docx_metadata,
+    retag_points,
 )
 from app.core.config import settings
+from app.services.catalog import catalog, collection_names as qdrant_collection_names
 
 log = logging.getLogger("documents")
 router = APIRouter()
 
 
-def _get_s3_client():
-    return boto3.client("s3", region_name=settings.aws_region, config=BotoConfig(retries={"max_attempts": 3}))
-
-
-def _get_qdrant_client() -> QdrantClient:
-    kw = dict(url=settings.qdrant_url, timeout=90)
-    if settings.qdrant_api_key:
-        kw["api_key"] = settings.qdrant_api_key
-    return QdrantClient(**kw)
-
-
 def _is_uuid_filename(filename: str) -> bool:
     """Check if a filename looks like a UUID-based name (no meaningful title)."""
     if not filename:
@@ -68,15 +60,15 @@ async def upload_init(body: UploadInitRequest):
 
 @router.post("/upload")
 async def upload_file(
-    background: BackgroundTasks,
     file: UploadFile = File(...),
     org_id: str = Form("demo"),
     source_type: str = Form("OTHER"),
+    db: Session = Depends(get_db),
 ):
     """Direct file upload: receives the file, uploads to S3, and queues processing."""
     key = new_object_key(org_id, file.filename or "document.pdf")
     content_type = file.content_type or "application/octet-stream"
-    s3_client = _get_s3_client()
+    s3_client = clients.s3()
     s3_client.upload_fileobj(
         file.file,
         settings.s3_bucket,
@@ -86,16 +78,14 @@ async def upload_file(
             "Metadata": {"original-filename": file.filename or "unknown"},
         },
     )
-    STATUS[key] = {"state": "queued"}
-    background.add_task(process_document, key, source_type, org_id)
-    return {"document_id": key, "status": "queued"}
+    job = await run_in_threadpool(job_queue.enqueue, db, key, source_type, org_id)
+    return {"document_id": key, "status": "queued", "job_id": job.id}
 
 
 @router.post("/{document_id:path}/publish")
-def publish(document_id: str, background: BackgroundTasks, source_type: str = "OTHER", org_id: str = "demo"):
-    STATUS[document_id] = {"state": "queued"}
-    background.add_task(process_document, document_id, source_type, org_id)
-    return {"status": "queued", "document_id": document_id}
+def publish(document_id: str, source_type: str = "OTHER", org_id: str = "demo", db: Session = Depends(get_db)):
+    job = job_queue.enqueue(db, document_id, source_type, org_id)
+    return {"status": "queued", "document_id": document_id, "job_id": job.id}
 
 class IngestNowRequest(BaseModel):
     key: str
@@ -103,18 +93,82 @@ class IngestNowRequest(BaseModel):
     org_id: str = "demo"
 
 @router.post("/ingest_now")
-def ingest_now_json(body: IngestNowRequest):
-    STATUS[body.key] = {"state": "processing"}
-    process_document(body.key, body.source_type, body.org_id)
-    return STATUS[body.key]
+def ingest_now_json(body: IngestNowRequest, db: Session = Depends(get_db)):
+    """Ingest synchronously in the API process (no retries), recorded as a job."""
+    return job_queue.status(job_queue.run_now(db, body.key, body.source_type, body.org_id))
 
 @router.get("/{document_id:path}/status")
-def status(document_id: str):
-    return STATUS.get(document_id, {"state": "unknown"})
+def status(document_id: str, db: Session = Depends(get_db)):
+    return job_queue.status(job_queue.latest(db, document_id))
+
+# Keys confirmed to belong to an ingested document, with the catalog version
+# they were confirmed at; re-checked once collections change
+_known_documents: dict = {}
+_KNOWN_DOCUMENTS_MAX = 10000
+
+
+async def _is_known_document(document_id: str) -> bool:
+    """Whether any collection holds chunks of ``document_id``.
+
+    Raises if no collection could be checked and none matched.
+    """
+    version = catalog.version
+    if _known_documents.get(document_id) == version:
+        return True
+    flt = qmodels.Filter(must=[
+        qmodels.FieldCondition(key="document_id", match=qmodels.MatchValue(value=document_id)),
+    ])
+    cli = clients.async_qdrant()
+
+    async def _has_chunks(name: str) -> bool:
+        points, _ = await cli.scroll(name, scroll_filter=flt, limit=1, with_payload=False, with_vectors=False)
+        return bool(points)
+
+    names = catalog.names()
+    results = await asyncio.gather(*(_has_chunks(n) for n in names), return_exceptions=True)
+    if any(r is True for r in results):
+        if len(_known_documents) >= _KNOWN_DOCUMENTS_MAX:
+            _known_documents.clear()
+        _known_documents[document_id] = version
+        return True
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors and len(errors) == len(names):
+        raise errors[0]
+    return False
+
+
+@router.get("/{document_id:path}/view")
+async def view_document(document_id: str):
+    """Redirect to a short-lived presigned S3 URL for an uploaded document.
+
+    Citation links point here instead of embedding a presigned URL, so
+    answers stay stable (and cacheable) and signing only happens when a
+    document is actually opened.  Only keys of ingested documents (present
+    in some collection's payloads) are signed.
+    """
+    if not document_id.startswith("uploads/") or ".." in document_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        known = await _is_known_document(document_id)
+    except Exception as e:
+        log.warning(f"Failed to look up {document_id}: {e}")
+        raise HTTPException(status_code=503, detail="Could not verify document")
+    if not known:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        url = await run_in_threadpool(presign_get_cached, document_id)
+    except Exception as e:
+        log.warning(f"Failed to presign {document_id}: {e}")
+        raise HTTPException(status_code=502, detail="Could not generate document link")
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
 
 @router.get("/debug/statuses")
-def all_statuses():
-    return STATUS
+def all_statuses(db: Session = Depends(get_db)):
+    """Most recently updated ingestion jobs, newest first, by document."""
+    statuses = {}
+    for job in job_queue.recent(db):
+        statuses.setdefault(job.document_id, job_queue.status(job))
+    return statuses
 
 
 class MigrateTitlesResponse(BaseModel):
@@ -140,8 +194,8 @@ async def migrate_document_titles(dry_run: bool = True):
     Args:
         dry_run: If True (default), only report what would be changed without making changes.
     """
-    qdrant = _get_qdrant_client()
-    s3 = _get_s3_client()
+    qdrant = clients.qdrant()
+    s3 = clients.s3()
 
     collections_processed = 0
     documents_updated = 0
@@ -150,8 +204,7 @@ async def migrate_document_titles(dry_run: bool = True):
 
     try:
         # Get all collections
-        collections = qdrant.get_collections().collections
-        collection_names = [col.name for col in collections]
+        collection_names = qdrant_collection_names(qdrant)
 
         for collection_name in collection_names:
             collections_processed += 1
@@ -225,6 +278,8 @@ async def migrate_document_titles(dry_run: bool = True):
                                 payload={"title": new_title, "original_filename": original_filename},
                                 points=point_ids,
                             )
+                            retag_points(qdrant, collection_name, point_ids)
+                            catalog.mark_changed(collection_name)
 
                         documents_updated += 1
                     else:
@@ -254,7 +309,7 @@ async def list_collection_documents(collection_name: str, limit: int = 50):
     List unique documents in a collection with their titles.
     Useful for debugging/inspecting document titles.
     """
-    qdrant = _get_qdrant_client()
+    qdrant = clients.qdrant()
 
     try:
         documents = {}
@@ -313,7 +368,7 @@ async def update_document_title(body: UpdateTitleRequest):
     Manually update a document's title in Qdrant.
     This updates all chunks belonging to the document.
     """
-    qdrant = _get_qdrant_client()
+    qdrant = clients.qdrant()
 
     try:
         # Find all points with this document_id by scrolling (no filter to avoid index requirement)
@@ -350,6 +405,8 @@ async def update_document_title(body: UpdateTitleRequest):
             payload={"title": body.new_title},
             points=point_ids,
         )
+        retag_points(qdrant, body.collection_name, point_ids)
+        catalog.mark_changed(body.collection_name)
 
         return {
             "status": "success",
@@ -393,8 +450,8 @@ async def migrate_reextract_titles(
     """
     import tempfile
 
-    qdrant = _get_qdrant_client()
-    s3 = _get_s3_client()
+    qdrant = clients.qdrant()
+    s3 = clients.s3()
 
     collections_processed = 0
     documents_processed = 0
@@ -408,8 +465,7 @@ async def migrate_reextract_titles(
         if collection_name:
             collection_names = [collection_name]
         else:
-            collections = qdrant.get_collections().collections
-            collection_names = [col.name for col in collections]
+            collection_names = qdrant_collection_names(qdrant)
 
         for coll_name in collection_names:
             collections_processed += 1
@@ -514,6 +570,8 @@ async def migrate_reextract_titles(
                                     payload=update_payload,
                                     points=point_ids,
                                 )
+                                retag_points(qdrant, coll_name, point_ids)
+                                catalog.mark_changed(coll_name)
 
                             documents_updated += 1
 
@@ -25,11 +25,12 @@ from email.mime.text import MIMEText
 from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 from app.core.config import settings
 from app.core.logging import logger
-from app.services import retrieval
+from app.services import clients
 
 router = APIRouter()
 
@@ -399,7 +400,7 @@ def _strip_consent_status(text: str) -> str:
     return re.sub(r"\n*CONSENT_STATUS:.*$", "", text, flags=re.MULTILINE).strip()
 
 
-def _generate_summary(session: dict) -> str:
+async def _generate_summary(session: dict) -> str:
     """Use Claude to generate a formal summary of the consent conversation."""
     physician_name = session["physician_name"]
     patient_name = session["patient_name"]
@@ -437,8 +438,8 @@ Generate a summary with the following sections:
 Keep it concise, professional, and factual. This is a medical-legal document."""
 
     try:
-        ac = retrieval.anthropic_client()
-        response = ac.messages.create(
+        ac = clients.async_anthropic()
+        response = await ac.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=2048,
             temperature=0,
@@ -624,8 +625,8 @@ async def start_consent_session(body: StartSessionRequest):
     )
 
     try:
-        ac = retrieval.anthropic_client()
-        response = ac.messages.create(
+        ac = clients.async_anthropic()
+        response = await ac.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=1024,
             temperature=0.3,
@@ -700,8 +701,8 @@ async def consent_chat(body: ChatRequest):
     messages = _build_messages(session)
 
     try:
-        ac = retrieval.anthropic_client()
-        response = ac.messages.create(
+        ac = clients.async_anthropic()
+        response = await ac.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=1500,
             temperature=0.3,
@@ -770,11 +771,12 @@ async def complete_consent_session(body: CompleteSessionRequest):
     session["completed_at"] = now
 
     # Generate formal summary
-    summary = _generate_summary(session)
+    summary = await _generate_summary(session)
     session["summary"] = summary
 
-    # Email the transcript and summary to the physician
-    emailed = _send_consent_email(session, summary)
+    # Email the transcript and summary to the physician (smtplib blocks, so
+    # keep it off the event loop)
+    emailed = await run_in_threadpool(_send_consent_email, session, summary)
 
     logger.info(
         "consent_session_completed",
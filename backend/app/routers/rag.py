@@ -1,13 +1,30 @@
+import json
 import re
 import time
-from fastapi import APIRouter, Depends, HTTPException
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.models.schemas import QueryRequest, Answer, Citation, DoctorProfile
 from app.core.logging import logger
 from app.core.config import settings
-from app.core.database import get_db
-from app.services import retrieval, question_tracker
-from app.services.s3_uploads import presign_get
+from app.core import metrics, timing
+from app.core.database import SessionLocal, get_db
+from app.services import clients, retrieval, question_tracker
+from app.services.answer_cache import CachedAnswer, answer_cache
+from app.services.catalog import catalog
+from app.services.context_builder import consolidate_hits, pack_context
+from app.services.query_analysis import (
+    QueryAnalysis,
+    analyze_query,
+    collection_body_part,
+    hit_tags,
+    procedure_exclusions,
+    search_must_not,
+)
 
 router = APIRouter()
 
@@ -15,7 +32,7 @@ router = APIRouter()
 async def check_specific_collection(collection_name: str):
     """Check if a specific collection exists and has points."""
     try:
-        c = retrieval.client()
+        c = clients.qdrant()
         col_info = c.get_collection(collection_name)
         
         # Try a test search
@@ -50,21 +67,16 @@ async def test_query_logic():
         doctor_slug = slugify(doctor_id)
         doctor_prefix = f"dr_{doctor_slug}_"
         
-        c = retrieval.client()
-        all_collections_response = c.get_collections()
-        all_collection_names = [col.name for col in all_collections_response.collections]
-        
-        matching_collections = [
-            name for name in all_collection_names 
-            if name.startswith(doctor_prefix)
-        ]
+        all_collection_names = catalog.names()
+        matching_collections = catalog.with_prefix(doctor_prefix)
         
         # Try searching
         search_results = []
         if matching_collections:
+            query_vector = retrieval.embed("UCL repair precautions")
             for col_name in matching_collections:
                 try:
-                    hits = retrieval.search("UCL repair precautions", top_k=3, collection_name=col_name)
+                    hits = retrieval.search(top_k=3, collection_name=col_name, vector=query_vector)
                     search_results.append({
                         "collection": col_name,
                         "hits": len(hits),
@@ -96,24 +108,26 @@ async def debug_environment():
     }
 
 @router.get("/debug/collections")
-async def list_collections():
-    """List all Qdrant collections."""
+async def list_collections(refresh: bool = False):
+    """List all Qdrant collections from the cached catalog.
+
+    Pass ``refresh=true`` to reload the catalog from Qdrant first.
+    """
     try:
-        c = retrieval.client()
-        collections = c.get_collections().collections
-        
+        if refresh:
+            await run_in_threadpool(catalog.refresh)
         result = []
-        for col in collections:
-            try:
-                col_info = c.get_collection(col.name)
-                result.append({
-                    "name": col.name,
-                    "points_count": col_info.points_count
-                })
-            except Exception as e:
-                result.append({"name": col.name, "error": str(e)})
-        
-        return {"total": len(collections), "collections": result}
+        for name in catalog.names():
+            info = catalog.get(name)
+            result.append({
+                "name": name,
+                "points_count": info.points_count,
+                "vector_size": info.vector_size,
+                "distance": info.distance,
+                "generation": catalog.generation(name),
+            })
+
+        return {"total": len(result), "catalog_version": catalog.version, "collections": result}
     except Exception as e:
         return {"error": str(e)}
 
@@ -121,9 +135,6 @@ async def list_collections():
 async def debug_doctor_collections(doctor_id: str):
     """Show exactly which collections would be searched for a given doctor."""
     try:
-        c = retrieval.client()
-        all_collections = c.get_collections().collections
-
         doctors_to_search = [doctor_id]
         if doctor_id in SHARED_COLLECTIONS:
             doctors_to_search.extend(SHARED_COLLECTIONS[doctor_id])
@@ -134,23 +145,21 @@ async def debug_doctor_collections(doctor_id: str):
         for doc_id in doctors_to_search:
             doc_slug = slugify(doc_id)
             prefix = f"dr_{doc_slug}_"
-            for col in all_collections:
-                if col.name.startswith(prefix):
-                    col_info = c.get_collection(col.name)
-                    entry = {"name": col.name, "points_count": col_info.points_count}
-                    if doc_id == doctor_id:
-                        own_collections.append(entry)
-                    else:
-                        shared_collections.append(entry)
+            for col_name in catalog.with_prefix(prefix):
+                entry = {"name": col_name, "points_count": catalog.get(col_name).points_count}
+                if doc_id == doctor_id:
+                    own_collections.append(entry)
+                else:
+                    shared_collections.append(entry)
 
         # Permission-based collections
         permission_collections = []
         for col_name, allowed in COLLECTION_PERMISSIONS.items():
             if doctor_id in allowed:
-                try:
-                    col_info = c.get_collection(col_name)
+                col_info = catalog.get(col_name)
+                if col_info is not None:
                     permission_collections.append({"name": col_name, "points_count": col_info.points_count})
-                except Exception:
+                else:
                     permission_collections.append({"name": col_name, "points_count": 0, "note": "collection not found"})
 
         return {
@@ -163,6 +172,22 @@ async def debug_doctor_collections(doctor_id: str):
     except Exception as e:
         return {"error": str(e)}
 
+@router.get("/debug/caches")
+async def debug_caches():
+    """Hit/miss counters and sizes for the in-process caches."""
+    return {
+        "embeddings": retrieval.embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+    }
+
+@router.get("/debug/routing")
+async def debug_routing_index():
+    """Show the precomputed doctor / body-part collection routing tables."""
+    try:
+        return routing.describe()
+    except Exception as e:
+        return {"error": str(e)}
+
 # Sample doctor profiles (in production, this would be a database)
 DOCTORS = {
     "joshua_dines": {
@@ -1421,6 +1446,120 @@ def slugify(text):
     return text.lower().replace(" ", "_").replace(".", "")
 
 
+# ---------------------------------------------------------------------------
+# Collection routing index
+# ---------------------------------------------------------------------------
+# Which collections a doctor or body part searches only changes when the
+# tables above or the Qdrant catalog change, so the answer is precomputed
+# per doctor_id / body_part and rebuilt whenever the catalog version moves.
+# Each route is tiered: the surgeon's own protocols, then preferred
+# literature, then supplementary evidence.
+# ---------------------------------------------------------------------------
+
+@dataclass
+class CollectionRoute:
+    own: list[str] = field(default_factory=list)
+    preferred: list[str] = field(default_factory=list)
+    supplementary: list[str] = field(default_factory=list)
+
+    @property
+    def collections(self) -> list[str]:
+        return self.own + self.preferred + self.supplementary
+
+    def tier(self, collection_name: str) -> str:
+        if collection_name in self.own:
+            return "own"
+        if collection_name in self.preferred:
+            return "preferred"
+        return "supplementary"
+
+    def is_own(self, hit) -> bool:
+        """Whether ``hit`` was retrieved from one of the surgeon's own collections."""
+        return self.tier((hit.payload or {}).get("_source_collection", "")) == "own"
+
+
+def _build_doctor_route(doctor_id: str) -> CollectionRoute:
+    # Own + shared doctors' prefixed collections, then explicit permissions.
+    searched = []
+    for doc_id in [doctor_id] + SHARED_COLLECTIONS.get(doctor_id, []):
+        searched.extend(catalog.with_prefix(f"dr_{slugify(doc_id)}_"))
+    searched.extend(
+        col_name for col_name, allowed in COLLECTION_PERMISSIONS.items()
+        if doctor_id in allowed
+    )
+    searched = list(dict.fromkeys(searched))
+
+    own_prefix = f"dr_{slugify(doctor_id)}_"
+    preferred_names = set(PREFERRED_COLLECTIONS.get(doctor_id, []))
+    route = CollectionRoute()
+    for col_name in searched:
+        if col_name.startswith(own_prefix):
+            route.own.append(col_name)
+        elif col_name in preferred_names:
+            route.preferred.append(col_name)
+        else:
+            route.supplementary.append(col_name)
+    return route
+
+
+def _build_body_part_route(body_part_slug: str) -> CollectionRoute:
+    # General collections (RCTs, guidelines) whose name matches the body part.
+    matches = BODY_PART_COLLECTION_KEYWORDS.get(body_part_slug, [body_part_slug])
+    return CollectionRoute(supplementary=[
+        col_name for col_name in catalog.names()
+        if col_name.startswith("dr_general_") and any(m in col_name for m in matches)
+    ])
+
+
+class RoutingIndex:
+    def __init__(self):
+        self.version = None
+        self._doctors: dict[str, CollectionRoute] = {}
+        self._body_parts: dict[str, CollectionRoute] = {}
+
+    def rebuild(self) -> None:
+        version = catalog.version
+        doctors = {doctor_id: _build_doctor_route(doctor_id) for doctor_id in DOCTORS}
+        body_parts = {slug: _build_body_part_route(slug) for slug in BODY_PART_COLLECTION_KEYWORDS}
+        self._doctors, self._body_parts, self.version = doctors, body_parts, version
+        logger.info("routing_index_built", catalog_version=version, doctors=len(doctors), body_parts=len(body_parts))
+
+    def warm(self) -> None:
+        """Build the index at startup.  Non-fatal if the catalog is unavailable."""
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.warning("routing_index_warm_failed", error=str(e))
+
+    def _ensure_current(self) -> None:
+        if self.version is None or self.version != catalog.version:
+            self.rebuild()
+
+    def for_doctor(self, doctor_id: str) -> CollectionRoute:
+        self._ensure_current()
+        route = self._doctors.get(doctor_id)
+        # Unknown doctors are routed on the fly rather than cached, so
+        # arbitrary ids from requests cannot grow the index.
+        return route if route is not None else _build_doctor_route(doctor_id)
+
+    def for_body_part(self, body_part: str) -> CollectionRoute:
+        self._ensure_current()
+        slug = slugify(body_part)
+        route = self._body_parts.get(slug)
+        return route if route is not None else _build_body_part_route(slug)
+
+    def describe(self) -> dict:
+        self._ensure_current()
+        return {
+            "catalog_version": self.version,
+            "doctors": {k: asdict(v) for k, v in self._doctors.items()},
+            "body_parts": {k: asdict(v) for k, v in self._body_parts.items()},
+        }
+
+
+routing = RoutingIndex()
+
+
 # ---------------------------------------------------------------------------
 # Query-aware collection filtering
 # ---------------------------------------------------------------------------
@@ -1432,92 +1571,8 @@ def slugify(text):
 # arthroscopy paper is not cited when the question is about ACL.
 # ---------------------------------------------------------------------------
 
-# Keywords in the user question that signal a specific body-part focus.
-_QUERY_BODY_PART_KEYWORDS: dict[str, list[str]] = {
-    "knee": [
-        "acl", "anterior cruciate", "meniscus", "meniscal", "knee",
-        "pcl", "posterior cruciate", "patella", "patellar", "hamstring graft",
-        "quadriceps tendon graft", "multiligament knee",
-    ],
-    "hip": [
-        "hip", "fai", "femoroacetabular", "acetabul", "femoral head",
-        "hip arthroscopy", "hip labr", "gluteal tendon", "sports hernia",
-        "athletic pubalgia",
-    ],
-    "shoulder": [
-        "shoulder", "rotator cuff", "bankart", "slap repair", "slap tear",
-        "supraspinatus", "infraspinatus", "subscapularis", "ac joint",
-        "acromioclavicular", "superior capsul",
-    ],
-    "elbow": [
-        "ucl", "ulnar collateral", "tommy john", "elbow", "epicondyl",
-        "olecranon",
-    ],
-    "spine": [
-        "spine", "spinal", "lumbar", "cervical", "thoracic",
-        "disc herniat", "stenosis", "spondyl", "vertebr",
-        "laminectomy", "laminoplasty", "discectomy",
-    ],
-    "foot_ankle": ["foot", "ankle", "achilles", "plantar"],
-    "hand_wrist": ["hand", "wrist", "carpal", "finger"],
-}
-
-# Substrings in collection names that indicate which body part the
-# collection belongs to.
-_COLLECTION_BODY_PART_MAP: dict[str, str] = {
-    "acl": "knee",
-    "meniscus": "knee",
-    "knee": "knee",
-    "lower_leg": "knee",
-    "aaos_knee": "knee",
-    "hip": "hip",
-    "thigh": "hip",
-    "fai": "hip",
-    "shoulder": "shoulder",
-    "rotator_cuff": "shoulder",
-    "shoulder_replacement": "shoulder",
-    "ucl": "elbow",
-    "elbow": "elbow",
-    "back": "spine",
-    "neck": "spine",
-    "foot": "foot_ankle",
-    "ankle": "foot_ankle",
-    "hand": "hand_wrist",
-    "wrist": "hand_wrist",
-}
-
-
-def _detect_query_body_parts(question: str) -> set[str]:
-    """Return the set of body-part tags the *question* is about.
-
-    Returns an empty set when no specific body part can be determined,
-    meaning all collections should be searched.
-    """
-    q_lower = question.lower()
-    detected: set[str] = set()
-    for body_part, keywords in _QUERY_BODY_PART_KEYWORDS.items():
-        for kw in keywords:
-            if kw in q_lower:
-                detected.add(body_part)
-                break
-    return detected
-
-
-def _get_collection_body_part(collection_name: str) -> str | None:
-    """Determine which body part a collection covers based on its name.
-
-    Returns ``None`` when the body part cannot be inferred (e.g.
-    ``dr_joshua_dines_clinic_protocols``), in which case the collection
-    should never be filtered out.
-    """
-    for keyword, body_part in _COLLECTION_BODY_PART_MAP.items():
-        if keyword in collection_name:
-            return body_part
-    return None
-
-
 def _filter_collections_by_relevance(
-    collections: list[str], question: str
+    collections: list[str], analysis: QueryAnalysis
 ) -> list[str]:
     """Keep only collections relevant to the question's body-part focus.
 
@@ -1528,20 +1583,20 @@ def _filter_collections_by_relevance(
     * If filtering would remove *every* collection, the original list is
       returned as a safety fallback.
     """
-    detected = _detect_query_body_parts(question)
+    detected = analysis.body_parts
     if not detected:
         return collections
 
     filtered = [
         col for col in collections
-        if _get_collection_body_part(col) is None
-        or _get_collection_body_part(col) in detected
+        if collection_body_part(col) is None
+        or collection_body_part(col) in detected
     ]
     return filtered if filtered else collections
 
 
 def _filter_hits_by_body_part_relevance(
-    hits: list, question: str
+    hits: list, analysis: QueryAnalysis
 ) -> list:
     """Remove individual hits whose *document title* indicates a different body part.
 
@@ -1553,7 +1608,7 @@ def _filter_hits_by_body_part_relevance(
     * Hits whose title has no detectable body part are always kept.
     * If filtering would remove every hit, the original list is returned.
     """
-    query_parts = _detect_query_body_parts(question)
+    query_parts = analysis.body_parts
     if not query_parts:
         return hits
 
@@ -1561,13 +1616,7 @@ def _filter_hits_by_body_part_relevance(
     removed_titles: list[str] = []
     for h in hits:
         title = (h.payload or {}).get("title", "")
-        title_lower = title.lower()
-        title_parts: set[str] = set()
-        for body_part, keywords in _QUERY_BODY_PART_KEYWORDS.items():
-            for kw in keywords:
-                if kw in title_lower:
-                    title_parts.add(body_part)
-                    break
+        title_parts = hit_tags(h.payload or {}).body_parts
 
         if not title_parts or title_parts & query_parts:
             # Title has no detectable body part, or overlaps with the question's
@@ -1605,96 +1654,15 @@ def _filter_hits_by_body_part_relevance(
 # never see clearly wrong sources in the first place.
 # ---------------------------------------------------------------------------
 
-# Keywords that signal a hit is about a specific procedure.
-# Checked against the lowercased title; if the title yields no signal,
-# the first 500 chars of chunk text are checked as a fallback.
-_PROCEDURE_INDICATORS: dict[str, list[str]] = {
-    "acl": ["acl", "anterior cruciate", "aclr", "acl-r"],
-    "meniscus_root": [
-        "meniscus root", "meniscal root", "root repair", "root tear",
-    ],
-    "meniscus": ["meniscus", "meniscal", "meniscectomy"],
-    "rotator_cuff": [
-        "rotator cuff", "supraspinatus repair", "cuff repair",
-    ],
-    "shoulder_replacement": [
-        "shoulder replacement", "shoulder arthroplasty",
-        "reverse total shoulder", "anatomic total shoulder",
-        "reverse shoulder", "total shoulder",
-    ],
-    "ucl": ["ucl", "ulnar collateral", "tommy john"],
-    "hip_arthroscopy": [
-        "hip arthroscopy", "hip scope", "fai",
-        "femoroacetabular", "hip labr",
-    ],
-    "total_hip": ["total hip", "hip replacement", "hip arthroplasty"],
-    "total_knee": ["total knee", "knee replacement", "knee arthroplasty"],
-}
-
-# Title substrings that indicate a generic / non-procedure-specific document.
-# When procedure-specific hits are available, generic hits are removed so the
-# LLM does not cite them.
-_GENERIC_DOC_PATTERNS: list[str] = [
-    "surgical booklet", "surgery booklet",
-    "operative booklet",
-    "operative guide", "operation guide",
-    "patient handbook", "clinical handbook",
-    "surgical handbook",
-    "general guide", "general instructions",
-    "general surgical", "general information",
-    "pre-operative packet", "pre op packet",
-    "surgical packet", "surgery packet",
-]
-
-
-def _detect_hit_procedures(title: str, text: str) -> set[str]:
-    """Identify which procedure(s) a hit is about from title and text.
-
-    Title is checked first.  Only when the title yields zero procedure
-    signals do we fall back to the first 500 characters of chunk text.
-    This prevents incidental keyword mentions in the body from overriding
-    a clear, procedure-specific title.
-    """
-    t = title.lower()
-    procs: set[str] = set()
-    for proc_key, keywords in _PROCEDURE_INDICATORS.items():
-        if any(kw in t for kw in keywords):
-            procs.add(proc_key)
-
-    # Fallback: title was generic / uninformative — inspect chunk text.
-    if not procs and text:
-        snippet = text[:500].lower()
-        for proc_key, keywords in _PROCEDURE_INDICATORS.items():
-            if any(kw in snippet for kw in keywords):
-                procs.add(proc_key)
-
-    return procs
-
-
-def _detect_query_procedures(question: str) -> set[str]:
-    """Identify which procedure(s) the user is asking about."""
-    q = question.lower()
-    procs: set[str] = set()
-    for proc_key, keywords in _PROCEDURE_INDICATORS.items():
-        if any(kw in q for kw in keywords):
-            procs.add(proc_key)
-    return procs
-
-
-def _is_generic_document(title: str) -> bool:
-    """Return ``True`` if the title looks like a generic booklet / guide."""
-    t = title.lower()
-    return any(pat in t for pat in _GENERIC_DOC_PATTERNS)
-
-
 def _filter_hits_by_procedure_relevance(
-    hits: list, question: str
+    hits: list, analysis: QueryAnalysis
 ) -> list:
     """Remove hits about a different procedure within the same body part.
 
     Uses keyword *presence* in both title and text (not just exact title
-    phrases) to classify what procedure each hit is about, then filters
-    based on the query's procedure focus.
+    phrases) to classify what procedure each hit is about — normally the
+    tags stored in the payload at ingestion — then filters based on the
+    query's procedure focus.
 
     Also removes generic booklet / guide hits when procedure-specific hits
     are available.
@@ -1702,9 +1670,10 @@ def _filter_hits_by_procedure_relevance(
     * If no procedure is detected in the query, all hits are returned.
     * If filtering would remove every hit, the original list is returned.
     """
-    query_procs = _detect_query_procedures(question)
+    query_procs = analysis.procedures
     if not query_procs:
         return hits
+    exclusions = procedure_exclusions(query_procs)
 
     filtered: list = []
     removed_titles: list[str] = []
@@ -1712,58 +1681,9 @@ def _filter_hits_by_procedure_relevance(
     for h in hits:
         p = h.payload or {}
         title = p.get("title", "")
-        text = p.get("text", "")
-        hit_procs = _detect_hit_procedures(title, text)
-
-        should_exclude = False
-
-        # --- Meniscus (any kind) without ACL → exclude ACL-primary hits ---
-        # "Meniscus root repair" and "meniscus repair" are distinct from
-        # "ACL reconstruction with meniscal repair".  If the user did not
-        # mention ACL, any hit that is (even partly) about ACL is excluded.
-        if (
-            ("meniscus" in query_procs or "meniscus_root" in query_procs)
-            and "acl" not in query_procs
-        ):
-            if "acl" in hit_procs:
-                should_exclude = True
-
-        # --- ACL without meniscus → exclude standalone meniscus hits ---
-        # Combined ACL + meniscus docs are kept (concomitant work is common).
-        if (
-            "acl" in query_procs
-            and "meniscus" not in query_procs
-            and "meniscus_root" not in query_procs
-        ):
-            if (
-                ("meniscus_root" in hit_procs or "meniscus" in hit_procs)
-                and "acl" not in hit_procs
-            ):
-                should_exclude = True
-
-        # --- Rotator cuff ↔ shoulder replacement ---
-        if "rotator_cuff" in query_procs and "shoulder_replacement" not in query_procs:
-            if "shoulder_replacement" in hit_procs and "rotator_cuff" not in hit_procs:
-                should_exclude = True
-        if "shoulder_replacement" in query_procs and "rotator_cuff" not in query_procs:
-            if "rotator_cuff" in hit_procs and "shoulder_replacement" not in hit_procs:
-                should_exclude = True
-
-        # --- Hip arthroscopy ↔ total hip replacement ---
-        if "hip_arthroscopy" in query_procs and "total_hip" not in query_procs:
-            if "total_hip" in hit_procs and "hip_arthroscopy" not in hit_procs:
-                should_exclude = True
-        if "total_hip" in query_procs and "hip_arthroscopy" not in query_procs:
-            if "hip_arthroscopy" in hit_procs and "total_hip" not in hit_procs:
-                should_exclude = True
-
-        # --- Total knee ↔ ACL/meniscus ---
-        if "total_knee" in query_procs:
-            if ("acl" in hit_procs or "meniscus_root" in hit_procs) and "total_knee" not in hit_procs:
-                should_exclude = True
-        if ("acl" in query_procs or "meniscus" in query_procs) and "total_knee" not in query_procs:
-            if "total_knee" in hit_procs and not (hit_procs & query_procs):
-                should_exclude = True
+        hit_procs = hit_tags(p).procedures
+
+        should_exclude = any(rule.excludes(hit_procs) for rule in exclusions)
 
         if should_exclude:
             removed_titles.append(title)
@@ -1782,14 +1702,8 @@ def _filter_hits_by_procedure_relevance(
     # If we have procedure-specific hits, remove generic ones so the LLM
     # cannot cite an irrelevant "Surgical Booklet" when real protocols exist.
     if filtered:
-        specific = [
-            h for h in filtered
-            if not _is_generic_document((h.payload or {}).get("title", ""))
-        ]
-        generic = [
-            h for h in filtered
-            if _is_generic_document((h.payload or {}).get("title", ""))
-        ]
+        specific = [h for h in filtered if not hit_tags(h.payload or {}).generic]
+        generic = [h for h in filtered if hit_tags(h.payload or {}).generic]
         if specific and generic:
             logger.info(
                 "generic_doc_demotion",
@@ -1810,293 +1724,21 @@ def _filter_hits_by_procedure_relevance(
 # giving a generic answer and then asking the patient to refine it.
 # ---------------------------------------------------------------------------
 
-_PROCEDURE_CLARIFICATIONS: list[dict] = [
-    {
-        "keywords": ["acl", "anterior cruciate"],
-        # Detail keywords are grouped into categories.  The patient must
-        # provide information in at least ``categories_needed`` distinct
-        # categories before we skip clarification.  This prevents a
-        # descriptive procedure name (e.g. "ACL reconstruction with
-        # hamstring autograft") from satisfying the threshold when the
-        # patient still hasn't mentioned concomitant procedures or timeline.
-        "detail_categories": {
-            "graft_type": [
-                "graft", "autograft", "allograft", "hamstring", "patellar",
-                "quadriceps", "btb", "bone-patellar", "bone patellar",
-            ],
-            "revision_status": ["revision", "primary", "first time", "redo"],
-            "concomitant": ["meniscus", "meniscal", "cartilage", "chondral"],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,  # need ≥2 distinct categories to skip
-        "questions": [
-            "Did you have any other procedures done at the same time as your ACL reconstruction (for example, a meniscus repair or cartilage procedure)?",
-            "Do you know what type of graft was used (patellar tendon, hamstring, quadriceps tendon, or donor tissue)?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["meniscus", "meniscal"],
-        "detail_categories": {
-            "procedure_type": [
-                "repair", "meniscectomy", "removed", "stitched", "sutured",
-                "root", "transplant", "allograft",
-            ],
-            "concomitant": ["acl", "anterior cruciate", "ligament", "cartilage"],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "Was your meniscus repaired (stitched/sutured) or was a portion removed (partial meniscectomy)?",
-            "Were any other procedures done at the same time (for example, an ACL reconstruction or cartilage procedure)?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["rotator cuff"],
-        "detail_categories": {
-            "tear_type": ["partial", "full thickness", "complete", "massive"],
-            "revision_status": ["revision", "primary", "first time", "redo"],
-            "concomitant": [
-                "biceps", "tenodesis", "labr", "slap", "decompression",
-            ],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "Was your rotator cuff tear a partial tear or a full-thickness tear?",
-            "Were any other procedures done at the same time (for example, a biceps tenodesis, labral repair, or subacromial decompression)?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["ucl", "ulnar collateral", "tommy john"],
-        "detail_categories": {
-            "procedure_type": [
-                "graft", "autograft", "allograft", "palmaris", "gracilis",
-                "repair", "internal brace",
-            ],
-            "revision_status": ["revision", "primary", "first time", "redo"],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "Was this a UCL reconstruction (graft) or a UCL repair (with internal brace)?",
-            "Is this your first UCL surgery or a revision?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["hip arthroscopy", "hip scope"],
-        "detail_categories": {
-            "procedure_type": [
-                "labr", "labral", "labrum", "fai", "impingement",
-                "cam", "pincer", "cartilage", "microfracture",
-                "gluteal", "abductor",
-            ],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "What procedures were done during your hip arthroscopy (for example, labral repair, cam/pincer reshaping, cartilage work)?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["shoulder replacement", "shoulder arthroplasty",
-                      "reverse shoulder", "total shoulder"],
-        "detail_categories": {
-            "replacement_type": ["reverse", "total", "anatomic", "hemi"],
-            "revision_status": ["revision", "primary", "first time", "redo"],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "Was your shoulder replacement a reverse total shoulder or an anatomic total shoulder?",
-            "Is this your first shoulder replacement or a revision?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["knee replacement", "total knee", "tkr", "tka",
-                      "knee arthroplasty"],
-        "detail_categories": {
-            "replacement_type": ["total", "partial", "unicompartmental"],
-            "revision_status": ["revision", "primary", "first time", "redo"],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "Was your knee replacement a total knee replacement or a partial (unicompartmental) replacement?",
-            "Is this your first knee replacement or a revision?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-    {
-        "keywords": ["hip replacement", "total hip", "thr", "tha",
-                      "hip arthroplasty"],
-        "detail_categories": {
-            "approach_type": ["anterior", "posterior", "lateral", "approach"],
-            "revision_status": ["revision", "primary", "first time", "redo"],
-            "timeline": [
-                "weeks ago", "months ago", "days ago", "post-op", "postop",
-                "week post", "month post", "day post",
-            ],
-        },
-        "categories_needed": 2,
-        "questions": [
-            "What surgical approach was used (anterior, posterior, or lateral)?",
-            "Is this your first hip replacement or a revision?",
-            "How far along are you in your recovery — how many weeks or months since your surgery?",
-        ],
-    },
-]
-
-
-# Keywords that indicate the patient is asking about post-operative care,
-# recovery, or rehabilitation — contexts where surgical-detail clarifying
-# questions are helpful.
-_POSTOP_SIGNALS: list[str] = [
-    "after my surgery", "after surgery", "after the surgery",
-    "after my operation", "after the operation",
-    "post-op", "postop", "post op", "post operative", "postoperative",
-    "recovery", "recovering", "rehab", "rehabilitation",
-    "i had", "i've had", "i just had", "i recently had",
-    "i underwent", "i got",
-    "weeks ago", "months ago", "days ago",
-    "week post", "month post", "day post",
-    "weeks since", "months since", "days since",
-    "surgery was", "my surgery",
-    "when can i", "can i start", "am i allowed",
-    "return to sport", "return to work", "back to normal",
-    "weight bearing", "weight-bearing",
-    "physical therapy", "pt exercises",
-    "how long until", "how long before",
-    "swelling", "sling", "brace", "crutches", "immobilizer",
-    "follow up appointment", "follow-up appointment",
-    "stitches", "incision", "wound",
-    "pain after", "still hurts",
-]
-
-# Keywords that indicate the patient is asking about treatment options,
-# diagnosis, or condition management — contexts where post-op clarifying
-# questions are NOT relevant.
-_TREATMENT_INQUIRY_SIGNALS: list[str] = [
-    "how do you treat", "how would you treat", "how is it treated",
-    "how do you recommend", "what do you recommend",
-    "treatment option", "treatment for", "treat a", "treat my",
-    "what are my options", "what are the options",
-    "should i get surgery", "do i need surgery", "is surgery necessary",
-    "conservative", "non-surgical", "nonsurgical", "non surgical",
-    "what is a", "what is the", "what are",
-    "how is a", "how do you fix", "how do you repair",
-    "manage", "management of",
-    "diagnos", "torn", "tear", "tearing", "injury",
-    "what causes", "why does",
-    "can it heal", "will it heal", "heal on its own",
-    "injection", "cortisone", "prp", "platelet",
-    "therapy for", "exercises for",
-]
-
-
-def _is_postop_or_recovery_context(question: str) -> bool:
-    """Determine whether a patient question is about post-op/recovery.
-
-    Returns ``True`` when the question signals post-operative care,
-    recovery, or rehabilitation — i.e. the patient has already had (or
-    is about to have) surgery and wants protocol-specific guidance.
-
-    Returns ``False`` when the question is about treatment options,
-    diagnosis, or condition management — i.e. the patient is exploring
-    whether or how to treat a condition, making surgical-detail
-    clarifying questions irrelevant.
-    """
-    q_lower = question.lower()
-
-    has_postop = any(sig in q_lower for sig in _POSTOP_SIGNALS)
-    has_treatment = any(sig in q_lower for sig in _TREATMENT_INQUIRY_SIGNALS)
-
-    # If the question has clear treatment-inquiry language and no post-op
-    # language, it's a treatment question — don't ask surgical details.
-    if has_treatment and not has_postop:
-        return False
-
-    # If the question has post-op language, it's a recovery question.
-    if has_postop:
-        return True
-
-    # Ambiguous — default to not asking clarifying questions.  A generic
-    # mention of a procedure (e.g. "rotator cuff tear") without any
-    # post-op or treatment signal is more likely an informational query
-    # than a post-op one.
-    return False
-
-
-def _get_clarifying_questions(question: str, actor: str) -> list[str] | None:
+def _get_clarifying_questions(analysis: QueryAnalysis, actor: str) -> list[str] | None:
     """Return clarifying questions if the patient's query is too vague.
 
     Only triggers for PATIENT mode when a known surgical procedure is
     mentioned but key details are absent, AND the patient appears to be
     asking about post-operative care or recovery (not treatment options).
-    Returns ``None`` when no clarification is needed (e.g. provider,
-    treatment inquiry, or question already specific).
-
-    Detail matching is **category-based**: keywords are grouped into
-    categories (e.g. procedure_type, concomitant, timeline) and we count
-    how many *distinct categories* the patient has addressed.  This
-    prevents a descriptive procedure name like "meniscus root repair"
-    (which contains two keywords—"root" and "repair"—in the *same*
-    category) from incorrectly satisfying the threshold.
+    Treatment inquiries (e.g. "how do you recommend treating a rotator cuff
+    tear?") go straight to the answer.  Returns ``None`` when no
+    clarification is needed (e.g. provider, treatment inquiry, or question
+    already specific).  See ``QueryAnalysis.clarifying_questions`` and
+    ``PROCEDURE_CLARIFICATIONS`` for the category-based detail matching.
     """
     if actor != "PATIENT":
         return None
-
-    q_lower = question.lower()
-
-    # Only ask surgical-detail clarifying questions when the patient is
-    # in a post-op / recovery context.  Treatment inquiries (e.g. "how
-    # do you recommend treating a rotator cuff tear?") should go straight
-    # to the answer without asking about tear type, concomitant
-    # procedures, or recovery timeline.
-    if not _is_postop_or_recovery_context(question):
-        return None
-
-    for proc in _PROCEDURE_CLARIFICATIONS:
-        # Does the question mention this procedure?
-        if not any(kw in q_lower for kw in proc["keywords"]):
-            continue
-
-        # Count how many distinct detail categories are represented.
-        categories_satisfied = 0
-        for _cat_name, cat_keywords in proc["detail_categories"].items():
-            if any(dk in q_lower for dk in cat_keywords):
-                categories_satisfied += 1
-
-        if categories_satisfied < proc["categories_needed"]:
-            return proc["questions"]
-
-    return None
+    return analysis.clarifying_questions()
 
 
 @router.get("/doctors", response_model=list[DoctorProfile])
@@ -2121,9 +1763,6 @@ async def get_surgeon_specialties(doctor_id: str):
 
     # Dynamically build specialties from uploaded document collections
     try:
-        c = retrieval.client()
-        all_collections = c.get_collections().collections
-
         # Get list of doctors whose collections to search (including shared collections)
         doctors_to_search = [doctor_id]
         if doctor_id in SHARED_COLLECTIONS:
@@ -2134,11 +1773,7 @@ async def get_surgeon_specialties(doctor_id: str):
         for doc_id in doctors_to_search:
             doc_slug = slugify(doc_id)
             doctor_prefix = f"dr_{doc_slug}_"
-            collections = [
-                col.name for col in all_collections
-                if col.name.startswith(doctor_prefix)
-            ]
-            doctor_collections.extend(collections)
+            doctor_collections.extend(catalog.with_prefix(doctor_prefix))
 
         if not doctor_collections:
             return {"categories": []}
@@ -2248,63 +1883,28 @@ async def get_surgeon_specialties(doctor_id: str):
 async def list_doctors_with_documents():
     """Get all doctors with their associated document collections."""
     try:
-        c = retrieval.client()
-        all_collections = c.get_collections().collections
-        all_collection_names = [col.name for col in all_collections]
-
         doctors_with_docs = []
 
         for doctor_id, doctor_info in DOCTORS.items():
-            doc_slug = slugify(doctor_id)
-            doctor_prefix = f"dr_{doc_slug}_"
-
-            # Get doctor-specific collections
-            doctor_collections = [
-                name for name in all_collection_names
-                if name.startswith(doctor_prefix)
-            ]
-
-            # Get collections from COLLECTION_PERMISSIONS
-            permitted_collections = [
-                col_name for col_name, permitted_doctors in COLLECTION_PERMISSIONS.items()
-                if doctor_id in permitted_doctors
-            ]
-
-            # Get shared collections
-            shared_doctor_collections = []
-            if doctor_id in SHARED_COLLECTIONS:
-                for shared_doc_id in SHARED_COLLECTIONS[doctor_id]:
-                    shared_slug = slugify(shared_doc_id)
-                    shared_prefix = f"dr_{shared_slug}_"
-                    shared_collections = [
-                        name for name in all_collection_names
-                        if name.startswith(shared_prefix)
-                    ]
-                    shared_doctor_collections.extend(shared_collections)
-
-            # Combine all collections and remove duplicates
-            all_doctor_collections = list(set(
-                doctor_collections + permitted_collections + shared_doctor_collections
-            ))
-            all_doctor_collections.sort()
+            # Own, shared-doctor and permitted collections
+            all_doctor_collections = sorted(routing.for_doctor(doctor_id).collections)
 
             # Get collection info with point counts
             collection_details = []
             for col_name in all_doctor_collections:
-                try:
-                    col_info = c.get_collection(col_name)
+                col_info = catalog.get(col_name)
+                if col_info is not None:
                     collection_details.append({
                         "name": col_name,
                         "points_count": col_info.points_count,
                         "display_name": col_name.replace("dr_", "").replace("_", " ").title()
                     })
-                except Exception as e:
-                    logger.warning(f"Could not get info for collection {col_name}: {str(e)}")
+                else:
                     collection_details.append({
                         "name": col_name,
                         "points_count": 0,
                         "display_name": col_name.replace("dr_", "").replace("_", " ").title(),
-                        "error": str(e)
+                        "error": "collection not found"
                     })
 
             doctors_with_docs.append({
@@ -2325,16 +1925,62 @@ async def list_doctors_with_documents():
         logger.error("failed_to_list_doctors_with_documents", error=str(e))
         raise HTTPException(status_code=500, detail=f"Failed to retrieve doctors with documents: {str(e)}")
 
-@router.post("/query", response_model=Answer)
-async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
-    t0 = time.time()
+# ---------------------------------------------------------------------------
+# RAG query pipeline
+# ---------------------------------------------------------------------------
+# /rag/query and /rag/query/stream share every stage except the Claude call:
+#   _prepare_rag_query   guardrails, clarification, routing, answer cache,
+#                        retrieval, ranking, citations and prompts
+#   _claude_request      the messages.create / messages.stream arguments
+#   _finalize_answer     follow-up extraction and citation renumbering
+#   _complete_rag_query  answer cache store, logging and question tracking
+
+@dataclass
+class RagPlan:
+    """Retrieval result and prompts for one question, ready for Claude."""
+    question: str
+    doctor_name: Optional[str]
+    collections: List[str]
+    searchable: List[str]
+    cache_key: tuple
+    # Collection generations seen before searching; stored with the cached
+    # answer so a collection re-ingested mid-request invalidates it
+    generations: Dict[str, int] = field(default_factory=dict)
+    # Base of the citation document_urls; stripped before caching
+    link_base: str = ""
+    query_vector: Optional[List[float]] = None
+    complete: bool = True
+    hits: list = field(default_factory=list)
+    citations: List[Citation] = field(default_factory=list)
+    source_to_cite_idx: Dict[int, int] = field(default_factory=dict)
+    system_prompt: str = ""
+    user_prompt: str = ""
+    # Set instead of the prompts when nothing relevant was retrieved
+    fallback_answer: Optional[str] = None
+
+
+async def _prepare_rag_query(
+    body: QueryRequest, db: Session, t0: float, link_base: str
+) -> Union[Answer, RagPlan]:
+    """Run everything up to the Claude call.
+
+    ``link_base`` is the public API base URL used for citation links.
+
+    Returns a finished :class:`Answer` when no generation is needed
+    (clarifying questions, answer-cache hit), otherwise a :class:`RagPlan`.
+    Raises HTTPException for guardrail-blocked questions.
+    """
     q = body.question.strip()
+    # Keyword analysis shared by the guardrail, clarification, collection
+    # and hit filters, and prompt selection
+    analysis = analyze_query(q)
+    timing.lap("analysis")
 
     # Guardrails
-    ql = q.lower()
-    if any(x in ql for x in ["chest pain", "shortness of breath", "suicid", "overdose"]):
+    if analysis.emergency:
         # Log the blocked query before raising
-        question_tracker.log_question(
+        await run_in_threadpool(
+            question_tracker.log_question,
             db,
             actor=body.actor,
             question=q,
@@ -2355,7 +2001,7 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
     # clarifying questions immediately — skipping the full RAG pipeline.
     # The patient can skip this by clicking "Answer my question anyway".
     clarifying_qs = (
-        _get_clarifying_questions(q, body.actor)
+        _get_clarifying_questions(analysis, body.actor)
         if not body.skip_clarification
         else None
     )
@@ -2363,7 +2009,8 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
         latency_ms = int((time.time() - t0) * 1000)
         doctor_name = DOCTORS.get(body.doctor_id, {}).get("name") if body.doctor_id else None
         logger.info("clarifying_questions_returned", question=q, num_questions=len(clarifying_qs))
-        question_tracker.log_question(
+        await run_in_threadpool(
+            question_tracker.log_question,
             db,
             actor=body.actor,
             question=q,
@@ -2396,34 +2043,19 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
         doctor_name = DOCTORS.get(body.doctor_id, {}).get("name", body.doctor_id)
         doctor_website = DOCTORS.get(body.doctor_id, {}).get("website")
 
-        # Include shared doctors (e.g. Bedi also searches Dines' collections)
-        doctors_to_search = [body.doctor_id]
-        if body.doctor_id in SHARED_COLLECTIONS:
-            doctors_to_search.extend(SHARED_COLLECTIONS[body.doctor_id])
-
-        # Find every collection belonging to this doctor (and shared doctors)
-        c = retrieval.client()
-        all_collections = c.get_collections().collections
-        for doc_id in doctors_to_search:
-            doc_slug = slugify(doc_id)
-            doctor_prefix = f"dr_{doc_slug}_"
-            for col in all_collections:
-                if col.name.startswith(doctor_prefix):
-                    collections_to_search.append(col.name)
-
-        # Add collections from COLLECTION_PERMISSIONS
-        for collection_name, allowed_doctors in COLLECTION_PERMISSIONS.items():
-            if body.doctor_id in allowed_doctors:
-                collections_to_search.append(collection_name)
+        # Own, shared-doctor (e.g. Bedi also searches Dines' collections),
+        # preferred and permission-based collections from the routing index
+        route = routing.for_doctor(body.doctor_id)
+        collections_to_search = route.collections
 
         # Filter out collections that are clearly about a different body part
         # than the user's question (e.g. exclude hip collections for an ACL query).
         pre_filter_count = len(collections_to_search)
-        collections_to_search = _filter_collections_by_relevance(collections_to_search, q)
+        collections_to_search = _filter_collections_by_relevance(collections_to_search, analysis)
         logger.info(
             "searching_doctor_collections",
             doctor=doctor_slug,
-            shared_doctors=doctors_to_search,
+            shared_doctors=SHARED_COLLECTIONS.get(body.doctor_id, []),
             collections=collections_to_search,
             filtered_out=pre_filter_count - len(collections_to_search),
         )
@@ -2433,20 +2065,9 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
         body_part_slug = slugify(body.body_part)
         body_part_name = body.body_part.title()
 
-        c = retrieval.client()
-        all_collections = c.get_collections().collections
-
-        # Search for general collections related to this body part
-        # This includes RCTs and clinical guidelines for the body part
-        for col in all_collections:
-            col_name = col.name
-            # Include collections like: dr_general_ucl_rct, dr_general_shoulder, etc.
-            if col_name.startswith("dr_general_"):
-                matches = BODY_PART_COLLECTION_KEYWORDS.get(body_part_slug, [body_part_slug])
-                for match in matches:
-                    if match in col_name:
-                        collections_to_search.append(col_name)
-                        break
+        # General collections related to this body part (RCTs, clinical
+        # guidelines), e.g. dr_general_ucl_rct, dr_general_shoulder
+        collections_to_search = routing.for_body_part(body.body_part).collections
 
         logger.info("careguide_body_part_search", body_part=body_part_slug, collections=collections_to_search)
     else:
@@ -2456,22 +2077,93 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
     # Deduplicate collections while preserving order
     collections_to_search = list(dict.fromkeys(collections_to_search))
 
-    # Search across all relevant collections and aggregate results
+    # Search across all relevant collections and aggregate results.
+    # The question is embedded once and the vector reused for every collection.
     all_hits = []
     hits_by_collection = {}
-    for collection_name in collections_to_search:
-        try:
-            retrieval.ensure_collection(collection_name)
-            hits = retrieval.search(q, top_k=8, collection_name=collection_name)
-            hits_by_collection[collection_name] = len(hits)
-            # Tag each hit with its source collection for debugging
-            for h in hits:
-                if h.payload is None:
-                    h.payload = {}
-                h.payload["_source_collection"] = collection_name
-            all_hits.extend(hits)
-        except Exception as e:
-            logger.warning("collection_search_failed", collection=collection_name, error=str(e))
+    # Collections are checked against the in-memory catalog; ones that do not
+    # exist (e.g. a permission entry with nothing uploaded yet) are skipped
+    # rather than created on the query path.
+    searchable = [name for name in collections_to_search if catalog.contains(name)]
+    if len(searchable) != len(collections_to_search):
+        logger.info(
+            "unknown_collections_skipped",
+            skipped=[name for name in collections_to_search if name not in searchable],
+        )
+    timing.lap("routing")
+
+    # Repeated questions in the same scope are answered from the answer
+    # cache; the exact match is checked before paying for an embedding.
+    cache_scope = body.doctor_id or (f"body_part:{slugify(body.body_part)}" if body.body_part else "")
+    cache_key = answer_cache.key(cache_scope, body.actor, q)
+    cached = answer_cache.get(cache_key, searchable)
+    cache_match = "exact"
+    query_vector = None
+    if cached is None and searchable:
+        timing.lap("answer_cache")
+        query_vector = await retrieval.aembed(q)
+        timing.lap("embed")
+        cached = answer_cache.find_similar(cache_key, query_vector, searchable)
+        cache_match = "semantic"
+    timing.lap("answer_cache")
+    if cached is not None:
+        latency_ms = int((time.time() - t0) * 1000)
+        await run_in_threadpool(
+            question_tracker.log_question,
+            db,
+            actor=body.actor,
+            question=q,
+            doctor_id=body.doctor_id,
+            doctor_name=doctor_name,
+            body_part=body.body_part,
+            session_id=body.session_id,
+            answer_snippet=cached.answer,
+            citations_count=len(cached.citations),
+            latency_ms=latency_ms,
+            had_follow_up=cached.follow_up_question is not None,
+            follow_up_question=cached.follow_up_question,
+        )
+        timing.lap("db_write")
+        _log_rag_query(latency_ms=latency_ms, collections=collections_to_search, cache_hit=cache_match)
+        return Answer(
+            answer=cached.answer,
+            citations=_with_link_base(cached.citations, link_base),
+            guardrails={"in_scope": True, "emergency": False},
+            latency_ms=latency_ms,
+            follow_up_question=cached.follow_up_question,
+            cached=True,
+        )
+
+    # Body-part and procedure exclusions run inside Qdrant against the tags
+    # stored at ingestion, so excluded chunks don't take up top_k slots.  The
+    # Python filters below still handle untagged points.  If the exclusions
+    # leave nothing at all, search again without them — the post-filters
+    # fall back to the unfiltered hits in that case too.
+    #
+    # Collections that store sparse vectors are searched densely and
+    # lexically (exact tokens like "PWB 0-25%" or "BTB"), fused by rank.
+    must_not = search_must_not(analysis)
+    generations = {name: catalog.generation(name) for name in searchable}
+    sparse_collections = [n for n in searchable if getattr(catalog.get(n), "sparse", False)]
+    results = await retrieval.asearch_many(
+        question=q, collections=searchable, top_k=settings.search_top_k, vector=query_vector,
+        must_not=must_not, sparse_collections=sparse_collections, hybrid_top_k=settings.hybrid_top_k,
+    )
+    if must_not and searchable and not any(results.values()):
+        logger.info("search_exclusions_relaxed", collections=searchable)
+        results = await retrieval.asearch_many(
+            question=q, collections=searchable, top_k=settings.search_top_k, vector=query_vector,
+            sparse_collections=sparse_collections, hybrid_top_k=settings.hybrid_top_k,
+        )
+    timing.lap("search")
+    for collection_name, hits in results.items():
+        hits_by_collection[collection_name] = len(hits)
+        # Tag each hit with its source collection for debugging
+        for h in hits:
+            if h.payload is None:
+                h.payload = {}
+            h.payload["_source_collection"] = collection_name
+        all_hits.extend(hits)
 
     # --- Hit-level body-part filter ---
     # Even after collection-level filtering, generic/mixed collections may
@@ -2479,7 +2171,7 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
     # protocol inside a "clinic_protocols" collection when the question is
     # about meniscus root repair).  Filter those out by inspecting titles.
     pre_hit_filter_count = len(all_hits)
-    all_hits = _filter_hits_by_body_part_relevance(all_hits, q)
+    all_hits = _filter_hits_by_body_part_relevance(all_hits, analysis)
     if len(all_hits) != pre_hit_filter_count:
         logger.info(
             "hit_level_filter_applied",
@@ -2492,34 +2184,31 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
     # Meniscal Repair" is not relevant for a standalone "meniscus root
     # repair" query.  Filter out titles about a different primary procedure.
     pre_proc_filter_count = len(all_hits)
-    all_hits = _filter_hits_by_procedure_relevance(all_hits, q)
+    all_hits = _filter_hits_by_procedure_relevance(all_hits, analysis)
     if len(all_hits) != pre_proc_filter_count:
         logger.info(
             "procedure_level_filter_applied",
             before=pre_proc_filter_count,
             after=len(all_hits),
         )
+    timing.lap("filters")
 
     # Tiered ranking: surgeon's own protocols are the primary source of truth,
     # followed by preferred literature collections, then supplementary evidence.
     if body.doctor_id:
-        doctor_prefix = f"dr_{slugify(body.doctor_id)}_"
-        preferred_names = set(PREFERRED_COLLECTIONS.get(body.doctor_id, []))
+        def _tier(h) -> str:
+            return route.tier((h.payload or {}).get("_source_collection", ""))
 
         primary_hits = sorted(
-            [h for h in all_hits if (h.payload or {}).get("_source_collection", "").startswith(doctor_prefix)],
+            [h for h in all_hits if _tier(h) == "own"],
             key=lambda h: h.score, reverse=True,
         )
         preferred_hits = sorted(
-            [h for h in all_hits
-             if (h.payload or {}).get("_source_collection", "") in preferred_names
-             and not (h.payload or {}).get("_source_collection", "").startswith(doctor_prefix)],
+            [h for h in all_hits if _tier(h) == "preferred"],
             key=lambda h: h.score, reverse=True,
         )
         supplementary_hits = sorted(
-            [h for h in all_hits
-             if not (h.payload or {}).get("_source_collection", "").startswith(doctor_prefix)
-             and (h.payload or {}).get("_source_collection", "") not in preferred_names],
+            [h for h in all_hits if _tier(h) == "supplementary"],
             key=lambda h: h.score, reverse=True,
         )
         # Guarantee the surgeon's own protocols are represented, then preferred
@@ -2532,12 +2221,19 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
         remaining_slots -= len(preferred_used)
         supplementary_used = supplementary_hits[:remaining_slots]
         hits = primary_used + preferred_used + supplementary_used
-        num_primary_hits = len(primary_used)
     else:
         # CareGuide path: flat ranking across general collections
         all_hits.sort(key=lambda h: h.score, reverse=True)
         hits = all_hits[:12]
-        num_primary_hits = 0
+    timing.lap("rank")
+
+    # Stitch consecutive chunks of one document and drop text duplicated
+    # across collections, so each Source block carries distinct content.
+    pre_consolidation_count = len(hits)
+    hits = consolidate_hits(hits)
+    if len(hits) != pre_consolidation_count:
+        logger.info("hits_consolidated", before=pre_consolidation_count, after=len(hits))
+    timing.lap("consolidate")
 
     # Log which collections contributed to the top results
     if hits:
@@ -2545,138 +2241,168 @@ async def rag_query(body: QueryRequest, db: Session = Depends(get_db)):
         top_scores = [round(h.score, 4) for h in hits]
         logger.info("rag_top_hits", sources=top_sources, scores=top_scores, hits_per_collection=hits_by_collection)
 
-    follow_up_question = None
+    plan = RagPlan(
+        question=q,
+        doctor_name=doctor_name,
+        collections=collections_to_search,
+        searchable=searchable,
+        cache_key=cache_key,
+        generations=generations,
+        link_base=link_base,
+        query_vector=query_vector,
+        complete=len(results) == len(searchable),
+        hits=hits,
+    )
 
     if not hits:
         if doctor_name:
-            answer_text = f"I couldn't find specific protocols from {doctor_name}. Please contact the office for details."
+            plan.fallback_answer = f"I couldn't find specific protocols from {doctor_name}. Please contact the office for details."
         else:
-            answer_text = "I couldn't find an approved orthopedic source for that. Please contact your clinic."
-        citations = []
-    else:
-        context_parts = []
-        # Build a deduped citation list and map each source number to it.
-        # All chunks go into context (LLM needs the full text), but the
-        # citation list shown to the user is deduplicated by title.
-        citations = []           # unique citations for display
-        title_to_cite_idx = {}   # title → index in citations[]
-        source_to_cite_idx = {}  # 1-based source number → index in citations[]
-
-        for i, h in enumerate(hits):
-            p = h.payload or {}
-            text = p.get("text", "")
-            title = p.get("title", "Unknown")
-            doc_id = p.get("document_id", "unknown")
-            page = p.get("page")
-            section = p.get("section")
-            author = p.get("author")
-            publication_year = p.get("publication_year")
-
-            # Label protocol sources distinctly so the LLM prioritises them
-            if doctor_name and i < num_primary_hits:
-                label = f"[Source {i+1} — {doctor_name}'s Protocol: {title}]"
+            plan.fallback_answer = "I couldn't find an approved orthopedic source for that. Please contact your clinic."
+        return plan
+
+    # Fit the ranked chunks into the MAX_CONTEXT_TOKENS budget.  Hits are in
+    # tier order, so the surgeon's protocol is kept and supplementary
+    # evidence is what gets truncated or dropped.
+    packed = pack_context(hits, settings.max_context_tokens)
+    if packed.dropped or packed.truncated:
+        logger.info(
+            "context_packed",
+            tokens=packed.tokens,
+            budget=settings.max_context_tokens,
+            kept=len(packed.chunks),
+            dropped=packed.dropped,
+            truncated=packed.truncated,
+        )
+    hits = plan.hits = packed.hits
+    timing.lap("pack")
+
+    context_parts = []
+    # Build a deduped citation list and map each source number to it.
+    # All packed chunks go into context (LLM needs the full text), but the
+    # citation list shown to the user is deduplicated by title.
+    citations = []           # unique citations for display
+    title_to_cite_idx = {}   # title → index in citations[]
+    source_to_cite_idx = {}  # 1-based source number → index in citations[]
+
+    for i, chunk in enumerate(packed.chunks):
+        h = chunk.hit
+        p = h.payload or {}
+        text = chunk.text
+        title = p.get("title", "Unknown")
+        doc_id = p.get("document_id", "unknown")
+        page = p.get("page")
+        section = p.get("section")
+        author = p.get("author")
+        publication_year = p.get("publication_year")
+
+        # Label protocol sources distinctly so the LLM prioritises them.
+        # Decided per chunk: packing can skip an oversized own chunk and
+        # keep a later one, so position says nothing about the source.
+        own_protocol = bool(body.doctor_id and doctor_name and route.is_own(h))
+        if own_protocol:
+            label = f"[Source {i+1} — {doctor_name}'s Protocol: {title}]"
+        else:
+            label = f"[Source {i+1}: {title}]"
+        context_parts.append(f"{label}\n{text}\n")
+
+        if title not in title_to_cite_idx:
+            # First chunk from this document — create citation
+            document_url = None
+            if doc_id and doc_id != "unknown" and doc_id.startswith("uploads/"):
+                # Stable link; /documents/{id}/view signs it when clicked
+                document_url = f"{link_base}/documents/{quote(doc_id)}/view"
+
+            # Compute a simplified display label for the UI
+            if own_protocol:
+                last_name = doctor_name.split()[-1]
+                display_label = f"Dr. {last_name} protocol"
             else:
-                label = f"[Source {i+1}: {title}]"
-            context_parts.append(f"{label}\n{text}\n")
-
-            if title not in title_to_cite_idx:
-                # First chunk from this document — create citation
-                document_url = None
-                if doc_id and doc_id != "unknown" and doc_id.startswith("uploads/"):
-                    try:
-                        document_url = presign_get(doc_id, expiry_seconds=3600)
-                    except Exception as e:
-                        logger.warning("presign_url_failed", document_id=doc_id, error=str(e))
-
-                # Compute a simplified display label for the UI
-                if doctor_name and i < num_primary_hits:
-                    last_name = doctor_name.split()[-1]
-                    display_label = f"Dr. {last_name} protocol"
-                else:
-                    display_label = "Published research"
-
-                title_to_cite_idx[title] = len(citations)
-                citations.append(
-                    Citation(
-                        title=title,
-                        document_id=doc_id,
-                        page=page,
-                        section=section,
-                        author=author,
-                        publication_year=publication_year,
-                        document_url=document_url,
-                        display_label=display_label,
-                    )
+                display_label = "Published research"
+
+            title_to_cite_idx[title] = len(citations)
+            citations.append(
+                Citation(
+                    title=title,
+                    document_id=doc_id,
+                    page=page,
+                    section=section,
+                    author=author,
+                    publication_year=publication_year,
+                    document_url=document_url,
+                    display_label=display_label,
                 )
+            )
 
-            source_to_cite_idx[i + 1] = title_to_cite_idx[title]
-        
-        context = "\n".join(context_parts)
-        
-        # Build system prompt based on actor and path.
-        # CRITICAL: Every factual claim MUST have an inline (Source N) citation.
-        citation_rule = "IMPORTANT: You MUST cite every factual claim with an inline (Source N) tag. For example: \"Patients should remain toe-touch weight-bearing for 6 weeks (Source 3).\" Every sentence with a factual claim needs a source tag. Do not write any claims without a citation. Cite each source INDIVIDUALLY — write (Source 1) (Source 2), NEVER (Source 1, Source 2)."
-        accuracy_rule = "ACCURACY: When stating specific numbers, percentages, weight-bearing status, ROM restrictions, or timeframes from the source, quote them EXACTLY as written. Do NOT combine or confuse separate restrictions. For example, a flexion restriction (e.g., 'no knee flexion past 90 degrees for 6 weeks') is NOT a weight-bearing restriction (e.g., 'PWB 0-25%'). State each restriction separately and precisely as it appears in the source. If the source says 'PWB 0-25%', do NOT say 'no weight bearing'. If the source specifies instructions by time period (e.g., Days 1-7, Weeks 2-3), organize your answer by those same time periods."
-        procedure_scope_rule = "PROCEDURE SCOPE: When the user mentions a specific surgery (e.g., 'ACL reconstruction'), answer ONLY about that exact procedure. Do NOT assume additional concomitant procedures were performed unless the user explicitly states them. For example, if the user asks about 'ACL reconstruction' do NOT include meniscus repair, cartilage restoration, or other procedures in your answer unless the user says those were also done. Treat the stated surgery as the only surgery performed."
-        source_relevance_rule = "SOURCE RELEVANCE: Only cite sources that are directly relevant to the specific procedure or body part being asked about. If a source's title or content clearly pertains to a different body part or procedure (e.g., a hip arthroscopy protocol when the question is about knee meniscus surgery, or a shoulder protocol when the question is about an elbow procedure), do NOT cite it — even if the rehabilitation steps seem superficially similar. CRITICAL: A document about a combined procedure (e.g., 'ACL Reconstruction with Meniscal Repair') is NOT relevant when the user only asked about one of those procedures in isolation (e.g., standalone 'meniscus root repair'). Similarly, a general surgical booklet or operative guide is NOT a substitute for a procedure-specific protocol — do not cite it unless it specifically addresses the procedure the user asked about. When in doubt, prefer to omit a questionable source rather than cite one about the wrong procedure."
-
-        # Follow-up rules differ by actor.  Providers get procedure-detail
-        # oriented follow-ups; patients get context-adaptive follow-ups:
-        # post-op patients get Socratic questions about surgical details &
-        # recovery, while treatment-inquiry patients get questions about
-        # their condition, goals, and what they've already tried.
-        if body.actor == "PATIENT":
-            is_postop = _is_postop_or_recovery_context(q)
-            if is_postop:
-                follow_up_rule = (
-                    "FOLLOW-UP: After your answer, suggest ONE follow-up question that would help provide a more accurate or personalised answer. "
-                    "Format it exactly as: FOLLOW_UP_QUESTION: <your question here>\n"
-                    "The patient appears to be asking about post-operative care or recovery. Prioritise follow-up questions in this order:\n"
-                    "1. Ask whether any ADDITIONAL procedures were performed during the same surgery — phrase this as a gentle confirmation, e.g. "
-                    "\"Did you also have any other procedures done at the same time as your ACL reconstruction, such as a meniscus repair or cartilage procedure?\"\n"
-                    "2. Ask about specific surgical details that would change the protocol (graft type, primary vs. revision surgery, surgical approach).\n"
-                    "3. Ask how far along they are in recovery (e.g. \"How many weeks post-op are you?\").\n"
-                    "Choose whichever follow-up would most improve the specificity of the answer. "
-                    "Only include one follow-up question. If there is no useful follow-up, omit this line entirely."
-                )
-            else:
-                follow_up_rule = (
-                    "FOLLOW-UP: After your answer, suggest ONE follow-up question that would help the patient explore their situation further. "
-                    "Format it exactly as: FOLLOW_UP_QUESTION: <your question here>\n"
-                    "The patient appears to be asking about treatment options or their condition (NOT post-operative recovery). "
-                    "Do NOT ask about surgical details, concomitant procedures, graft types, or recovery timelines — those are not relevant here. "
-                    "Instead, choose a follow-up from these categories:\n"
-                    "1. Ask about what treatments or therapies they have already tried (e.g. \"Have you tried any conservative treatments like physical therapy or injections?\").\n"
-                    "2. Ask about their goals or activity level to tailor recommendations (e.g. \"What activities or sports are you hoping to get back to?\").\n"
-                    "3. Ask about the severity or duration of their symptoms to help narrow the advice.\n"
-                    "4. Ask whether they've had imaging or a formal diagnosis to clarify the condition.\n"
-                    "Choose whichever follow-up is most natural given your answer. "
-                    "Only include one follow-up question. If there is no useful follow-up, omit this line entirely."
-                )
+        source_to_cite_idx[i + 1] = title_to_cite_idx[title]
+    timing.lap("citations")
+
+    context = "\n".join(context_parts)
+    
+    # Build system prompt based on actor and path.
+    # CRITICAL: Every factual claim MUST have an inline (Source N) citation.
+    citation_rule = "IMPORTANT: You MUST cite every factual claim with an inline (Source N) tag. For example: \"Patients should remain toe-touch weight-bearing for 6 weeks (Source 3).\" Every sentence with a factual claim needs a source tag. Do not write any claims without a citation. Cite each source INDIVIDUALLY — write (Source 1) (Source 2), NEVER (Source 1, Source 2)."
+    accuracy_rule = "ACCURACY: When stating specific numbers, percentages, weight-bearing status, ROM restrictions, or timeframes from the source, quote them EXACTLY as written. Do NOT combine or confuse separate restrictions. For example, a flexion restriction (e.g., 'no knee flexion past 90 degrees for 6 weeks') is NOT a weight-bearing restriction (e.g., 'PWB 0-25%'). State each restriction separately and precisely as it appears in the source. If the source says 'PWB 0-25%', do NOT say 'no weight bearing'. If the source specifies instructions by time period (e.g., Days 1-7, Weeks 2-3), organize your answer by those same time periods."
+    procedure_scope_rule = "PROCEDURE SCOPE: When the user mentions a specific surgery (e.g., 'ACL reconstruction'), answer ONLY about that exact procedure. Do NOT assume additional concomitant procedures were performed unless the user explicitly states them. For example, if the user asks about 'ACL reconstruction' do NOT include meniscus repair, cartilage restoration, or other procedures in your answer unless the user says those were also done. Treat the stated surgery as the only surgery performed."
+    source_relevance_rule = "SOURCE RELEVANCE: Only cite sources that are directly relevant to the specific procedure or body part being asked about. If a source's title or content clearly pertains to a different body part or procedure (e.g., a hip arthroscopy protocol when the question is about knee meniscus surgery, or a shoulder protocol when the question is about an elbow procedure), do NOT cite it — even if the rehabilitation steps seem superficially similar. CRITICAL: A document about a combined procedure (e.g., 'ACL Reconstruction with Meniscal Repair') is NOT relevant when the user only asked about one of those procedures in isolation (e.g., standalone 'meniscus root repair'). Similarly, a general surgical booklet or operative guide is NOT a substitute for a procedure-specific protocol — do not cite it unless it specifically addresses the procedure the user asked about. When in doubt, prefer to omit a questionable source rather than cite one about the wrong procedure."
+
+    # Follow-up rules differ by actor.  Providers get procedure-detail
+    # oriented follow-ups; patients get context-adaptive follow-ups:
+    # post-op patients get Socratic questions about surgical details &
+    # recovery, while treatment-inquiry patients get questions about
+    # their condition, goals, and what they've already tried.
+    if body.actor == "PATIENT":
+        is_postop = analysis.is_postop_or_recovery
+        if is_postop:
+            follow_up_rule = (
+                "FOLLOW-UP: After your answer, suggest ONE follow-up question that would help provide a more accurate or personalised answer. "
+                "Format it exactly as: FOLLOW_UP_QUESTION: <your question here>\n"
+                "The patient appears to be asking about post-operative care or recovery. Prioritise follow-up questions in this order:\n"
+                "1. Ask whether any ADDITIONAL procedures were performed during the same surgery — phrase this as a gentle confirmation, e.g. "
+                "\"Did you also have any other procedures done at the same time as your ACL reconstruction, such as a meniscus repair or cartilage procedure?\"\n"
+                "2. Ask about specific surgical details that would change the protocol (graft type, primary vs. revision surgery, surgical approach).\n"
+                "3. Ask how far along they are in recovery (e.g. \"How many weeks post-op are you?\").\n"
+                "Choose whichever follow-up would most improve the specificity of the answer. "
+                "Only include one follow-up question. If there is no useful follow-up, omit this line entirely."
+            )
         else:
             follow_up_rule = (
-                "FOLLOW-UP: After your answer, if there is a natural follow-up question the user might want to ask "
-                "that would let you give a more specific or helpful answer, add it on its own line at the very end in "
-                "this exact format: FOLLOW_UP_QUESTION: <your question here>. The question should be relevant, concise, "
-                "and help the user get more targeted information from the available sources. When the user asks about a "
-                "surgical procedure (e.g., ACL reconstruction, rotator cuff repair, UCL reconstruction), the follow-up "
-                "should guide them to specify details that would make the answer more personalised — for example, graft "
-                "type (BTB patellar tendon autograft, hamstring autograft, quadriceps tendon autograft, or allograft), "
-                "whether it was a revision or primary surgery, or any concomitant procedures (e.g., meniscus repair). "
+                "FOLLOW-UP: After your answer, suggest ONE follow-up question that would help the patient explore their situation further. "
+                "Format it exactly as: FOLLOW_UP_QUESTION: <your question here>\n"
+                "The patient appears to be asking about treatment options or their condition (NOT post-operative recovery). "
+                "Do NOT ask about surgical details, concomitant procedures, graft types, or recovery timelines — those are not relevant here. "
+                "Instead, choose a follow-up from these categories:\n"
+                "1. Ask about what treatments or therapies they have already tried (e.g. \"Have you tried any conservative treatments like physical therapy or injections?\").\n"
+                "2. Ask about their goals or activity level to tailor recommendations (e.g. \"What activities or sports are you hoping to get back to?\").\n"
+                "3. Ask about the severity or duration of their symptoms to help narrow the advice.\n"
+                "4. Ask whether they've had imaging or a formal diagnosis to clarify the condition.\n"
+                "Choose whichever follow-up is most natural given your answer. "
                 "Only include one follow-up question. If there is no useful follow-up, omit this line entirely."
             )
+    else:
+        follow_up_rule = (
+            "FOLLOW-UP: After your answer, if there is a natural follow-up question the user might want to ask "
+            "that would let you give a more specific or helpful answer, add it on its own line at the very end in "
+            "this exact format: FOLLOW_UP_QUESTION: <your question here>. The question should be relevant, concise, "
+            "and help the user get more targeted information from the available sources. When the user asks about a "
+            "surgical procedure (e.g., ACL reconstruction, rotator cuff repair, UCL reconstruction), the follow-up "
+            "should guide them to specify details that would make the answer more personalised — for example, graft "
+            "type (BTB patellar tendon autograft, hamstring autograft, quadriceps tendon autograft, or allograft), "
+            "whether it was a revision or primary surgery, or any concomitant procedures (e.g., meniscus repair). "
+            "Only include one follow-up question. If there is no useful follow-up, omit this line entirely."
+        )
 
-        website_rule = ""
-        if doctor_name and doctor_website:
-            website_rule = (
-                f"When relevant, you may reference Dr. {doctor_name.replace('Dr. ', '')}'s website "
-                f"({doctor_website}) as an additional resource for patients or providers seeking more "
-                f"information about the practice."
-            )
+    website_rule = ""
+    if doctor_name and doctor_website:
+        website_rule = (
+            f"When relevant, you may reference Dr. {doctor_name.replace('Dr. ', '')}'s website "
+            f"({doctor_website}) as an additional resource for patients or providers seeking more "
+            f"information about the practice."
+        )
 
-        if body.actor == "PROVIDER":
-            if doctor_name:
-                system_prompt = f"""You are a clinical assistant presenting Dr. {doctor_name}'s protocols.
+    if body.actor == "PROVIDER":
+        if doctor_name:
+            system_prompt = f"""You are a clinical assistant presenting Dr. {doctor_name}'s protocols.
 
 Rules:
 - State Dr. {doctor_name}'s protocol directly and confidently — do not hedge when the protocol is clear.
@@ -2691,8 +2417,8 @@ Rules:
 - {citation_rule}
 - {follow_up_rule}
 - {website_rule}"""
-            elif body_part_name:
-                system_prompt = f"""You are a clinical decision support assistant for {body_part_name} conditions.
+        elif body_part_name:
+            system_prompt = f"""You are a clinical decision support assistant for {body_part_name} conditions.
 
 Rules:
 - Provide evidence-based answers using ONLY the provided sources.
@@ -2703,11 +2429,11 @@ Rules:
 - {accuracy_rule}
 - {citation_rule}
 - {follow_up_rule}"""
-            else:
-                system_prompt = f"""You are a clinical decision support assistant. Provide evidence-based answers using ONLY the provided sources. Never fabricate information or citations. {procedure_scope_rule} {source_relevance_rule} {accuracy_rule} {citation_rule} {follow_up_rule}"""
         else:
-            if doctor_name:
-                system_prompt = f"""You are an office assistant for Dr. {doctor_name}'s practice, helping patients and their families understand the doctor's protocols and post-operative instructions.
+            system_prompt = f"""You are a clinical decision support assistant. Provide evidence-based answers using ONLY the provided sources. Never fabricate information or citations. {procedure_scope_rule} {source_relevance_rule} {accuracy_rule} {citation_rule} {follow_up_rule}"""
+    else:
+        if doctor_name:
+            system_prompt = f"""You are an office assistant for Dr. {doctor_name}'s practice, helping patients and their families understand the doctor's protocols and post-operative instructions.
 
 Rules:
 - Respond as if you are part of Dr. {doctor_name}'s office team relaying the doctor's own protocols.
@@ -2723,8 +2449,8 @@ Rules:
 - {citation_rule}
 - {follow_up_rule}
 - {website_rule}"""
-            elif body_part_name:
-                system_prompt = f"""You are a patient education assistant for {body_part_name} conditions.
+        elif body_part_name:
+            system_prompt = f"""You are a patient education assistant for {body_part_name} conditions.
 
 Rules:
 - Use clear, patient-friendly language.
@@ -2737,10 +2463,10 @@ Rules:
 - {accuracy_rule}
 - {citation_rule}
 - {follow_up_rule}"""
-            else:
-                system_prompt = f"""You are a patient education assistant. Answer using ONLY the provided sources in clear language. Never provide medical advice or fabricate information or citations. {procedure_scope_rule} {source_relevance_rule} {accuracy_rule} {citation_rule} {follow_up_rule}"""
+        else:
+            system_prompt = f"""You are a patient education assistant. Answer using ONLY the provided sources in clear language. Never provide medical advice or fabricate information or citations. {procedure_scope_rule} {source_relevance_rule} {accuracy_rule} {citation_rule} {follow_up_rule}"""
 
-        user_prompt = f"""Sources:
+    user_prompt = f"""Sources:
 {context}
 
 Question: {q}
@@ -2753,85 +2479,132 @@ Answer the question using the sources above. Rules:
 5. Only cite sources that match the procedure or body part being asked about. Skip any source whose title indicates a different procedure or body part (e.g., do not cite a hip arthroscopy study for a meniscus question).
 6. Answer ONLY about the specific surgery or procedure mentioned. Do not assume concomitant procedures were performed unless the user explicitly states them."""
 
-        # Use Claude Sonnet 4.5 with prompt caching.
-        # The system prompt is cached so repeated queries for the same doctor
-        # hit the cache — cutting cost (~90% on cached tokens) and latency.
-        # Embeddings still use OpenAI (no re-indexing needed).
-        ac = retrieval.anthropic_client()
-        response = ac.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=4096,
-            temperature=0,
-            system=[
-                {
-                    "type": "text",
-                    "text": system_prompt,
-                    "cache_control": {"type": "ephemeral"},
-                }
-            ],
-            messages=[{"role": "user", "content": user_prompt}],
-        )
+    plan.citations = citations
+    plan.source_to_cite_idx = source_to_cite_idx
+    plan.system_prompt = system_prompt
+    plan.user_prompt = user_prompt
+    timing.lap("prompt")
+    return plan
+
+
+def _claude_request(plan: RagPlan) -> dict:
+    """Keyword arguments for ``messages.create`` / ``messages.stream``."""
+    # Use Claude Sonnet 4.5 with prompt caching.
+    # The system prompt is cached so repeated queries for the same doctor
+    # hit the cache — cutting cost (~90% on cached tokens) and latency.
+    # Embeddings still use OpenAI (no re-indexing needed).
+    return dict(
+        model="claude-sonnet-4-5-20250929",
+        max_tokens=4096,
+        temperature=0,
+        system=[
+            {
+                "type": "text",
+                "text": plan.system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ],
+        messages=[{"role": "user", "content": plan.user_prompt}],
+    )
 
-        raw_answer = response.content[0].text if response.content else "I couldn't generate an answer."
 
-        # Extract follow-up question if present
-        follow_up_question = None
-        follow_up_match = re.search(r'\n*FOLLOW_UP_QUESTION:\s*(.+?)$', raw_answer, flags=re.MULTILINE)
-        if follow_up_match:
-            follow_up_question = follow_up_match.group(1).strip()
-            raw_answer = raw_answer[:follow_up_match.start()].strip()
+def _finalize_answer(raw_answer: str, plan: RagPlan) -> Tuple[str, Optional[str], List[Citation]]:
+    """Split off the follow-up question and renumber inline citations.
 
-        # Strip any SOURCES_USED footer the model may have appended
-        answer_text = re.sub(r'\n*SOURCES_USED:.*$', '', raw_answer, flags=re.DOTALL).strip()
+    Returns ``(answer_text, follow_up_question, citations)`` where citations
+    are only the documents actually cited, in order of first citation.
+    """
+    citations = plan.citations
+    source_to_cite_idx = plan.source_to_cite_idx
 
-        # Normalize comma-separated citations like (Source 9, Source 10)
-        # into individual citations (Source 9) (Source 10).
-        def _expand_multi_cite(m: re.Match) -> str:
-            nums = re.findall(r'\d+', m.group(0))
-            return " ".join(f"(Source {n})" for n in nums)
+    # Extract follow-up question if present
+    follow_up_question = None
+    follow_up_match = re.search(r'\n*FOLLOW_UP_QUESTION:\s*(.+?)$', raw_answer, flags=re.MULTILINE)
+    if follow_up_match:
+        follow_up_question = follow_up_match.group(1).strip()
+        raw_answer = raw_answer[:follow_up_match.start()].strip()
+
+    # Strip any SOURCES_USED footer the model may have appended
+    answer_text = re.sub(r'\n*SOURCES_USED:.*$', '', raw_answer, flags=re.DOTALL).strip()
+
+    # Normalize comma-separated citations like (Source 9, Source 10)
+    # into individual citations (Source 9) (Source 10).
+    def _expand_multi_cite(m: re.Match) -> str:
+        nums = re.findall(r'\d+', m.group(0))
+        return " ".join(f"(Source {n})" for n in nums)
+
+    answer_text = re.sub(
+        r'\(Source\s+\d+(?:\s*,\s*Source\s+\d+)+\)',
+        _expand_multi_cite,
+        answer_text,
+    )
 
+    # Map inline (Source N) references to the deduped citation list,
+    # keep only cited documents, and renumber sequentially.
+    cited_source_nums = list(dict.fromkeys(
+        int(m.group(1)) for m in re.finditer(r'\(Source\s+(\d+)\)', answer_text)
+    ))  # unique source numbers in order of first appearance
+
+    # Resolve to unique citation indices in appearance order
+    cited_cite_indices = list(dict.fromkeys(
+        source_to_cite_idx[n] for n in cited_source_nums if n in source_to_cite_idx
+    ))
+
+    if cited_cite_indices:
+        # Build source_num → new citation number (1-based)
+        old_cite_to_new = {old_ci: new_pos + 1 for new_pos, old_ci in enumerate(cited_cite_indices)}
+        renumber = {
+            src_num: old_cite_to_new[source_to_cite_idx[src_num]]
+            for src_num in cited_source_nums
+            if src_num in source_to_cite_idx and source_to_cite_idx[src_num] in old_cite_to_new
+        }
         answer_text = re.sub(
-            r'\(Source\s+\d+(?:\s*,\s*Source\s+\d+)+\)',
-            _expand_multi_cite,
+            r'\(Source\s+(\d+)\)',
+            lambda m: f'(Source {renumber.get(int(m.group(1)), m.group(1))})',
             answer_text,
         )
-
-        # Map inline (Source N) references to the deduped citation list,
-        # keep only cited documents, and renumber sequentially.
-        cited_source_nums = list(dict.fromkeys(
-            int(m.group(1)) for m in re.finditer(r'\(Source\s+(\d+)\)', answer_text)
-        ))  # unique source numbers in order of first appearance
-
-        # Resolve to unique citation indices in appearance order
-        cited_cite_indices = list(dict.fromkeys(
-            source_to_cite_idx[n] for n in cited_source_nums if n in source_to_cite_idx
-        ))
-
-        if cited_cite_indices:
-            # Build source_num → new citation number (1-based)
-            old_cite_to_new = {old_ci: new_pos + 1 for new_pos, old_ci in enumerate(cited_cite_indices)}
-            renumber = {
-                src_num: old_cite_to_new[source_to_cite_idx[src_num]]
-                for src_num in cited_source_nums
-                if src_num in source_to_cite_idx and source_to_cite_idx[src_num] in old_cite_to_new
-            }
-            answer_text = re.sub(
-                r'\(Source\s+(\d+)\)',
-                lambda m: f'(Source {renumber.get(int(m.group(1)), m.group(1))})',
-                answer_text,
-            )
-            citations = [citations[i] for i in cited_cite_indices]
+        citations = [citations[i] for i in cited_cite_indices]
+
+    return answer_text, follow_up_question, citations
+
+
+async def _complete_rag_query(
+    body: QueryRequest,
+    db: Session,
+    t0: float,
+    plan: RagPlan,
+    answer_text: str,
+    follow_up_question: Optional[str],
+    citations: List[Citation],
+) -> Answer:
+    q = plan.question
+    hits = plan.hits
+
+    # Only complete answers are cached: a collection that timed out or failed
+    # would otherwise be missing from every repeat until the entry expires.
+    if hits and plan.complete:
+        answer_cache.put(
+            plan.cache_key,
+            CachedAnswer(
+                answer=answer_text,
+                citations=_without_link_base(citations, plan.link_base),
+                follow_up_question=follow_up_question,
+                generations=plan.generations,
+            ),
+            vector=plan.query_vector,
+        )
+    timing.lap("answer_cache")
 
     latency_ms = int((time.time() - t0) * 1000)
-    logger.info("rag_query", latency_ms=latency_ms, k=len(hits or []), collections=collections_to_search)
 
     # Track the question for provider feedback and research
-    question_tracker.log_question(
+    await run_in_threadpool(
+        question_tracker.log_question,
         db,
         actor=body.actor,
         question=q,
         doctor_id=body.doctor_id,
-        doctor_name=doctor_name,
+        doctor_name=plan.doctor_name,
         body_part=body.body_part,
         session_id=body.session_id,
         answer_snippet=answer_text,
@@ -2840,6 +2613,8 @@ Answer the question using the sources above. Rules:
         had_follow_up=follow_up_question is not None,
         follow_up_question=follow_up_question,
     )
+    timing.lap("db_write")
+    _log_rag_query(latency_ms=latency_ms, k=len(hits or []), collections=plan.collections, cache_hit=None)
 
     return Answer(
         answer=answer_text,
@@ -2849,8 +2624,250 @@ Answer the question using the sources above. Rules:
         follow_up_question=follow_up_question,
     )
 
+
+def _link_base(request: Request) -> str:
+    return (settings.public_api_base or str(request.base_url)).rstrip("/")
+
+
+def _without_link_base(citations: List[Citation], link_base: str) -> List[Citation]:
+    """Copies of ``citations`` with ``document_url`` relative to the API, for
+    the answer cache: without PUBLIC_API_BASE the base comes from whichever
+    request produced the answer."""
+    return [
+        c.model_copy(update={"document_url": c.document_url[len(link_base):]})
+        if c.document_url and c.document_url.startswith(link_base) else c.model_copy()
+        for c in citations
+    ]
+
+
+def _with_link_base(citations: List[Citation], link_base: str) -> List[Citation]:
+    """Copies of cached ``citations`` with ``document_url`` under ``link_base``."""
+    return [
+        c.model_copy(update={"document_url": link_base + c.document_url})
+        if c.document_url else c.model_copy()
+        for c in citations
+    ]
+
+
+def _log_rag_query(**fields) -> None:
+    """Log the ``rag_query`` event with per-stage durations and record them
+    in the stage histograms."""
+    timer = timing.current()
+    if timer is not None:
+        fields.update(timer.log_fields())
+        metrics.observe_rag_stages(timer)
+    logger.info("rag_query", **fields)
+
+
+@router.post("/query", response_model=Answer)
+async def rag_query(body: QueryRequest, request: Request, response: Response, db: Session = Depends(get_db)):
+    t0 = time.time()
+    timer = timing.start()
+    answer = await _answer_rag_query(body, db, t0, _link_base(request))
+    response.headers["Server-Timing"] = timer.server_timing()
+    return answer
+
+
+async def _answer_rag_query(body: QueryRequest, db: Session, t0: float, link_base: str) -> Answer:
+    prepared = await _prepare_rag_query(body, db, t0, link_base)
+    if isinstance(prepared, Answer):
+        return prepared
+    plan = prepared
+
+    if plan.fallback_answer is not None:
+        return await _complete_rag_query(body, db, t0, plan, plan.fallback_answer, None, [])
+
+    ac = clients.async_anthropic()
+    with metrics.external_call("anthropic", "messages"):
+        message = await ac.messages.create(**_claude_request(plan))
+    timing.lap("llm")
+    raw_answer = message.content[0].text if message.content else "I couldn't generate an answer."
+    answer_text, follow_up_question, citations = _finalize_answer(raw_answer, plan)
+    timing.lap("finalize")
+    return await _complete_rag_query(body, db, t0, plan, answer_text, follow_up_question, citations)
+
+
+# ---------------------------------------------------------------------------
+# Streaming (/rag/query/stream)
+# ---------------------------------------------------------------------------
+
+_ANSWER_TRAILER_MARKERS = ("FOLLOW_UP_QUESTION:", "SOURCES_USED:")
+_MULTI_CITE_RE = re.compile(r'\(Source\s+\d+(?:\s*,\s*Source\s+\d+)+\)')
+_CITE_RE = re.compile(r'\(Source\s+(\d+)\)')
+# An unclosed "(" that can still grow into a (multi-)citation
+_PARTIAL_CITE_RE = re.compile(
+    r'\((?:Source\s+\d+\s*,\s*)*(?:S(?:o(?:u(?:r(?:c(?:e(?:\s+(?:\d+\s*)?)?)?)?)?)?)?)?'
+)
+
+
+class _AnswerStreamFilter:
+    """Turn raw Claude text deltas into display-ready answer text.
+
+    Applies the same rules as :func:`_finalize_answer`, incrementally:
+    inline citations are expanded and renumbered in order of first
+    appearance, and everything from a FOLLOW_UP_QUESTION / SOURCES_USED
+    marker onwards is withheld.  Text that might still turn into a citation
+    or a marker (an unclosed ``(`` followed only by a citation prefix, a
+    partial marker, trailing whitespace) is held back until the next delta
+    decides it.
+    """
+
+    def __init__(self, source_to_cite_idx: Dict[int, int]):
+        self._source_to_cite_idx = source_to_cite_idx
+        self._renumber: Dict[int, int] = {}
+        self._buf = ""
+        self._started = False
+        self._closed = False
+
+    def _render(self, text: str) -> str:
+        text = _MULTI_CITE_RE.sub(
+            lambda m: " ".join(f"(Source {n})" for n in re.findall(r'\d+', m.group(0))),
+            text,
+        )
+
+        def _cite(m: re.Match) -> str:
+            n = int(m.group(1))
+            ci = self._source_to_cite_idx.get(n)
+            if ci is None:
+                return m.group(0)
+            new = self._renumber.setdefault(ci, len(self._renumber) + 1)
+            return f"(Source {new})"
+
+        text = _CITE_RE.sub(_cite, text)
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, delta: str) -> str:
+        if self._closed:
+            return ""
+        self._buf += delta
+
+        cut = min((i for i in (self._buf.find(m) for m in _ANSWER_TRAILER_MARKERS) if i != -1), default=-1)
+        if cut != -1:
+            self._closed = True
+            return self._render(self._buf[:cut].rstrip())
+
+        hold = len(self._buf)
+        paren = self._buf.rfind("(")
+        if paren != -1 and _PARTIAL_CITE_RE.fullmatch(self._buf, paren):
+            hold = paren
+        for marker in _ANSWER_TRAILER_MARKERS:
+            for n in range(len(marker) - 1, 0, -1):
+                if self._buf.endswith(marker[:n]):
+                    hold = min(hold, len(self._buf) - n)
+                    break
+        hold = len(self._buf[:hold].rstrip())
+
+        ready, self._buf = self._buf[:hold], self._buf[hold:]
+        return self._render(ready)
+
+    def flush(self) -> str:
+        if self._closed:
+            return ""
+        self._closed = True
+        return self._render(self._buf.rstrip())
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/query/stream")
+async def rag_query_stream(body: QueryRequest, request: Request, db: Session = Depends(get_db)):
+    """Same as /rag/query, but streams the answer as server-sent events.
+
+    Events, in order:
+      ``delta``      ``{"text": ...}`` answer text as it is generated, with
+                     citations already renumbered to match the final list
+      ``citations``  ``{"citations": [...]}`` the cited documents
+      ``follow_up``  ``{"follow_up_question": ...}``
+      ``done``       the full :class:`Answer` (authoritative final text)
+      ``error``      ``{"detail": ...}`` if generation fails mid-stream
+
+    Guardrail rejections are returned as a normal 400 before streaming.
+    Clarifying questions and cached answers arrive as a single ``delta``.
+    """
+    t0 = time.time()
+    timer = timing.start()
+    prepared = await _prepare_rag_query(body, db, t0, _link_base(request))
+    # Only the stages before generation can go in a header of a streamed
+    # response; the full breakdown is logged on the rag_query event.
+    server_timing = timer.server_timing()
+
+    async def _final_events(answer: Answer):
+        yield _sse("citations", {"citations": [c.model_dump() for c in answer.citations]})
+        yield _sse("follow_up", {"follow_up_question": answer.follow_up_question})
+        yield _sse("done", answer.model_dump())
+
+    async def _events(db: Session):
+        if isinstance(prepared, Answer):
+            yield _sse("delta", {"text": prepared.answer})
+            async for event in _final_events(prepared):
+                yield event
+            return
+
+        plan = prepared
+        if plan.fallback_answer is not None:
+            answer = await _complete_rag_query(body, db, t0, plan, plan.fallback_answer, None, [])
+            yield _sse("delta", {"text": answer.answer})
+            async for event in _final_events(answer):
+                yield event
+            return
+
+        stream_filter = _AnswerStreamFilter(plan.source_to_cite_idx)
+        first_token_ms = None
+        try:
+            ac = clients.async_anthropic()
+            with metrics.external_call("anthropic", "messages_stream"):
+                async with ac.messages.stream(**_claude_request(plan)) as stream:
+                    async for delta in stream.text_stream:
+                        text = stream_filter.feed(delta)
+                        if text:
+                            if first_token_ms is None:
+                                first_token_ms = int((time.time() - t0) * 1000)
+                            yield _sse("delta", {"text": text})
+                    final = await stream.get_final_message()
+            timing.lap("llm")
+        except Exception as e:
+            logger.error("rag_query_stream_failed", error=str(e))
+            yield _sse("error", {"detail": "Answer generation failed. Please try again."})
+            return
+
+        text = stream_filter.flush()
+        if text:
+            yield _sse("delta", {"text": text})
+
+        raw_answer = "".join(
+            block.text for block in final.content if getattr(block, "type", None) == "text"
+        ) or "I couldn't generate an answer."
+        answer_text, follow_up_question, citations = _finalize_answer(raw_answer, plan)
+        timing.lap("finalize")
+        answer = await _complete_rag_query(body, db, t0, plan, answer_text, follow_up_question, citations)
+        logger.info("rag_query_stream", first_token_ms=first_token_ms, latency_ms=answer.latency_ms)
+        async for event in _final_events(answer):
+            yield event
+
+    async def _events_with_session():
+        # The request's get_db session is closed before the body streams
+        # (FastAPI >= 0.106), so the generator logs through its own session.
+        stream_db = SessionLocal()
+        try:
+            async for event in _events(stream_db):
+                yield event
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(
+        _events_with_session(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": server_timing},
+    )
+
 @router.post("/dev/seed")
 async def dev_seed():
     """Seed demo data."""
     retrieval.seed_demo()
+    catalog.mark_changed(settings.collection)
     return {"status": "seeded"}
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Backfill script to store body-part / procedure / generic tags on existing points.
+
+New uploads get ``body_parts``, ``procedures``, ``is_generic`` and
+``tags_version`` in their payload at ingestion (see
+``app.services.query_analysis.document_tags``).  Points ingested before that,
+or tagged with an older version of the keyword tables, are classified on the
+fly at query time until this script rewrites them.
+
+Points whose ``tags_version`` is already current are skipped, so the script
+is safe to re-run (e.g. after editing a keyword table).  It also creates the
+payload indexes that the query-time search filter uses on the tag fields.
+
+Usage:
+    python -m app.scripts.backfill_hit_tags [--dry-run] [--collection COLLECTION_NAME]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from qdrant_client import QdrantClient
+from app.services import clients
+from app.services.ingestion import ensure_tag_indexes, set_point_tags
+from app.services.query_analysis import TAGS_VERSION
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+
+def backfill_collection(client: QdrantClient, collection_name: str, dry_run: bool) -> tuple[int, int]:
+    """Tag every out-of-date point in one collection.  Returns (tagged, current)."""
+    if not dry_run:
+        ensure_tag_indexes(client, collection_name)
+    tagged = 0
+    current = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=256,
+            offset=offset,
+            with_payload=["title", "text", "tags_version"],
+            with_vectors=False,
+        )
+        stale = [p for p in points if (p.payload or {}).get("tags_version") != TAGS_VERSION]
+        current += len(points) - len(stale)
+        if stale:
+            if not dry_run:
+                set_point_tags(client, collection_name, stale)
+            tagged += len(stale)
+        if offset is None:
+            break
+    return tagged, current
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Store body-part / procedure tags on existing Qdrant points"
+    )
+    parser.add_argument('--dry-run', action='store_true', help='Count points without writing')
+    parser.add_argument('--collection', type=str, help='Only backfill this collection')
+    args = parser.parse_args()
+
+    client = clients.qdrant()
+    if args.collection:
+        collections = [args.collection]
+    else:
+        collections = [c.name for c in client.get_collections().collections]
+
+    log.info(f"Backfilling hit tags (version {TAGS_VERSION}) in {len(collections)} collection(s)"
+             + (" [DRY RUN]" if args.dry_run else ""))
+
+    total_tagged = 0
+    errors = 0
+    for name in collections:
+        try:
+            tagged, current = backfill_collection(client, name, args.dry_run)
+        except Exception as e:
+            log.error(f"  {name}: failed: {e}")
+            errors += 1
+            continue
+        total_tagged += tagged
+        log.info(f"  {name}: {'would tag' if args.dry_run else 'tagged'} {tagged}, already current {current}")
+
+    log.info(f"Done: {total_tagged} points {'to tag' if args.dry_run else 'tagged'}, {errors} collection errors")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Backfill script to add BM25 sparse vectors to existing collections.
+
+Collections created since hybrid retrieval was introduced store a ``bm25``
+sparse vector next to the dense embedding of every chunk (see
+``app.services.sparse``).  Older collections only have the dense vector and
+are searched densely until this script migrates them.  No embeddings are
+recomputed.
+
+Qdrant cannot add a new named sparse vector to an existing collection, so a
+dense-only collection ``NAME`` is migrated by copying:
+
+1. create ``NAME__bm25`` with the same dense vector config plus the sparse
+   vector, and the same payload indexes;
+2. copy every point (id, dense vector, payload) with a sparse vector
+   computed from its stored ``text``;
+3. check that both collections hold the same number of points;
+4. drop ``NAME`` and create the alias ``NAME`` -> ``NAME__bm25``.
+
+Searches, ingestion and the catalog address the collection by its old name
+through the alias.  Stop the ingestion workers while migrating: points
+written to ``NAME`` during the copy would be missing from the new
+collection (the count check then fails and ``NAME`` is left untouched).
+Between the drop and the alias in step 4, searches of ``NAME`` fail for a moment
+and are skipped like any failed collection search.
+
+Collections that already have the sparse vector (including migrated ones)
+have their sparse vectors rewritten in place, which is harmless (and needed
+after changing the tokenizer or weighting in ``app.services.sparse``).  The
+catalog picks up the change on its next refresh.
+
+Usage:
+    python -m app.scripts.backfill_sparse_vectors [--dry-run] [--collection COLLECTION_NAME]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import (
+    CreateAlias, CreateAliasOperation, PointStruct, PointVectors, SparseVectorParams,
+)
+from app.services import clients
+from app.services.catalog import collection_names
+from app.services.ingestion import ensure_tag_indexes
+from app.services.sparse import SPARSE_VECTOR_NAME, document_vector
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+MIGRATED_SUFFIX = "__bm25"
+BATCH_SIZE = 256
+
+
+def _scroll(client: QdrantClient, collection_name: str, with_payload, with_vectors: bool):
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=BATCH_SIZE,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=with_vectors,
+        )
+        yield points
+        if offset is None:
+            break
+
+
+def rewrite_sparse_vectors(client: QdrantClient, collection_name: str, dry_run: bool) -> tuple[int, int]:
+    """Recompute the sparse vectors of a collection that already has the config.
+    Returns (updated, skipped) where skipped points have no usable text."""
+    updated = 0
+    skipped = 0
+    for points in _scroll(client, collection_name, ["text"], False):
+        batch = []
+        for p in points:
+            sv = document_vector((p.payload or {}).get("text", ""))
+            if sv is None:
+                skipped += 1
+                continue
+            batch.append(PointVectors(id=p.id, vector={SPARSE_VECTOR_NAME: sv}))
+        if batch and not dry_run:
+            client.update_vectors(collection_name=collection_name, points=batch)
+        updated += len(batch)
+    return updated, skipped
+
+
+def migrate_collection(client: QdrantClient, collection_name: str, dry_run: bool) -> tuple[int, int]:
+    """Copy a dense-only collection into a new one with the sparse vector and
+    put the new one behind an alias with the old name.
+    Returns (copied, skipped) where skipped points got no sparse vector."""
+    info = client.get_collection(collection_name)
+    if dry_run:
+        total = client.count(collection_name, exact=True).count
+        log.info(f"  {collection_name}: would migrate {total} points to {collection_name}{MIGRATED_SUFFIX}")
+        return total, 0
+
+    target = f"{collection_name}{MIGRATED_SUFFIX}"
+    if client.collection_exists(target):
+        # Left over from an interrupted run; the alias was never created
+        client.delete_collection(target)
+    client.create_collection(
+        collection_name=target,
+        vectors_config=info.config.params.vectors,
+        sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams()},
+    )
+    for field, schema in (info.payload_schema or {}).items():
+        client.create_payload_index(collection_name=target, field_name=field, field_schema=schema.params or schema.data_type)
+    ensure_tag_indexes(client, target)
+
+    copied = 0
+    skipped = 0
+    for points in _scroll(client, collection_name, True, True):
+        batch = []
+        for p in points:
+            vector = p.vector if isinstance(p.vector, dict) else {"": p.vector}
+            sv = document_vector((p.payload or {}).get("text", ""))
+            if sv is None:
+                skipped += 1
+            else:
+                vector = {**vector, SPARSE_VECTOR_NAME: sv}
+            batch.append(PointStruct(id=p.id, vector=vector, payload=p.payload or {}))
+        if batch:
+            client.upsert(collection_name=target, points=batch, wait=True)
+        copied += len(batch)
+
+    source_count = client.count(collection_name, exact=True).count
+    target_count = client.count(target, exact=True).count
+    if source_count != target_count:
+        raise RuntimeError(
+            f"{target} has {target_count} points but {collection_name} has {source_count}; "
+            f"was it written to during the copy? {collection_name} was left unchanged"
+        )
+
+    client.delete_collection(collection_name)
+    client.update_collection_aliases(change_aliases_operations=[
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=collection_name)),
+    ])
+    log.info(f"  {collection_name}: now an alias of {target}")
+    return copied, skipped
+
+
+def backfill_collection(client: QdrantClient, collection_name: str, dry_run: bool) -> tuple[int, int]:
+    """Give every point in one collection a sparse vector, migrating the
+    collection first if it has no sparse vector config."""
+    info = client.get_collection(collection_name)
+    if SPARSE_VECTOR_NAME not in (info.config.params.sparse_vectors or {}):
+        return migrate_collection(client, collection_name, dry_run)
+    return rewrite_sparse_vectors(client, collection_name, dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add BM25 sparse vectors to existing Qdrant collections"
+    )
+    parser.add_argument('--dry-run', action='store_true', help='Count points without writing')
+    parser.add_argument('--collection', type=str, help='Only backfill this collection')
+    args = parser.parse_args()
+
+    client = clients.qdrant()
+    if args.collection:
+        collections = [args.collection]
+    else:
+        collections = collection_names(client)
+
+    log.info(f"Backfilling sparse vectors in {len(collections)} collection(s)"
+             + (" [DRY RUN]" if args.dry_run else ""))
+
+    total_updated = 0
+    errors = 0
+    for name in collections:
+        try:
+            updated, skipped = backfill_collection(client, name, args.dry_run)
+        except Exception as e:
+            log.error(f"  {name}: failed: {e}")
+            errors += 1
+            continue
+        total_updated += updated
+        log.info(f"  {name}: {'would update' if args.dry_run else 'updated'} {updated}, skipped {skipped} without text")
+
+    log.info(f"Done: {total_updated} points {'to update' if args.dry_run else 'updated'}, {errors} collection errors")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
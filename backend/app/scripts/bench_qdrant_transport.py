@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark Qdrant search over REST/JSON, REST with orjson decoding, and gRPC.
+
+Creates temporary collections of synthetic chunks (payloads shaped like
+ingestion's: ~1800 chars of text plus citation metadata) on the Qdrant at
+QDRANT_URL, then runs the retrieval fan-out — one search per collection,
+``asyncio.gather``-ed like ``retrieval.asearch_many`` — through each
+transport, using the same client construction as the app
+(``app.services.clients``).  Per-search and per-fan-out p50/p95/p99 and
+throughput are reported per transport, and written as JSON.
+
+Needs a running Qdrant with both ports reachable, e.g.
+``docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant``.  The benchmark
+collections are dropped afterwards unless ``--keep`` is given.
+
+Usage:
+    python -m app.scripts.bench_qdrant_transport [--collections 12] [--points 2000]
+        [--dim 1536] [--top-k 8] [--rounds 200] [--concurrency 4]
+        [--transports rest-json,rest-orjson,grpc] [--keep]
+        [--output bench_qdrant_transport.json]
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import json
+import logging
+import random
+import subprocess
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import numpy as np
+from qdrant_client.http import models as qmodels
+from app.core.config import settings
+from app.services import clients
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+COLLECTION_PREFIX = "bench_transport_"
+
+# transport name -> (prefer_grpc, orjson_decode)
+TRANSPORTS = {
+    "rest-json": (False, False),
+    "rest-orjson": (False, True),
+    "grpc": (True, True),
+}
+
+_WORDS = (
+    "patient knee brace weight bearing range motion week surgery graft tendon "
+    "rehabilitation exercise protocol quadriceps hamstring ice swelling pain "
+    "crutches physical therapy strength return sport running jumping phase "
+    "precautions incision dressing shower follow visit clinic surgeon"
+).split()
+
+
+def random_vector(rng: np.random.Generator, dim: int) -> list:
+    v = rng.standard_normal(dim).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def make_points(rng: np.random.Generator, collection: str, n: int, dim: int) -> list:
+    word_rng = random.Random(collection)
+    points = []
+    for i in range(n):
+        text = " ".join(word_rng.choice(_WORDS) for _ in range(280))[:1800]
+        points.append(qmodels.PointStruct(
+            id=i + 1,
+            vector=random_vector(rng, dim),
+            payload={
+                "document_id": f"uploads/{collection}/doc_{i // 40}.pdf",
+                "source_type": "PROTOCOL",
+                "page": 1 + (i % 40) // 3,
+                "text": text,
+                "title": f"Synthetic protocol {i // 40}",
+                "author": None,
+                "publication_year": 2024,
+                "chunk_index": i % 40,
+                "original_filename": f"doc_{i // 40}.pdf",
+                "body_parts": ["knee"],
+                "procedures": ["acl"],
+            },
+        ))
+    return points
+
+
+def seed(names: list, args) -> None:
+    cli = clients.new_qdrant(prefer_grpc=False)
+    rng = np.random.default_rng(args.seed)
+    for name in names:
+        if cli.collection_exists(name):
+            cli.delete_collection(name)
+        cli.create_collection(name, vectors_config=qmodels.VectorParams(size=args.dim, distance=qmodels.Distance.COSINE))
+        points = make_points(rng, name, args.points, args.dim)
+        for start in range(0, len(points), 256):
+            cli.upsert(name, points=points[start:start + 256], wait=True)
+        log.info(f"  {name}: {len(points)} points")
+    cli.close()
+
+
+def drop(names: list) -> None:
+    cli = clients.new_qdrant(prefer_grpc=False)
+    for name in names:
+        cli.delete_collection(name)
+    cli.close()
+
+
+async def run_transport(transport: str, names: list, queries: list, args) -> dict:
+    prefer_grpc, orjson_decode = TRANSPORTS[transport]
+    cli = clients.new_async_qdrant(prefer_grpc=prefer_grpc, orjson_decode=orjson_decode)
+    search_ms = []
+    fanout_ms = []
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def _search(name: str, vector: list):
+        t = time.perf_counter()
+        hits = await cli.search(collection_name=name, query_vector=vector, limit=args.top_k, with_payload=True)
+        search_ms.append((time.perf_counter() - t) * 1000)
+        return hits
+
+    async def _fanout(vector: list):
+        async with sem:
+            t = time.perf_counter()
+            results = await asyncio.gather(*(_search(name, vector) for name in names))
+            fanout_ms.append((time.perf_counter() - t) * 1000)
+            return sum(len(r) for r in results)
+
+    try:
+        # Warm-up opens the connections / channel
+        await asyncio.gather(*(_fanout(v) for v in queries[:args.warmup]))
+        search_ms.clear()
+        fanout_ms.clear()
+        t = time.perf_counter()
+        hits = await asyncio.gather(*(_fanout(v) for v in queries[args.warmup:]))
+        wall = time.perf_counter() - t
+    finally:
+        await cli.close()
+
+    return {
+        "search": summarize(search_ms),
+        "fanout": summarize(fanout_ms),
+        "fanouts_per_s": round(len(fanout_ms) / wall, 2),
+        "hits_per_fanout": round(float(np.mean(hits)), 1),
+    }
+
+
+def summarize(values: list) -> dict:
+    return {
+        "mean_ms": round(float(np.mean(values)), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Qdrant REST and gRPC search latency")
+    parser.add_argument('--collections', type=int, default=12, help='Collections searched per fan-out')
+    parser.add_argument('--points', type=int, default=2000, help='Points per collection')
+    parser.add_argument('--dim', type=int, default=1536, help='Vector dimension')
+    parser.add_argument('--top-k', type=int, default=8, help='Hits per search (with full payloads)')
+    parser.add_argument('--rounds', type=int, default=200, help='Measured fan-outs per transport')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured fan-outs per transport')
+    parser.add_argument('--concurrency', type=int, default=4, help='Fan-outs in flight')
+    parser.add_argument('--transports', type=str, default=",".join(TRANSPORTS),
+                        help='Comma-separated subset of ' + ", ".join(TRANSPORTS))
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark collections')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='bench_qdrant_transport.json', help='JSON results file')
+    args = parser.parse_args()
+
+    transports = [t.strip() for t in args.transports.split(",") if t.strip()]
+    unknown = [t for t in transports if t not in TRANSPORTS]
+    if unknown:
+        parser.error(f"unknown transport(s): {', '.join(unknown)}")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    names = [f"{COLLECTION_PREFIX}{i}" for i in range(args.collections)]
+    log.info(f"Seeding {len(names)} collections on {settings.qdrant_url}")
+    seed(names, args)
+
+    rng = np.random.default_rng(args.seed + 1)
+    queries = [random_vector(rng, args.dim) for _ in range(args.warmup + args.rounds)]
+    results = {}
+    try:
+        for transport in transports:
+            results[transport] = asyncio.run(run_transport(transport, names, queries, args))
+    finally:
+        if not args.keep:
+            drop(names)
+
+    log.info(f"{'transport':<14}{'search p50':>12}{'p95':>10}{'fan-out p50':>13}{'p95':>10}{'fan-outs/s':>12}")
+    for transport, r in results.items():
+        log.info(f"{transport:<14}{r['search']['p50_ms']:>12.2f}{r['search']['p95_ms']:>10.2f}"
+                 f"{r['fanout']['p50_ms']:>13.2f}{r['fanout']['p95_ms']:>10.2f}{r['fanouts_per_s']:>12.1f}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "qdrant_url": settings.qdrant_url,
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "transports": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    log.info(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
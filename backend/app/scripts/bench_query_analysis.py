@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compiled query analysis vs. the per-keyword scans it replaced.
+
+For every question the legacy pipeline ran the emergency guardrail,
+body-part detection (twice: collection filter and hit filter), procedure
+detection, the post-op/treatment check (twice: clarification and prompt
+selection) and the clarification tables, each as a linear ``kw in text``
+scan.  The new path is one ``analyze_query`` call.  Title-level work (body
+part, procedure and generic checks per retrieved hit) is compared as well.
+
+Questions come from the question_logs table (DATABASE_URL), falling back to
+a small built-in sample when it is empty.  Results of both paths are
+compared for every input; any mismatch is reported.
+
+Usage:
+    python -m app.scripts.bench_query_analysis [--limit 5000] [--repeat 20]
+"""
+
+import os
+import sys
+import argparse
+import logging
+import statistics
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.services.query_analysis import (
+    EMERGENCY_KEYWORDS,
+    GENERIC_DOC_PATTERNS,
+    POSTOP_SIGNALS,
+    PROCEDURE_CLARIFICATIONS,
+    PROCEDURE_INDICATORS,
+    QUERY_BODY_PART_KEYWORDS,
+    TREATMENT_INQUIRY_SIGNALS,
+    analyze_query,
+    analyze_title,
+    hit_procedures,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+SAMPLE_QUESTIONS = [
+    "When can I start driving after ACL reconstruction?",
+    "I had a meniscus root repair 3 weeks ago, can I bear weight?",
+    "How do you treat a partial rotator cuff tear?",
+    "What is the rehab protocol after hip arthroscopy for FAI?",
+    "I just had a total knee replacement, how long until I can walk without crutches?",
+    "Is surgery necessary for a UCL tear in a pitcher?",
+    "What are the weight bearing restrictions after reverse total shoulder arthroplasty?",
+    "My sling is uncomfortable after my surgery, when can I take it off?",
+    "Can PRP injection help with tennis elbow epicondylitis?",
+    "I had chest pain after surgery",
+    "What exercises for lumbar disc herniation?",
+    "ACL reconstruction with hamstring autograft 6 weeks post-op, when can I run?",
+]
+
+SAMPLE_TITLES = [
+    "ACL Reconstruction Protocol",
+    "Chahla ACL Meniscus Protocol",
+    "Meniscus Root Repair Rehabilitation",
+    "Hip Arthroscopy Post-Operative Guidelines",
+    "Total Hip Arthroplasty Precautions",
+    "Rotator Cuff Repair Protocol",
+    "Reverse Total Shoulder Rehab",
+    "UCL Reconstruction (Tommy John) Return to Throwing",
+    "Surgical Booklet",
+    "Patient Handbook - General Information",
+    "Randomized Trial of Early vs Delayed Weight Bearing",
+    "Achilles Tendon Repair Protocol",
+]
+
+
+# ---------------------------------------------------------------------------
+# Legacy implementations (as they were in app/routers/rag.py)
+# ---------------------------------------------------------------------------
+
+def legacy_body_parts(text: str) -> set:
+    t = text.lower()
+    detected = set()
+    for body_part, keywords in QUERY_BODY_PART_KEYWORDS.items():
+        for kw in keywords:
+            if kw in t:
+                detected.add(body_part)
+                break
+    return detected
+
+
+def legacy_query_procedures(question: str) -> set:
+    q = question.lower()
+    return {p for p, kws in PROCEDURE_INDICATORS.items() if any(kw in q for kw in kws)}
+
+
+def legacy_hit_procedures(title: str, text: str) -> set:
+    procs = legacy_query_procedures(title)
+    if not procs and text:
+        procs = legacy_query_procedures(text[:500])
+    return procs
+
+
+def legacy_is_generic(title: str) -> bool:
+    t = title.lower()
+    return any(pat in t for pat in GENERIC_DOC_PATTERNS)
+
+
+def legacy_is_postop(question: str) -> bool:
+    q_lower = question.lower()
+    has_postop = any(sig in q_lower for sig in POSTOP_SIGNALS)
+    has_treatment = any(sig in q_lower for sig in TREATMENT_INQUIRY_SIGNALS)
+    if has_treatment and not has_postop:
+        return False
+    return has_postop
+
+
+def legacy_clarifying(question: str):
+    q_lower = question.lower()
+    if not legacy_is_postop(question):
+        return None
+    for proc in PROCEDURE_CLARIFICATIONS:
+        if not any(kw in q_lower for kw in proc["keywords"]):
+            continue
+        satisfied = sum(
+            1 for kws in proc["detail_categories"].values()
+            if any(dk in q_lower for dk in kws)
+        )
+        if satisfied < proc["categories_needed"]:
+            return proc["questions"]
+    return None
+
+
+def legacy_question(q: str) -> tuple:
+    ql = q.lower()
+    emergency = any(x in ql for x in EMERGENCY_KEYWORDS)
+    clarifying = legacy_clarifying(q)                # post-op check #1
+    parts = legacy_body_parts(q)                     # collection filter
+    parts_again = legacy_body_parts(q)               # hit filter
+    procs = legacy_query_procedures(q)
+    postop = legacy_is_postop(q)                     # post-op check #2 (prompt)
+    assert parts == parts_again
+    return emergency, clarifying, frozenset(parts), frozenset(procs), postop
+
+
+def new_question(q: str) -> tuple:
+    a = analyze_query(q)
+    return a.emergency, a.clarifying_questions(), a.body_parts, a.procedures, a.is_postop_or_recovery
+
+
+def legacy_title(title: str) -> tuple:
+    return frozenset(legacy_body_parts(title)), frozenset(legacy_hit_procedures(title, "")), legacy_is_generic(title)
+
+
+def new_title(title: str) -> tuple:
+    t = analyze_title(title)
+    return t.body_parts, hit_procedures(title, ""), t.generic
+
+
+# ---------------------------------------------------------------------------
+
+def load_questions(limit: int) -> list:
+    try:
+        from app.core.database import SessionLocal
+        from app.models.question_log import QuestionLog
+        db = SessionLocal()
+        try:
+            rows = db.query(QuestionLog.question).order_by(QuestionLog.created_at.desc()).limit(limit).all()
+        finally:
+            db.close()
+        questions = [r[0] for r in rows if r[0]]
+    except Exception as e:
+        log.warning(f"Could not read question_logs: {e}")
+        questions = []
+    if not questions:
+        log.info("No logged questions found; using built-in sample questions")
+        questions = SAMPLE_QUESTIONS
+    return questions
+
+
+def bench(fn, inputs: list, repeat: int) -> list:
+    """Per-input times in microseconds (best of ``repeat`` passes)."""
+    best = [float("inf")] * len(inputs)
+    for _ in range(repeat):
+        for i, x in enumerate(inputs):
+            t = time.perf_counter()
+            fn(x)
+            best[i] = min(best[i], (time.perf_counter() - t) * 1e6)
+    return best
+
+
+def report(name: str, legacy: list, new: list) -> None:
+    def pct(v, p):
+        return sorted(v)[min(len(v) - 1, int(len(v) * p))]
+    log.info(
+        f"{name}: n={len(legacy)}  "
+        f"legacy p50={statistics.median(legacy):.1f}us p95={pct(legacy, 0.95):.1f}us  "
+        f"new p50={statistics.median(new):.1f}us p95={pct(new, 0.95):.1f}us  "
+        f"speedup={sum(legacy) / max(sum(new), 1e-9):.2f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compiled query analysis against the legacy keyword scans")
+    parser.add_argument('--limit', type=int, default=5000, help='Max logged questions to load')
+    parser.add_argument('--repeat', type=int, default=20, help='Passes per input (best time is kept)')
+    args = parser.parse_args()
+
+    questions = load_questions(args.limit)
+    titles = SAMPLE_TITLES
+
+    mismatches = 0
+    for q in questions:
+        if legacy_question(q) != new_question(q):
+            mismatches += 1
+            log.error(f"Mismatch for question: {q!r}: {legacy_question(q)} != {new_question(q)}")
+    for t in titles:
+        if legacy_title(t) != new_title(t):
+            mismatches += 1
+            log.error(f"Mismatch for title: {t!r}: {legacy_title(t)} != {new_title(t)}")
+
+    report("question", bench(legacy_question, questions, args.repeat), bench(new_question, questions, args.repeat))
+    # Titles: analyze_title is cached, so time both the cold (first) and warm path
+    analyze_title.cache_clear()
+    report("title (cold)", bench(legacy_title, titles, 1), bench(new_title, titles, 1))
+    report("title (warm)", bench(legacy_title, titles, args.repeat), bench(new_title, titles, args.repeat))
+
+    if mismatches:
+        log.error(f"{mismatches} mismatches between legacy and compiled analysis")
+        sys.exit(1)
+    log.info("Legacy and compiled analysis agree on every input")
+
+
+if __name__ == "__main__":
+    main()
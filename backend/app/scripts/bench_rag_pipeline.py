@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of ``rag_query`` with local stand-ins for every remote
+service.
+
+- Qdrant runs in local in-memory mode, seeded with a synthetic corpus shaped
+  like production: every collection in COLLECTION_PERMISSIONS plus
+  ``dr_{doctor}_{topic}`` protocol collections per doctor.  Chunks carry the
+  same payload, tags and sparse vectors that ingestion writes.
+- Embeddings come from a deterministic feature-hashing embedder, so similar
+  texts get similar vectors and runs are reproducible.
+- Claude is a fake async client that sleeps ``--llm-latency-ms`` and cites
+  the first few sources, so citation renumbering runs as usual.
+- Question logging goes to a throwaway SQLite database.
+
+Everything else — routing, guardrails, collection and hit filters, tiered
+ranking, consolidation, context packing, prompt assembly, citations — is the
+real code in ``app.routers.rag``.  Stage times come from the pipeline's own
+stage timer (``app.core.timing``, the same numbers as the ``rag_query`` log
+event and Server-Timing header); p50/p95/p99 per stage plus throughput are
+reported.
+Results are written as JSON; pass ``--baseline`` with an earlier file to see
+per-stage deltas.  If any collection search fails or times out, or no answer
+cites anything, the run exits with status 1 and writes no results: timings
+of a pipeline that retrieved nothing are not a benchmark.
+
+The answer and embedding caches are disabled unless ``--with-caches`` is
+given, so every request runs the full pipeline.
+
+Usage:
+    python -m app.scripts.bench_rag_pipeline [--requests 200] [--concurrency 8]
+        [--llm-latency-ms 0] [--docs-per-collection 4] [--chunks-per-doc 12]
+        [--dim 256] [--dense-only] [--with-caches]
+        [--output bench_rag_pipeline.json] [--baseline previous.json]
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import subprocess
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+# Question logging must not touch the real database
+_DB_DIR = tempfile.mkdtemp(prefix="bench_rag_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/bench.db"
+
+import numpy as np
+import structlog
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as qmodels
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core import timing
+from app.core.config import settings
+from app.core.metrics import RAG_COLLECTION_SEARCH_FAILURES
+from app.core.database import SessionLocal, init_db
+from app.models.schemas import QueryRequest
+from app.routers import rag
+from app.services import clients, retrieval
+from app.services.answer_cache import answer_cache
+from app.services.catalog import catalog
+from app.services.ingestion import point_vector
+from app.services.query_analysis import document_tags
+from app.services.sparse import SPARSE_VECTOR_NAME
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+
+TOPICS = {
+    "acl": {
+        "titles": ["ACL Reconstruction Protocol", "ACL Reconstruction with BTB Autograft Rehabilitation",
+                   "ACL Reconstruction Hamstring Autograft Guidelines"],
+        "sentences": [
+            "Weeks 0-2: PWB 0-25% with crutches, brace locked in extension for ambulation.",
+            "Week 6: progress to full weight bearing, discontinue brace once quad control is adequate.",
+            "Begin stationary bike at week 4 with no resistance.",
+            "Straight-running program may begin at 12 weeks if there is no effusion.",
+            "Return to sport testing at 9 months includes hop tests and isokinetic strength.",
+        ],
+        "questions": ["When can I start running after ACL reconstruction?",
+                      "What are the weight bearing restrictions after ACL reconstruction with BTB autograft?",
+                      "When can I stop using the brace after my ACL surgery?"],
+    },
+    "meniscus": {
+        "titles": ["Meniscus Root Repair Rehabilitation", "Meniscectomy Post-Operative Protocol"],
+        "sentences": [
+            "Non-weight bearing for 6 weeks after meniscus root repair.",
+            "Range of motion limited to 0-90 degrees for the first 4 weeks.",
+            "No deep squatting beyond 90 degrees for 4 months.",
+            "Partial meniscectomy patients may bear weight as tolerated immediately.",
+        ],
+        "questions": ["I had a meniscus root repair 3 weeks ago, can I bear weight?",
+                      "How long until I can squat after meniscus repair?"],
+    },
+    "rotator_cuff": {
+        "titles": ["Rotator Cuff Repair Protocol", "Arthroscopic Rotator Cuff Repair Rehabilitation"],
+        "sentences": [
+            "Sling at all times for 6 weeks except for hygiene and exercises.",
+            "Passive range of motion begins at week 1 with pendulums and table slides.",
+            "Active assisted motion starts at week 6; strengthening at week 12.",
+            "No lifting heavier than a coffee cup for 3 months.",
+        ],
+        "questions": ["When can I take off the sling after rotator cuff repair?",
+                      "How do you treat a partial rotator cuff tear?"],
+    },
+    "shoulder_replacement": {
+        "titles": ["Reverse Total Shoulder Arthroplasty Rehab", "Total Shoulder Replacement Precautions"],
+        "sentences": [
+            "No combined extension, adduction and internal rotation for 12 weeks after reverse TSA.",
+            "Sling for 4 weeks, removing it for elbow, wrist and hand motion.",
+            "Driving is permitted once out of the sling and off narcotic pain medication.",
+        ],
+        "questions": ["What are the precautions after reverse total shoulder arthroplasty?"],
+    },
+    "ucl": {
+        "titles": ["UCL Reconstruction (Tommy John) Return to Throwing", "UCL Repair with Internal Brace Protocol"],
+        "sentences": [
+            "Hinged elbow brace 30-100 degrees for the first 4 weeks.",
+            "Interval throwing program begins at 4 months after UCL repair and 9 months after reconstruction.",
+            "Avoid valgus stress to the elbow during early rehabilitation.",
+        ],
+        "questions": ["When can a pitcher start throwing after Tommy John surgery?",
+                      "Is surgery necessary for a UCL tear in a pitcher?"],
+    },
+    "hip": {
+        "titles": ["Hip Arthroscopy Post-Operative Guidelines", "FAI Labral Repair Rehabilitation"],
+        "sentences": [
+            "Foot-flat weight bearing 20 pounds for 2-3 weeks after hip arthroscopy.",
+            "Limit hip flexion to 90 degrees and avoid external rotation for 3 weeks.",
+            "Stationary bike with high seat from day 1.",
+        ],
+        "questions": ["What is the rehab protocol after hip arthroscopy for FAI?"],
+    },
+    "arthroplasty": {
+        "titles": ["Total Knee Arthroplasty Pathway", "Total Hip Arthroplasty Precautions"],
+        "sentences": [
+            "Weight bearing as tolerated with a walker immediately after total knee replacement.",
+            "Posterior hip precautions for 6 weeks: no flexion past 90 degrees.",
+            "VTE prophylaxis with aspirin 81 mg twice daily for 4 weeks.",
+        ],
+        "questions": ["I just had a total knee replacement, how long until I can walk without crutches?"],
+    },
+    "spine": {
+        "titles": ["Lumbar Fusion Recovery Guide", "Cervical Disc Replacement Protocol"],
+        "sentences": [
+            "No bending, lifting over 10 pounds or twisting for 6 weeks after lumbar fusion.",
+            "Walking program beginning day 1, increasing by 5 minutes daily.",
+            "Soft collar for comfort only after cervical disc replacement.",
+        ],
+        "questions": ["What exercises for lumbar disc herniation?"],
+    },
+}
+
+# Collection-name keywords -> topic, for the shared dr_general_* collections
+COLLECTION_TOPICS = [
+    ("shoulder_replacement", "shoulder_replacement"), ("rotator_cuff", "rotator_cuff"), ("shoulder", "rotator_cuff"),
+    ("meniscus", "meniscus"), ("acl", "acl"), ("knee", "acl"), ("ucl", "ucl"), ("elbow", "ucl"),
+    ("hip", "hip"), ("fai", "hip"), ("joints", "arthroplasty"), ("aaos", "arthroplasty"),
+    ("spine", "spine"), ("back", "spine"), ("neck", "spine"),
+]
+
+# Doctor procedure ids -> topic of their own protocol collections
+PROCEDURE_TOPICS = {
+    "acl": "acl", "meniscus": "meniscus", "rotator_cuff": "rotator_cuff", "ucl": "ucl",
+    "hip_arthroscopy": "hip", "total_hip": "arthroplasty", "total_knee": "arthroplasty",
+    "spinal_fusion": "spine", "disc_replacement": "spine",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def hash_embed(text: str, dim: int) -> list:
+    """Deterministic feature-hashing embedding (unigrams and bigrams)."""
+    words = _WORD_RE.findall(text.lower())
+    vec = np.zeros(dim, dtype=np.float32)
+    for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = hashlib.blake2b(term.encode(), digest_size=8).digest()
+        vec[int.from_bytes(h[:4], "little") % dim] += 1.0 if h[4] & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tolist()
+
+
+def corpus_plan() -> dict:
+    """{collection_name: topic} for the synthetic corpus."""
+    plan = {}
+    for name in rag.COLLECTION_PERMISSIONS:
+        topic = next((t for kw, t in COLLECTION_TOPICS if kw in name), None)
+        plan[name] = topic or random.choice(list(TOPICS))
+    for doctor_id, doctor in rag.DOCTORS.items():
+        slug = rag.slugify(doctor_id)
+        topics = [PROCEDURE_TOPICS[p] for p in doctor.get("procedures", []) if p in PROCEDURE_TOPICS]
+        for topic in dict.fromkeys(topics or ["acl"]):
+            plan[f"dr_{slug}_{topic}"] = topic
+    return plan
+
+
+def make_points(collection: str, topic: str, docs: int, chunks: int, dim: int, hybrid: bool) -> list:
+    spec = TOPICS[topic]
+    rng = random.Random(collection)
+    points = []
+    for d in range(docs):
+        title = spec["titles"][d % len(spec["titles"])] + (f" ({d + 1})" if d >= len(spec["titles"]) else "")
+        doc_id = f"uploads/{collection}/{rag.slugify(title)}.pdf"
+        for i in range(chunks):
+            # ~1800 chars, like ingestion chunks, mostly on-topic with some noise
+            sentences = [rng.choice(spec["sentences"]) for _ in range(14)]
+            sentences += [rng.choice(TOPICS[rng.choice(list(TOPICS))]["sentences"]) for _ in range(4)]
+            rng.shuffle(sentences)
+            text = f"{title}. " + " ".join(sentences)
+            payload = {
+                "document_id": doc_id,
+                "source_type": "PROTOCOL",
+                "page": 1 + i // 3,
+                "text": text,
+                "title": title,
+                "author": None,
+                "publication_year": None,
+                "chunk_index": i,
+                "original_filename": f"{title}.pdf",
+                **document_tags(title, text),
+            }
+            points.append(qmodels.PointStruct(
+                id=len(points) + 1,
+                vector=point_vector(hash_embed(text, dim), text, hybrid),
+                payload=payload,
+            ))
+    return points
+
+
+async def seed(sync_client, async_client, plan: dict, args) -> int:
+    sparse = {SPARSE_VECTOR_NAME: qmodels.SparseVectorParams()} if not args.dense_only else None
+    total = 0
+    for name, topic in plan.items():
+        points = make_points(name, topic, args.docs_per_collection, args.chunks_per_doc, args.dim, not args.dense_only)
+        params = qmodels.VectorParams(size=args.dim, distance=qmodels.Distance.COSINE)
+        sync_client.create_collection(name, vectors_config=params, sparse_vectors_config=sparse)
+        await async_client.create_collection(name, vectors_config=params, sparse_vectors_config=sparse)
+        sync_client.upsert(name, points=points)
+        await async_client.upsert(name, points=points)
+        total += len(points)
+    return total
+
+
+def make_queries(n: int) -> list:
+    rng = random.Random(0)
+    doctors = list(rag.DOCTORS)
+    body_parts = ["knee", "shoulder", "elbow", "hip", "back"]
+    questions = [q for spec in TOPICS.values() for q in spec["questions"]]
+    out = []
+    for i in range(n):
+        q = rng.choice(questions)
+        if i % 4 == 3:
+            out.append(QueryRequest(question=q, actor="PATIENT", body_part=rng.choice(body_parts),
+                                    skip_clarification=True))
+        else:
+            out.append(QueryRequest(question=q, actor="PROVIDER", doctor_id=rng.choice(doctors)))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Fakes
+# ---------------------------------------------------------------------------
+
+class FakeEmbeddings:
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    async def create(self, model, input):
+        items = input if isinstance(input, list) else [input]
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=hash_embed(t, self.dim)) for t in items])
+
+
+class FakeMessages:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    async def create(self, **kw):
+        await asyncio.sleep(self.latency_s)
+        prompt = kw["messages"][-1]["content"]
+        sources = sorted({int(n) for n in re.findall(r"\[Source (\d+)", prompt)})[:4]
+        parts = [f"Follow the protocol for this phase (Source {n})." for n in sources[:2]]
+        if len(sources) > 2:
+            parts.append("Progression depends on symptoms (" + ", ".join(f"Source {n}" for n in sources[2:]) + ").")
+        text = " ".join(parts) + "\nFOLLOW_UP_QUESTION: Which graft was used?"
+        return types.SimpleNamespace(content=[types.SimpleNamespace(type="text", text=text)])
+
+
+def install_fakes(sync_client, async_client, args) -> None:
+    clients._instances.update(
+        qdrant=sync_client,
+        async_qdrant=async_client,
+        async_openai=types.SimpleNamespace(embeddings=FakeEmbeddings(args.dim)),
+        async_anthropic=types.SimpleNamespace(messages=FakeMessages(args.llm_latency_ms / 1000)),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Run and report
+# ---------------------------------------------------------------------------
+
+def _request() -> Request:
+    return Request({"type": "http", "scheme": "http", "server": ("bench", 80), "path": "/rag/query",
+                    "root_path": "", "query_string": b"", "headers": []})
+
+
+async def run_one(body: QueryRequest) -> dict:
+    db = SessionLocal()
+    try:
+        answer = await rag.rag_query(body, _request(), Response(), db)
+    finally:
+        db.close()
+    # rag_query installs its stage timer in this task's context
+    timer = timing.current()
+    stages = dict(timer.stages)
+    stages["total"] = timer.elapsed_ms()
+    if timer.collections:
+        stages["search_slowest_collection"] = max(timer.collections.values())
+    stages["_citations"] = len(answer.citations)
+    return stages
+
+
+async def run(queries: list, concurrency: int) -> tuple:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _bounded(body):
+        # gather() runs each request in its own task (and context), so
+        # stage timings of concurrent requests don't mix
+        async with sem:
+            return await run_one(body)
+
+    t = time.perf_counter()
+    results = await asyncio.gather(*(_bounded(b) for b in queries))
+    return results, time.perf_counter() - t
+
+
+def search_failures() -> float:
+    """Collection searches that failed or timed out so far (all reasons)."""
+    return sum(
+        sample.value
+        for metric in RAG_COLLECTION_SEARCH_FAILURES.collect()
+        for sample in metric.samples
+        if sample.name.endswith("_total")
+    )
+
+
+def percentile(values: list, p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def summarize(results: list) -> dict:
+    stages = sorted({k for r in results for k in r if not k.startswith("_")})
+    out = {}
+    for s in stages:
+        v = [r.get(s, 0.0) for r in results]
+        out[s] = {
+            "mean_ms": round(float(np.mean(v)), 3),
+            "p50_ms": round(percentile(v, 50), 3),
+            "p95_ms": round(percentile(v, 95), 3),
+            "p99_ms": round(percentile(v, 99), 3),
+        }
+    return out
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return ""
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    base = (baseline or {}).get("stages", {})
+    log.info(f"{'stage':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}" + ("  p50 vs baseline" if base else ""))
+    for stage, s in report["stages"].items():
+        line = f"{stage:<26}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['mean_ms']:>10.2f}"
+        if stage in base and base[stage]["p50_ms"]:
+            line += f"  {(s['p50_ms'] / base[stage]['p50_ms'] - 1) * 100:+.1f}%"
+        log.info(line)
+    t = report["throughput"]
+    log.info(f"throughput: {t['requests']} requests in {t['wall_s']:.2f}s = {t['qps']:.1f} req/s "
+             f"(concurrency {report['config']['concurrency']})")
+    if baseline:
+        bq = baseline.get("throughput", {}).get("qps")
+        if bq:
+            log.info(f"throughput vs baseline ({baseline.get('commit') or 'unknown commit'}): {(t['qps'] / bq - 1) * 100:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline with local stand-ins")
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured warm-up requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='Simulated Claude latency')
+    parser.add_argument('--docs-per-collection', type=int, default=4)
+    parser.add_argument('--chunks-per-doc', type=int, default=12)
+    parser.add_argument('--dim', type=int, default=256, help='Embedding dimension')
+    parser.add_argument('--dense-only', action='store_true', help='No sparse vectors / hybrid search')
+    parser.add_argument('--with-caches', action='store_true', help='Keep the answer and embedding caches on')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Keep the per-request pipeline logs')
+    parser.add_argument('--output', type=str, default='bench_rag_pipeline.json', help='JSON results file')
+    parser.add_argument('--baseline', type=str, help='Earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if not args.verbose:
+        structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    settings.retrieval_backend = "qdrant"
+    settings.hybrid_search = not args.dense_only
+    if not args.with_caches:
+        answer_cache.max_entries = 0
+        retrieval.embedding_cache.max_bytes = 0
+
+    init_db()
+    sync_client = QdrantClient(":memory:")
+    async_client = AsyncQdrantClient(":memory:")
+    install_fakes(sync_client, async_client, args)
+
+    plan = corpus_plan()
+    t = time.perf_counter()
+    points = asyncio.run(seed(sync_client, async_client, plan, args))
+    log.info(f"Seeded {len(plan)} collections, {points} points in {time.perf_counter() - t:.1f}s")
+    catalog.refresh()
+    rag.routing.rebuild()
+
+    async def _main():
+        await run(make_queries(args.warmup), args.concurrency)
+        return await run(make_queries(args.requests), args.concurrency)
+
+    failures_before = search_failures()
+    results, wall = asyncio.run(_main())
+    failed_searches = search_failures() - failures_before
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "corpus": {"collections": len(plan), "points": points},
+        "stages": summarize(results),
+        "throughput": {"requests": len(results), "wall_s": round(wall, 3), "qps": round(len(results) / wall, 2)},
+        "citations_per_answer": round(float(np.mean([r["_citations"] for r in results])), 2),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if failed_searches or report["citations_per_answer"] == 0:
+        log.error(f"Retrieval is broken: {failed_searches:.0f} collection searches failed or timed out, "
+                  f"{report['citations_per_answer']} citations per answer (rerun with --verbose for the "
+                  f"collection_search_failed logs); no results written")
+        sys.exit(1)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    log.info(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Export Qdrant collections to memory-mapped snapshots for the local index.
+
+Each collection's dense vectors, point ids and payloads are written under
+LOCAL_INDEX_DIR (see ``app.services.local_index`` for the file layout).
+With ``RETRIEVAL_BACKEND=local`` the API searches these snapshots instead
+of Qdrant; with ``RETRIEVAL_BACKEND=auto`` they are used for collections
+whose Qdrant search fails.
+
+Snapshots are point-in-time copies: re-run the export after ingesting new
+documents.  An existing snapshot is replaced only once the new one is
+complete.
+
+Usage:
+    python -m app.scripts.export_local_index [--collection COLLECTION_NAME] [--out-dir DIR]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.core.config import settings
+from app.services import clients
+from app.services.catalog import collection_names
+from app.services.local_index import export_collection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+log = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export Qdrant collections to local memory-mapped snapshots"
+    )
+    parser.add_argument('--collection', type=str, help='Only export this collection')
+    parser.add_argument('--out-dir', type=str, default=settings.local_index_dir,
+                        help='Snapshot directory (default: LOCAL_INDEX_DIR)')
+    args = parser.parse_args()
+
+    client = clients.qdrant()
+    if args.collection:
+        collections = [args.collection]
+    else:
+        collections = collection_names(client)
+
+    log.info(f"Exporting {len(collections)} collection(s) to {args.out_dir}")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    total = 0
+    errors = 0
+    for name in collections:
+        try:
+            manifest = export_collection(client, name, args.out_dir)
+        except Exception as e:
+            log.error(f"  {name}: failed: {e}")
+            errors += 1
+            continue
+        total += manifest["count"]
+        log.info(f"  {name}: {manifest['count']} points, dim {manifest['dim']}")
+
+    log.info(f"Done: {total} points exported, {errors} collection errors")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,10 +23,9 @@ from typing import Dict, Set, Tuple, Optional
 # Add parent directory to path to allow imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-import boto3
-from botocore.config import Config as BotoConfig
 from qdrant_client import QdrantClient
 from app.core.config import settings
+from app.services import clients
 from app.services.ingestion import _extract_metadata
 
 logging.basicConfig(
@@ -36,20 +35,9 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
-def get_s3_client():
-    return boto3.client("s3", region_name=settings.aws_region, config=BotoConfig(retries={"max_attempts": 3}))
-
-
-def get_qdrant_client():
-    kw = dict(url=settings.qdrant_url, timeout=90)
-    if settings.qdrant_api_key:
-        kw["api_key"] = settings.qdrant_api_key
-    return QdrantClient(**kw)
-
-
 def download_pdf(bucket: str, key: str) -> str:
     """Download PDF from S3 to temporary file."""
-    s3 = get_s3_client()
+    s3 = clients.s3()
     fd, path = tempfile.mkstemp(prefix="migrate-", suffix=".pdf")
     os.close(fd)
 
@@ -211,7 +199,7 @@ def main():
     log.info(f"S3 Bucket: {settings.s3_bucket}")
     log.info(f"Dry run: {args.dry_run}")
 
-    client = get_qdrant_client()
+    client = clients.qdrant()
     bucket = settings.s3_bucket
 
     # Get all collections
@@ -24,6 +24,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 from qdrant_client import QdrantClient
 from app.core.config import settings
+from app.services import clients
 from app.services.ingestion import DOCTOR_SLUG_TO_NAME, _RESEARCH_SOURCE_TYPES
 
 logging.basicConfig(
@@ -33,13 +34,6 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 
-def get_qdrant_client():
-    kw = dict(url=settings.qdrant_url, timeout=90)
-    if settings.qdrant_api_key:
-        kw["api_key"] = settings.qdrant_api_key
-    return QdrantClient(**kw)
-
-
 def doctor_name_for_collection(collection_name: str) -> str | None:
     """Return the doctor display name if the collection is doctor-specific."""
     if not collection_name.startswith("dr_") or collection_name.startswith("dr_general_"):
@@ -131,7 +125,7 @@ def main():
     log.info(f"  Qdrant: {settings.qdrant_url}")
     log.info(f"  Dry run: {args.dry_run}")
 
-    client = get_qdrant_client()
+    client = clients.qdrant()
 
     if args.collection:
         collections = [args.collection]
@@ -0,0 +1,146 @@
+"""In-process cache of generated RAG answers.
+
+For a given scope (doctor or body part), actor and question, the retrieved
+context and the temperature-0 Claude answer are nearly always identical, so
+repeats are served from here instead of paying for another generation.
+
+Lookups are exact on the normalized question first; optionally a question
+whose embedding is within ``settings.answer_cache_similarity`` (cosine) of a
+cached one in the same scope/actor is also treated as a hit.
+
+Every entry records the catalog generation of each collection that was
+searched to produce it.  Re-ingesting any of those collections bumps its
+generation (see ``catalog.mark_changed``) and the entry stops matching.
+Lookups pass the collections the question would search now, so an entry
+also stops matching when a collection joins or leaves the route (e.g. a
+surgeon's first upload to a new collection).
+
+Citation ``document_url``s are stored relative to the API base; callers add
+the base of the request being served.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.catalog import catalog
+
+CacheKey = Tuple[str, str, str]
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    citations: list
+    follow_up_question: Optional[str]
+    generations: Dict[str, int]
+    vector: Optional[np.ndarray] = None
+    stored_at: float = field(default_factory=time.monotonic)
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[CacheKey, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(scope: str, actor: str, question: str) -> CacheKey:
+        return (scope, actor, " ".join(question.split()).casefold())
+
+    def _valid(self, entry: CachedAnswer, collections: frozenset) -> bool:
+        if time.monotonic() - entry.stored_at > self.ttl_seconds:
+            return False
+        if entry.generations.keys() != collections:
+            return False
+        return all(
+            catalog.generation(name) == gen for name, gen in entry.generations.items()
+        )
+
+    def get(self, key: CacheKey, collections: Iterable[str]) -> Optional[CachedAnswer]:
+        """Exact lookup on (scope, actor, normalized question), valid only if
+        it was answered from exactly ``collections``."""
+        collections = frozenset(collections)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._valid(entry, collections):
+                del self._entries[key]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def find_similar(self, key: CacheKey, vector: List[float],
+                     collections: Iterable[str]) -> Optional[CachedAnswer]:
+        """Best valid entry in the same scope/actor whose question embedding
+        is at least ``similarity`` cosine-similar to ``vector``.  Disabled
+        when the threshold is 0."""
+        collections = frozenset(collections)
+        if self.similarity <= 0:
+            with self._lock:
+                self.misses += 1
+            return None
+        q = _unit(vector)
+        best_key, best_score = None, self.similarity
+        with self._lock:
+            for k, entry in self._entries.items():
+                if k[:2] != key[:2] or entry.vector is None:
+                    continue
+                score = float(np.dot(q, entry.vector))
+                if score >= best_score and self._valid(entry, collections):
+                    best_key, best_score = k, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key]
+
+    def put(self, key: CacheKey, entry: CachedAnswer, vector: Optional[List[float]] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        if vector is not None:
+            entry.vector = _unit(vector)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.answer_cache_max_entries,
+    ttl_seconds=settings.answer_cache_ttl_seconds,
+    similarity=settings.answer_cache_similarity,
+)
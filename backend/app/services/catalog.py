@@ -0,0 +1,216 @@
+"""Process-wide cache of the Qdrant collection catalog.
+
+Collection routing needs to know which collections exist (``dr_{slug}_*``
+prefixes, ``dr_general_*`` keyword matches).  Asking Qdrant for that on
+every request costs a ``get_collections`` round trip per query, so the
+catalog is loaded once at startup, refreshed in the background when it is
+older than ``settings.catalog_ttl_seconds``, and marked stale by the
+ingestion path whenever it creates or changes a collection.
+
+Each collection also carries a *generation* counter.  It is bumped when the
+collection is (re)ingested or its point count changes between refreshes,
+so caches built on top of search results can tell when they are stale.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.services import clients, local_index
+from app.services.sparse import SPARSE_VECTOR_NAME
+
+
+@dataclass(frozen=True)
+class CollectionInfo:
+    name: str
+    points_count: Optional[int] = None
+    vector_size: Optional[int] = None
+    distance: Optional[str] = None
+    # Stores the BM25 sparse vector used for hybrid search
+    sparse: bool = False
+
+
+def _describe(c, name: str) -> CollectionInfo:
+    info = c.get_collection(name)
+    vectors = info.config.params.vectors
+    # Unnamed collections expose VectorParams directly; named ones a dict.
+    if isinstance(vectors, dict):
+        vectors = vectors.get("") or next(iter(vectors.values()), None)
+    return CollectionInfo(
+        name=name,
+        points_count=info.points_count,
+        vector_size=getattr(vectors, "size", None),
+        distance=str(getattr(vectors, "distance", "") or "") or None,
+        sparse=SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {}),
+    )
+
+
+def collection_names(c) -> List[str]:
+    """Collection names as the app addresses them.
+
+    A collection migrated by ``app.scripts.backfill_sparse_vectors`` lives
+    on under an alias with its old name; the alias is listed instead of the
+    collection it points to.
+    """
+    aliases = {a.alias_name: a.collection_name for a in c.get_aliases().aliases}
+    targets = set(aliases.values())
+    names = [col.name for col in c.get_collections().collections if col.name not in targets]
+    return names + sorted(aliases)
+
+
+def _load_local() -> Dict[str, CollectionInfo]:
+    return {
+        m["collection"]: CollectionInfo(
+            name=m["collection"], points_count=m["count"], vector_size=m["dim"], distance=m["distance"],
+        )
+        for m in local_index.manifests()
+    }
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class CollectionCatalog:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._lock = threading.Lock()
+        self._collections: Dict[str, CollectionInfo] = {}
+        self._generations: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._stale = False
+        self._refreshing = False
+
+    # -- loading -----------------------------------------------------------
+
+    def _load_qdrant(self) -> Dict[str, CollectionInfo]:
+        c = clients.qdrant()
+        names = collection_names(c)
+        fresh: Dict[str, CollectionInfo] = {}
+        for name in names:
+            try:
+                fresh[name] = _describe(c, name)
+            except Exception as e:
+                logger.warning("catalog_describe_failed", collection=name, error=str(e))
+                fresh[name] = CollectionInfo(name=name)
+        return fresh
+
+    def refresh(self) -> None:
+        """Reload the catalog (blocking).
+
+        Reads Qdrant, or the local snapshots when
+        ``settings.retrieval_backend`` is ``local`` — and also when it is
+        ``auto`` and Qdrant cannot be reached.
+        """
+        if settings.retrieval_backend == "local":
+            fresh = _load_local()
+        else:
+            try:
+                fresh = self._load_qdrant()
+            except Exception as e:
+                local = _load_local() if settings.retrieval_backend == "auto" else {}
+                if not local:
+                    raise
+                logger.warning("catalog_local_fallback", collections=len(local), error=str(e))
+                fresh = local
+
+        with self._lock:
+            changed = set(fresh) ^ set(self._collections)
+            for name, info in fresh.items():
+                old = self._collections.get(name)
+                if old is not None and old.points_count != info.points_count:
+                    changed.add(name)
+            for name in changed:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            if changed or self._loaded_at is None:
+                self.version += 1
+            self._collections = fresh
+            self._loaded_at = time.monotonic()
+            self._stale = False
+        logger.info("catalog_refreshed", collections=len(fresh), changed=sorted(changed))
+
+    def warm(self) -> None:
+        """Load the catalog at startup.  Non-fatal if Qdrant is unreachable."""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("catalog_warm_failed", error=str(e))
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("catalog_refresh_failed", error=str(e))
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=_run, name="catalog-refresh", daemon=True).start()
+
+    def _current(self) -> Dict[str, CollectionInfo]:
+        """Return the current snapshot, loading or refreshing as needed.
+
+        A stale catalog keeps serving while it refreshes in the background.
+        If nothing has been loaded yet (the startup warm failed), the first
+        load blocks only for synchronous callers (threadpool, worker,
+        scripts); on the event loop thread it runs in the background and
+        the empty snapshot is served meanwhile, so async handlers never wait
+        on Qdrant.
+        """
+        if self._loaded_at is None and not _on_event_loop():
+            self.refresh()
+        elif self._loaded_at is None or self._stale or time.monotonic() - self._loaded_at > self.ttl_seconds:
+            self._refresh_in_background()
+        return self._collections
+
+    # -- lookups -----------------------------------------------------------
+
+    def names(self) -> List[str]:
+        return list(self._current())
+
+    def get(self, name: str) -> Optional[CollectionInfo]:
+        return self._current().get(name)
+
+    def contains(self, name: str) -> bool:
+        return name in self._current()
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        return [name for name in self._current() if name.startswith(prefix)]
+
+    def generation(self, name: str) -> int:
+        return self._generations.get(name, 0)
+
+    # -- invalidation ------------------------------------------------------
+
+    def mark_changed(self, name: str) -> None:
+        """Record that ``name`` was created or re-ingested.
+
+        The collection becomes known immediately (so it is searchable before
+        the next refresh), its generation is bumped, and the rest of the
+        catalog is refreshed in the background on next access.
+        """
+        with self._lock:
+            if name not in self._collections:
+                self._collections = {**self._collections, name: CollectionInfo(name=name)}
+            self._generations[name] = self._generations.get(name, 0) + 1
+            self.version += 1
+            self._stale = True
+        logger.info("catalog_collection_changed", collection=name)
+
+
+catalog = CollectionCatalog(ttl_seconds=settings.catalog_ttl_seconds)
@@ -0,0 +1,192 @@
+"""Shared clients for Qdrant, S3, OpenAI and Anthropic.
+
+Every part of the backend (retrieval, ingestion, S3 uploads, the routers
+and the maintenance scripts) gets its clients from here instead of
+constructing its own.  Each client is created once per process and keeps
+a pooled, keep-alive HTTP connection pool, so requests reuse warm TLS
+connections instead of paying a handshake each time.
+
+All clients are thread-safe.  The async ones are created on first use
+from the event loop (see :func:`warm`, run at app startup).
+
+Pool sizes are set with HTTP_POOL_MAX_CONNECTIONS,
+HTTP_POOL_MAX_KEEPALIVE and HTTP_KEEPALIVE_SECONDS.  Qdrant is reached
+over REST (responses decoded with orjson) or, with QDRANT_PREFER_GRPC,
+over a single keep-alive gRPC channel per client; compare the two with
+``app/scripts/bench_qdrant_transport.py``.
+"""
+
+import threading
+from typing import Callable, Dict, Optional, TypeVar
+
+import boto3
+import httpx
+import orjson
+import anthropic as anthropic_sdk
+import openai as openai_sdk
+from botocore.config import Config as BotoConfig
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# Sync Qdrant client also serves ingestion upserts and scroll-heavy
+# document management, hence the longer timeout
+QDRANT_TIMEOUT = 90
+
+# HTTP/2 pings keep idle gRPC channels open through load balancers and NAT,
+# so a search after a quiet period does not pay for a reconnect
+GRPC_OPTIONS = {
+    "grpc.keepalive_time_ms": 30_000,
+    "grpc.keepalive_timeout_ms": 10_000,
+    "grpc.keepalive_permit_without_calls": 1,
+    "grpc.http2.max_pings_without_data": 0,
+    "grpc.enable_retries": 1,
+}
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_instances: Dict[str, object] = {}
+
+
+def _get(name: str, factory: Callable[[], T]) -> T:
+    inst = _instances.get(name)
+    if inst is None:
+        with _lock:
+            inst = _instances.get(name)
+            if inst is None:
+                inst = _instances[name] = factory()
+                logger.info("client_initialized", client=name)
+    return inst
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.http_pool_max_connections,
+        max_keepalive_connections=settings.http_pool_max_keepalive,
+        keepalive_expiry=settings.http_keepalive_seconds,
+    )
+
+
+def _orjson(response: httpx.Response) -> httpx.Response:
+    # qdrant-client parses REST bodies with response.json(); orjson decodes
+    # large search payloads several times faster than the stdlib
+    response.json = lambda **_: orjson.loads(response.content)
+    return response
+
+
+def _orjson_middleware(request: httpx.Request, call_next) -> httpx.Response:
+    return _orjson(call_next(request))
+
+
+async def _async_orjson_middleware(request: httpx.Request, call_next) -> httpx.Response:
+    return _orjson(await call_next(request))
+
+
+def _qdrant_kwargs(timeout: float, prefer_grpc: Optional[bool]) -> dict:
+    # qdrant-client turns keep-alive off for localhost unless limits are given
+    kw = dict(
+        url=settings.qdrant_url,
+        timeout=timeout,
+        prefer_grpc=settings.qdrant_prefer_grpc if prefer_grpc is None else prefer_grpc,
+        grpc_port=settings.qdrant_grpc_port,
+        grpc_options=GRPC_OPTIONS,
+        limits=_limits(),
+    )
+    if settings.qdrant_api_key:
+        kw["api_key"] = settings.qdrant_api_key
+    return kw
+
+
+def new_qdrant(prefer_grpc: Optional[bool] = None, orjson_decode: bool = True,
+               timeout: float = QDRANT_TIMEOUT) -> QdrantClient:
+    """A new Qdrant client; use :func:`qdrant` for the shared one.
+
+    ``prefer_grpc`` defaults to QDRANT_PREFER_GRPC.  Calls without a gRPC
+    equivalent still go over REST, which is decoded with orjson unless
+    ``orjson_decode`` is false.
+    """
+    cli = QdrantClient(**_qdrant_kwargs(timeout, prefer_grpc))
+    if orjson_decode:
+        cli.http.client.add_middleware(_orjson_middleware)
+    return cli
+
+
+def new_async_qdrant(prefer_grpc: Optional[bool] = None, orjson_decode: bool = True,
+                     timeout: Optional[float] = None) -> AsyncQdrantClient:
+    """Async counterpart of :func:`new_qdrant`.  The gRPC channel is bound
+    to the event loop it is first used on."""
+    cli = AsyncQdrantClient(**_qdrant_kwargs(timeout or settings.qdrant_timeout_seconds, prefer_grpc))
+    if orjson_decode:
+        cli.http.client.add_middleware(_async_orjson_middleware)
+    return cli
+
+
+def qdrant() -> QdrantClient:
+    return _get("qdrant", new_qdrant)
+
+
+def async_qdrant() -> AsyncQdrantClient:
+    return _get("async_qdrant", new_async_qdrant)
+
+
+def s3():
+    return _get("s3", lambda: boto3.client(
+        "s3",
+        region_name=settings.aws_region,
+        config=BotoConfig(
+            retries={"max_attempts": 3},
+            max_pool_connections=settings.http_pool_max_connections,
+            tcp_keepalive=True,
+        ),
+    ))
+
+
+# The SDKs' own httpx wrappers keep their default timeouts, redirects and
+# TCP keep-alive socket options; only the pool limits are overridden.
+
+def openai() -> openai_sdk.OpenAI:
+    """OpenAI client — used for embeddings only."""
+    return _get("openai", lambda: openai_sdk.OpenAI(
+        api_key=settings.openai_api_key,
+        http_client=openai_sdk.DefaultHttpxClient(limits=_limits()),
+    ))
+
+
+def async_openai() -> openai_sdk.AsyncOpenAI:
+    return _get("async_openai", lambda: openai_sdk.AsyncOpenAI(
+        api_key=settings.openai_api_key,
+        http_client=openai_sdk.DefaultAsyncHttpxClient(limits=_limits()),
+    ))
+
+
+def anthropic() -> anthropic_sdk.Anthropic:
+    """Anthropic client — used for LLM generation (Claude Sonnet 4.5)."""
+    return _get("anthropic", lambda: anthropic_sdk.Anthropic(
+        api_key=settings.anthropic_api_key,
+        http_client=anthropic_sdk.DefaultHttpxClient(limits=_limits()),
+    ))
+
+
+def async_anthropic() -> anthropic_sdk.AsyncAnthropic:
+    return _get("async_anthropic", lambda: anthropic_sdk.AsyncAnthropic(
+        api_key=settings.anthropic_api_key,
+        http_client=anthropic_sdk.DefaultAsyncHttpxClient(limits=_limits()),
+    ))
+
+
+async def warm() -> None:
+    """Create the request-path clients and open the first Qdrant connection.
+
+    Called from the app lifespan.  Failures are logged, not raised: the
+    clients are created lazily again on first use.
+    """
+    try:
+        s3()
+        async_openai()
+        async_anthropic()
+        if settings.retrieval_backend != "local":
+            await async_qdrant().get_collections()
+    except Exception as e:
+        logger.warning("client_warmup_failed", error=str(e))
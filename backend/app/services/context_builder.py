@@ -0,0 +1,207 @@
+"""Consolidate retrieved chunks and pack them into the prompt under a token
+budget.
+
+Ingestion splits documents into ~1800-char chunks with a 200-char overlap,
+and shared collections often hold the same document more than once, so the
+ranked hits regularly contain consecutive chunks of one document and
+identical text from different collections.  :func:`consolidate_hits`
+stitches the former into one span (dropping the repeated overlap) and
+collapses the latter, before anything is numbered as a Source.
+
+``rag_query`` ranks hits in tier order (surgeon's own protocol, preferred
+literature, supplementary evidence).  The packer walks that order and keeps
+every chunk that still fits in ``settings.max_context_tokens``, skipping the
+ones that don't; leftover budget goes to a truncated copy of the
+highest-priority skipped chunk.  The size of the Sources block — and with
+it Claude latency and cost — is bounded.
+
+Tokens are estimated at ~4 characters per token, which is close enough for
+English clinical text and avoids a tokenizer dependency.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4
+# Allowance for the "[Source N — Dr. X's Protocol: title]" label line
+LABEL_OVERHEAD_TOKENS = 12
+# A truncated chunk shorter than this is more noise than context
+MIN_TRUNCATED_TOKENS = 60
+# Bounds for detecting the ingestion overlap between consecutive chunks;
+# _split in ingestion.py uses 200 characters, trimmed of whitespace
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@dataclass
+class PackedChunk:
+    hit: object
+    text: str
+    tokens: int
+    truncated: bool = False
+
+
+@dataclass
+class PackedContext:
+    chunks: List[PackedChunk]
+    tokens: int
+    dropped: int
+    truncated: int
+
+    @property
+    def hits(self) -> list:
+        return [c.hit for c in self.chunks]
+
+
+@dataclass
+class MergedHit:
+    """Stand-in for a Qdrant ScoredPoint covering one or more chunks."""
+    id: object
+    score: float
+    payload: dict = field(default_factory=dict)
+
+
+def _normalized(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split()).casefold()
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of ``a`` that is also a prefix of ``b``."""
+    for k in range(min(len(a), len(b), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _stitch(texts: List[str]) -> str:
+    out = texts[0]
+    for nxt in texts[1:]:
+        k = _overlap(out, nxt)
+        out = out + nxt[k:] if k else out + "\n" + nxt
+    return out
+
+
+def consolidate_hits(hits: list) -> list:
+    """Collapse duplicate chunks and stitch adjacent chunks of one document.
+
+    Order is preserved: each output hit sits where its best-ranked member
+    was, so tier ordering (own protocol first) is unchanged.  Duplicate text
+    keeps the first (highest-tier) copy.  Consecutive ``chunk_index`` values
+    from the same collection and document become one hit whose text is the
+    stitched span; its score is the best member score.  Hits that were not
+    merged are returned as-is.
+    """
+    seen_text = set()
+    unique = []
+    for h in hits:
+        key = _normalized((h.payload or {}).get("text", ""))
+        if key and key in seen_text:
+            continue
+        seen_text.add(key)
+        unique.append(h)
+
+    # (collection, document) -> {chunk_index: hit}
+    groups: Dict[Tuple[str, str], Dict[int, object]] = {}
+    for h in unique:
+        p = h.payload or {}
+        idx = p.get("chunk_index")
+        doc = p.get("document_id") or p.get("title")
+        if isinstance(idx, int) and doc:
+            groups.setdefault((p.get("_source_collection", ""), doc), {})[idx] = h
+
+    # Map each member hit to the run of consecutive chunks it belongs to
+    run_of: Dict[int, List[object]] = {}
+    for members in groups.values():
+        run: List[object] = []
+        prev: Optional[int] = None
+        for idx in sorted(members):
+            if prev is not None and idx != prev + 1:
+                run = []
+            run.append(members[idx])
+            run_of[id(members[idx])] = run
+            prev = idx
+
+    out = []
+    emitted = set()
+    for h in unique:
+        run = run_of.get(id(h))
+        if not run or len(run) == 1:
+            out.append(h)
+            continue
+        if id(run[0]) in emitted:
+            continue
+        emitted.add(id(run[0]))
+        first = run[0].payload or {}
+        payload = dict(first)
+        payload["text"] = _stitch([(m.payload or {}).get("text", "") for m in run])
+        payload["chunk_index"] = first.get("chunk_index")
+        payload["chunk_index_end"] = (run[-1].payload or {}).get("chunk_index")
+        payload["merged_chunks"] = len(run)
+        pages = [(m.payload or {}).get("page") for m in run]
+        pages = [pg for pg in pages if pg is not None]
+        if pages:
+            payload["page"] = min(pages)
+        out.append(MergedHit(id=run[0].id, score=max(m.score for m in run), payload=payload))
+    return out
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cut ``text`` to at most ``max_chars``, preferring a sentence and then a
+    word boundary."""
+    cut = text[:max_chars]
+    for boundary in (". ", "\n"):
+        i = cut.rfind(boundary)
+        if i >= max_chars // 2:
+            return cut[: i + 1].rstrip() + " …"
+    i = cut.rfind(" ")
+    if i >= max_chars // 2:
+        cut = cut[:i]
+    return cut.rstrip() + " …"
+
+
+def pack_context(hits: list, max_tokens: int) -> PackedContext:
+    """Keep the hits whose chunk text fits in ``max_tokens``, in order.
+
+    ``hits`` must already be in priority order.  A chunk that would overflow
+    the budget is skipped and later, smaller chunks are still considered.
+    If budget is left at the end, the first skipped chunk is added back
+    truncated to fit, at its original position.  A budget of 0 or less
+    disables the limit.
+    """
+    kept: List[Tuple[int, PackedChunk]] = []
+    used = 0
+    first_skipped = None
+    for i, h in enumerate(hits):
+        p = h.payload or {}
+        text = p.get("text", "")
+        cost = estimate_tokens(text) + estimate_tokens(p.get("title", "")) + LABEL_OVERHEAD_TOKENS
+        if max_tokens <= 0 or used + cost <= max_tokens:
+            kept.append((i, PackedChunk(hit=h, text=text, tokens=cost)))
+            used += cost
+        elif first_skipped is None:
+            first_skipped = (i, h, text, cost)
+
+    truncated = 0
+    if first_skipped is not None:
+        i, h, text, cost = first_skipped
+        remaining = max_tokens - used - (cost - estimate_tokens(text))
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            short = _truncate(text, remaining * CHARS_PER_TOKEN - 2)
+            short_cost = cost - estimate_tokens(text) + estimate_tokens(short)
+            kept.append((i, PackedChunk(hit=h, text=short, tokens=short_cost, truncated=True)))
+            used += short_cost
+            truncated = 1
+    kept.sort(key=lambda item: item[0])
+    chunks = [chunk for _, chunk in kept]
+
+    return PackedContext(
+        chunks=chunks,
+        tokens=used,
+        dropped=len(hits) - len(chunks),
+        truncated=truncated,
+    )
@@ -1,13 +1,16 @@
-import os, tempfile, logging, uuid, re
+import os, tempfile, logging, uuid, re, json, time
 from types import SimpleNamespace as NS
 from typing import List, Dict, Any, Optional, Tuple
-import boto3
-from botocore.config import Config as BotoConfig
 from pypdf import PdfReader
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, FilterSelector
-from openai import OpenAI
+from qdrant_client.http.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, FilterSelector, PayloadSchemaType, SparseVectorParams
 from app.core.config import settings
+from app.core.metrics import INGEST_CHUNKS, INGEST_DOCUMENTS, INGEST_PAGES, INGEST_SECONDS, INGEST_VECTORS, external_call
+from app.services import clients
+from app.services.catalog import catalog
+from app.services.pdf_extract import ocr_texts, page_texts
+from app.services.query_analysis import document_tags
+from app.services.sparse import SPARSE_VECTOR_NAME, document_vector
 
 # Word document support
 def _check_docx_available():
@@ -35,7 +38,6 @@ def _check_ocr_available():
 log = logging.getLogger("ingestion")
 log.setLevel(logging.INFO)
 
-STATUS: Dict[str, Dict[str, Any]] = {}
 EMBED_MODEL = "text-embedding-3-small"
 PRECEDENCE = {"AAOS":100, "RCT":100, "CLINICAL_GUIDELINE":100, "HOSPITAL_POLICY":90, "PEER_REVIEW":80, "DOCTOR_PROTOCOL":95, "OTHER":50}
 
@@ -79,36 +81,81 @@ def _resolve_protocol_author(collection_name: str, source_type: str) -> Optional
             return name
     return None
 
-def _s3():
-    return boto3.client("s3", region_name=settings.aws_region, config=BotoConfig(retries={"max_attempts": 3}))
-
-def _qdrant():
-    kw = dict(url=settings.qdrant_url, timeout=90)
-    if settings.qdrant_api_key: kw["api_key"] = settings.qdrant_api_key
-    return QdrantClient(**kw)
-
-def _openai(): 
-    return OpenAI(api_key=settings.openai_api_key)
-
-def _ensure_collection(cli: QdrantClient, collection_name: str):
-    try: 
-        cli.get_collection(collection_name)
-    except Exception:
-        cli.recreate_collection(
-            collection_name=collection_name, 
-            vectors_config=VectorParams(size=1536, distance=Distance.COSINE)
+def _ensure_collection(cli: QdrantClient, collection_name: str) -> bool:
+    """Create the collection if missing.  Returns True when it stores the
+    BM25 sparse vector (new collections always do; older ones only after
+    ``app.scripts.backfill_sparse_vectors``)."""
+    # Only create when Qdrant confirms the collection is missing; a transient
+    # error must not fall through to a create that could wipe live data.
+    if not cli.collection_exists(collection_name):
+        cli.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+            sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams()},
+        )
+        ensure_tag_indexes(cli, collection_name)
+        return True
+    info = cli.get_collection(collection_name)
+    return SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+
+def point_vector(dense: List[float], text: str, with_sparse: bool):
+    """Vector(s) for one chunk: the unnamed dense vector, plus the sparse
+    vector when the collection has one configured."""
+    sv = document_vector(text) if with_sparse else None
+    if sv is None:
+        return dense
+    return {"": dense, SPARSE_VECTOR_NAME: sv}
+
+def ensure_tag_indexes(cli: QdrantClient, collection_name: str):
+    """Payload indexes for the tag fields used in query-time search filters,
+    and for ``document_id`` (document link lookups)."""
+    for field, schema in (
+        ("document_id", PayloadSchemaType.KEYWORD),
+        ("body_parts", PayloadSchemaType.KEYWORD),
+        ("procedures", PayloadSchemaType.KEYWORD),
+        ("tags_version", PayloadSchemaType.INTEGER),
+    ):
+        cli.create_payload_index(collection_name=collection_name, field_name=field, field_schema=schema)
+
+def set_point_tags(cli: QdrantClient, collection_name: str, points) -> int:
+    """Write body-part / procedure / generic tags for already-fetched points.
+
+    ``points`` need ``id`` and a payload with ``title`` and ``text``.  Points
+    with identical tags are updated in one set_payload call.
+    """
+    groups: Dict[str, List[Any]] = {}
+    for p in points:
+        payload = p.payload or {}
+        tags = document_tags(payload.get("title", ""), payload.get("text", ""))
+        groups.setdefault(json.dumps(tags, sort_keys=True), []).append(p.id)
+    for key, ids in groups.items():
+        cli.set_payload(collection_name=collection_name, payload=json.loads(key), points=ids)
+    return sum(len(ids) for ids in groups.values())
+
+def retag_points(cli: QdrantClient, collection_name: str, point_ids: List[Any]) -> int:
+    """Recompute stored tags for ``point_ids``, e.g. after a title change."""
+    updated = 0
+    for start in range(0, len(point_ids), 256):
+        batch = cli.retrieve(
+            collection_name=collection_name,
+            ids=point_ids[start:start + 256],
+            with_payload=["title", "text"],
+            with_vectors=False,
         )
+        updated += set_point_tags(cli, collection_name, batch)
+    return updated
 
 def _download(bucket: str, key: str) -> Tuple[str, Optional[str]]:
     """Download file from S3 and return (local_path, original_filename)."""
-    head_resp = _s3().head_object(Bucket=bucket, Key=key)
+    with external_call("s3", "head_object"):
+        head_resp = clients.s3().head_object(Bucket=bucket, Key=key)
     # Get original filename from S3 metadata
     original_filename = head_resp.get('Metadata', {}).get('original-filename')
 
     fd, path = tempfile.mkstemp(prefix="doc-", suffix=os.path.splitext(key)[1])
     os.close(fd)
-    with open(path, "wb") as f:
-        _s3().download_fileobj(bucket, key, f)
+    with open(path, "wb") as f, external_call("s3", "download"):
+        clients.s3().download_fileobj(bucket, key, f)
     return path, original_filename
 
 
@@ -137,28 +184,17 @@ def _filename_to_title(filename: str) -> str:
 
     return name.strip() if name.strip() else "Unknown Document"
 
-def _ocr_pdf(path: str) -> List[NS]:
-    """Extract text from scanned PDF using OCR."""
+def _ocr_pdf(path: str, reader: Optional[PdfReader] = None) -> List[NS]:
+    """Extract text from scanned PDF using OCR (page by page, in parallel)."""
     if not _check_ocr_available():
         raise RuntimeError("OCR libraries not installed. Run: pip install pytesseract pdf2image pillow")
     
-    # Import here to avoid issues if not installed
-    import pytesseract
-    from pdf2image import convert_from_path
-    
-    log.info("Running OCR on scanned PDF...")
+    reader = reader or PdfReader(path)
+    log.info(f"Processing {len(reader.pages)} pages with OCR...")
     elements = []
     
     try:
-        # Convert PDF to images
-        images = convert_from_path(path, dpi=300)
-        log.info(f"Processing {len(images)} pages with OCR...")
-        
-        for page_num, image in enumerate(images, start=1):
-            # Extract text using Tesseract
-            text = pytesseract.image_to_string(image)
-            text = text.strip()
-            
+        for page_num, text in enumerate(ocr_texts(path, reader), start=1):
             if text:
                 elements.append(NS(
                     text=text,
@@ -179,9 +215,8 @@ def _parse_pdf_fast(path: str) -> List[NS]:
     out = []
     total_text_length = 0
     
-    # Try extracting text normally
-    for i, p in enumerate(r.pages):
-        t = (p.extract_text() or "").strip()
+    # Try extracting text normally (page ranges in parallel for long PDFs)
+    for i, t in enumerate(page_texts(path, r)):
         if t:
             out.append(NS(text=t, metadata=NS(page_number=i+1, category=None)))
             total_text_length += len(t)
@@ -194,7 +229,7 @@ def _parse_pdf_fast(path: str) -> List[NS]:
         
         if ocr_available:
             print("🚀 Starting OCR extraction...")
-            result = _ocr_pdf(path)
+            result = _ocr_pdf(path, r)
             print(f"✅ OCR extracted {len(result)} elements")
             return result
         else:
@@ -482,23 +517,33 @@ def _to_chunks(elems: List[NS]) -> List[Dict[str, Any]]:
 
 def _embed(texts: List[str]) -> List[List[float]]:
     if not texts: return []
-    cli = _openai()
+    cli = clients.openai()
     out = []
     B = 128
     for i in range(0, len(texts), B):
-        resp = cli.embeddings.create(model=EMBED_MODEL, input=texts[i:i+B])
+        with external_call("openai", "embeddings_batch"):
+            resp = cli.embeddings.create(model=EMBED_MODEL, input=texts[i:i+B])
         out.extend([d.embedding for d in resp.data])
     return out
 
-def process_document(s3_key: str, source_type: str = "OTHER", org_id: str = "demo"):
+def collection_for(org_id: str) -> str:
+    """Target collection: ``org_id`` itself for doctor collections
+    (``dr_{name}_{protocol}``), else the default collection."""
+    return org_id if org_id.startswith("dr_") else settings.collection
+
+def process_document(s3_key: str, source_type: str = "OTHER", org_id: str = "demo") -> Dict[str, Any]:
+    """Download, parse, chunk, embed and upsert one document.
+
+    Returns ``{"collection", "chunks", "vectors"}``; raises on failure.
+    Queued ingestion goes through ``app.services.job_queue`` and the worker
+    (``python -m app.worker``), which record the outcome and retry.
+    """
     bucket = settings.s3_bucket
     doc_id = s3_key
+    collection_name = collection_for(org_id)
 
-    # Extract collection name from org_id (which is dr_name_protocol format)
-    collection_name = org_id if org_id.startswith("dr_") else settings.collection
-
-    STATUS[doc_id] = {"state":"processing"}
     log.info("INGEST start %s", s3_key)
+    started = time.perf_counter()
     try:
         path, original_filename = _download(bucket, s3_key)
         log.info("Downloaded %s (original filename: %s)", path, original_filename)
@@ -541,8 +586,8 @@ def process_document(s3_key: str, source_type: str = "OTHER", org_id: str = "dem
         if len(vecs) != len(chunks):
             raise RuntimeError("Embedding mismatch")
 
-        cli = _qdrant()
-        _ensure_collection(cli, collection_name)
+        cli = clients.qdrant()
+        with_sparse = _ensure_collection(cli, collection_name)
 
         # Remove any existing chunks for this document so re-ingestion
         # doesn't create duplicates (e.g., old fragmented chunks alongside
@@ -579,22 +624,35 @@ def process_document(s3_key: str, source_type: str = "OTHER", org_id: str = "dem
                 "publication_year": doc_year,
                 "chunk_index": i,  # Add chunk index to payload for reference
                 "original_filename": original_filename,  # Preserve original filename for reference
+                # body_parts / procedures / is_generic for query-time filtering
+                **document_tags(doc_title, c["text"]),
             }
-            points.append(PointStruct(id=pid, vector=v, payload=payload))
+            points.append(PointStruct(id=pid, vector=point_vector(v, c["text"], with_sparse), payload=payload))
         
         print(f"📤 Attempting to upsert {len(points)} points to {collection_name}")
         try:
-            cli.upsert(collection_name=collection_name, points=points)
+            with external_call("qdrant", "upsert"):
+                cli.upsert(collection_name=collection_name, points=points)
             print(f"✅ Successfully upserted {len(points)} points")
         except Exception as e:
             print(f"❌ Upsert failed: {type(e).__name__}: {e}")
             raise
-        STATUS[doc_id] = {"state":"done","chunks":len(chunks),"vectors":len(vecs)}
+        finally:
+            # Old chunks were cleared above, so the collection changed even
+            # if the upsert failed.
+            catalog.mark_changed(collection_name)
         log.info("INGEST done %s chunks=%d", s3_key, len(chunks))
+        INGEST_DOCUMENTS.labels("done").inc()
+        INGEST_PAGES.inc(len({getattr(getattr(el, "metadata", NS()), "page_number", None) for el in elems}))
+        INGEST_CHUNKS.inc(len(chunks))
+        INGEST_VECTORS.inc(len(points))
+        INGEST_SECONDS.observe(time.perf_counter() - started)
+        return {"collection": collection_name, "chunks": len(chunks), "vectors": len(points)}
         
     except Exception as e:
-        STATUS[doc_id] = {"state":"error","error":str(e)}
         log.exception("INGEST failed %s: %s", s3_key, e)
+        INGEST_DOCUMENTS.labels("error").inc()
+        raise
     finally:
         # Clean up temp file
         try:
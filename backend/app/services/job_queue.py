@@ -0,0 +1,311 @@
+"""Durable ingestion job queue on the ``ingestion_jobs`` table.
+
+The API enqueues a job per uploaded/published document; ``app.worker``
+processes them in a separate process, so parsing and OCR do not compete
+with query traffic, progress survives restarts, and every API process
+reads the same status.
+
+Claiming is a conditional ``UPDATE ... WHERE state = <seen state>``, so
+several workers (and SQLite or PostgreSQL alike) never run the same job
+twice.  A worker holds a lease on its job and renews it while working; if
+it dies, the job is claimed again once the lease expires, unless that was
+its last attempt.  Failed attempts are retried with exponential backoff up
+to ``max_attempts``.
+"""
+
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.logging import logger
+from app.models.ingestion_job import IngestionJob
+from app.services.ingestion import collection_for, process_document
+
+# Backoff before attempt n+1 is base * 2**(n-1), capped
+MAX_BACKOFF_SECONDS = 3600
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def status(job: Optional[IngestionJob]) -> dict:
+    """Status payload for ``/documents/{id}/status``."""
+    if job is None:
+        return {"state": "unknown"}
+    out = {"state": job.state, "job_id": job.id, "attempts": job.attempts}
+    if job.state == "done":
+        out.update(chunks=job.chunks, vectors=job.vectors)
+    if job.error:
+        out["error"] = job.error
+    if job.state == "queued" and job.attempts:
+        out["retry_at"] = job.available_at.isoformat()
+    return out
+
+
+def enqueue(db: Session, document_id: str, source_type: str = "OTHER", org_id: str = "demo",
+            max_attempts: Optional[int] = None) -> IngestionJob:
+    """Queue ``document_id`` for ingestion.
+
+    A document that is already waiting keeps its existing job (with the new
+    arguments), so repeated publish calls do not queue duplicate work.
+    """
+    job = (
+        db.query(IngestionJob)
+        .filter(IngestionJob.document_id == document_id, IngestionJob.state == "queued")
+        .order_by(IngestionJob.created_at.desc())
+        .first()
+    )
+    if job is None:
+        job = IngestionJob(document_id=document_id)
+        db.add(job)
+    job.source_type = source_type
+    job.org_id = org_id
+    job.collection_name = collection_for(org_id)
+    job.max_attempts = max_attempts or settings.ingest_max_attempts
+    job.attempts = 0
+    job.error = None
+    job.available_at = _now()
+    db.commit()
+    db.refresh(job)
+    logger.info("ingest_job_queued", job_id=job.id, document_id=document_id, collection=job.collection_name)
+    return job
+
+
+def run_now(db: Session, document_id: str, source_type: str = "OTHER", org_id: str = "demo") -> IngestionJob:
+    """Ingest synchronously in the calling process, recorded as a single-attempt job.
+
+    The job is created already leased to this process, so no worker can
+    pick it up in the meantime.
+    """
+    worker_id = f"inline:{default_worker_id()}"
+    now = _now()
+    job = IngestionJob(
+        document_id=document_id,
+        source_type=source_type,
+        org_id=org_id,
+        collection_name=collection_for(org_id),
+        state="processing",
+        attempts=1,
+        max_attempts=1,
+        worker_id=worker_id,
+        lease_expires_at=now + timedelta(seconds=settings.ingest_job_lease_seconds),
+        started_at=now,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    execute(db, job, worker_id)
+    db.refresh(job)
+    return job
+
+
+def latest(db: Session, document_id: str) -> Optional[IngestionJob]:
+    return (
+        db.query(IngestionJob)
+        .filter(IngestionJob.document_id == document_id)
+        .order_by(IngestionJob.created_at.desc())
+        .first()
+    )
+
+
+def recent(db: Session, limit: int = 200) -> List[IngestionJob]:
+    return db.query(IngestionJob).order_by(IngestionJob.updated_at.desc()).limit(limit).all()
+
+
+def claim(db: Session, worker_id: str, job_id: Optional[str] = None) -> Optional[IngestionJob]:
+    """Take the oldest runnable job (or ``job_id``) and lease it to ``worker_id``.
+
+    Runnable: queued and due, or processing with an expired lease and
+    attempts left.  An expired job with none left (its worker died on every
+    attempt, e.g. a document that crashes the parser) is failed instead.
+    """
+    now = _now()
+    _fail_exhausted(db, now)
+    runnable = or_(
+        and_(IngestionJob.state == "queued", IngestionJob.available_at <= now),
+        and_(IngestionJob.state == "processing", IngestionJob.lease_expires_at < now,
+             IngestionJob.attempts < IngestionJob.max_attempts),
+    )
+    query = db.query(IngestionJob.id, IngestionJob.state).filter(runnable)
+    if job_id is not None:
+        query = query.filter(IngestionJob.id == job_id)
+    candidates = query.order_by(IngestionJob.available_at).limit(10).all()
+
+    for cid, seen_state in candidates:
+        taken = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == cid, IngestionJob.state == seen_state, runnable)
+            .values(
+                state="processing",
+                worker_id=worker_id,
+                attempts=IngestionJob.attempts + 1,
+                lease_expires_at=now + timedelta(seconds=settings.ingest_job_lease_seconds),
+                started_at=now,
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if taken:
+            job = db.get(IngestionJob, cid)
+            db.refresh(job)
+            return job
+    return None
+
+
+def _fail_exhausted(db: Session, now: datetime) -> None:
+    exhausted = and_(IngestionJob.state == "processing", IngestionJob.lease_expires_at < now,
+                     IngestionJob.attempts >= IngestionJob.max_attempts)
+    for (job_id,) in db.query(IngestionJob.id).filter(exhausted).all():
+        n = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, exhausted)
+            .values(state="error", error="lease expired on the last attempt (worker died?)",
+                    lease_expires_at=None, finished_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if n:
+            logger.error("ingest_job_failed", job_id=job_id, error="lease expired on the last attempt")
+
+
+def renew(db: Session, job_ids: Iterable[str], worker_id: str) -> None:
+    """Extend the leases of jobs ``worker_id`` is still working on."""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
+    now = _now()
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id.in_(job_ids), IngestionJob.worker_id == worker_id,
+               IngestionJob.state == "processing")
+        .values(lease_expires_at=now + timedelta(seconds=settings.ingest_job_lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def _finish(db: Session, job_id: str, worker_id: str, **values) -> None:
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.worker_id == worker_id,
+               IngestionJob.state == "processing")
+        .values(updated_at=_now(), lease_expires_at=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def release(db: Session, job_id: str, worker_id: str) -> None:
+    """Hand an unstarted or interrupted job back to the queue (not counted as an attempt)."""
+    _finish(db, job_id, worker_id, state="queued", attempts=IngestionJob.attempts - 1,
+            available_at=_now())
+
+
+def execute(db: Session, job: IngestionJob, worker_id: str) -> bool:
+    """Run a claimed job and record the outcome.  Returns True on success.
+
+    A failure is retried after ``INGEST_RETRY_BACKOFF_SECONDS * 2**(attempt-1)``
+    until the job's ``max_attempts`` is used up.
+    """
+    log = logger.bind(job_id=job.id, document_id=job.document_id, attempt=job.attempts)
+    log.info("ingest_job_started", worker_id=worker_id)
+    try:
+        result = process_document(job.document_id, job.source_type, job.org_id)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:2000]
+        if job.attempts < job.max_attempts:
+            delay = min(settings.ingest_retry_backoff_seconds * 2 ** (job.attempts - 1), MAX_BACKOFF_SECONDS)
+            _finish(db, job.id, worker_id, state="queued", error=error,
+                    available_at=_now() + timedelta(seconds=delay))
+            log.warning("ingest_job_retry_scheduled", error=error, retry_in_s=delay)
+        else:
+            _finish(db, job.id, worker_id, state="error", error=error, finished_at=_now())
+            log.error("ingest_job_failed", error=error)
+        return False
+    _finish(db, job.id, worker_id, state="done", error=None, finished_at=_now(),
+            chunks=result["chunks"], vectors=result["vectors"])
+    log.info("ingest_job_done", chunks=result["chunks"], vectors=result["vectors"])
+    return True
+
+
+class CompletionWatcher:
+    """Reports collections changed by job attempts that ended since the last poll.
+
+    The API polls this and feeds the names to ``catalog.mark_changed``, so
+    searches and the answer cache see documents ingested by a worker
+    process.  Failed attempts count too, final or scheduled for retry:
+    ``process_document`` deletes a document's old chunks before upserting
+    the new ones, so a failure can leave the document missing from the
+    index.  Each poll looks back ``OVERLAP`` so that a job committed late
+    by a slower worker is not missed; attempts already reported are skipped.
+    """
+
+    OVERLAP = timedelta(seconds=120)
+
+    def __init__(self):
+        self._seen: set = set()
+
+    def poll(self, db: Session) -> List[str]:
+        since = _now() - self.OVERLAP
+        ended = or_(
+            and_(IngestionJob.state.in_(("done", "error")), IngestionJob.finished_at > since),
+            and_(IngestionJob.state == "queued", IngestionJob.error.isnot(None),
+                 IngestionJob.updated_at > since),
+        )
+        rows = (
+            db.query(IngestionJob.id, IngestionJob.attempts, IngestionJob.collection_name)
+            .filter(ended)
+            .all()
+        )
+        changed = sorted({name for job_id, attempt, name in rows if (job_id, attempt) not in self._seen})
+        self._seen = {(job_id, attempt) for job_id, attempt, _ in rows}
+        return changed
+
+
+async def watch_completions(on_changed: Callable[[str], None]) -> None:
+    """Poll for ended job attempts every INGEST_POLL_SECONDS and call
+    ``on_changed(collection)`` for each collection they touched.  Runs until
+    cancelled."""
+    watcher = CompletionWatcher()
+
+    def _poll() -> List[str]:
+        db = SessionLocal()
+        try:
+            return watcher.poll(db)
+        finally:
+            db.close()
+
+    while True:
+        await asyncio.sleep(settings.ingest_poll_seconds)
+        try:
+            changed = await asyncio.to_thread(_poll)
+        except Exception as e:
+            logger.warning("ingest_completion_poll_failed", error=str(e))
+            continue
+        for name in changed:
+            on_changed(name)
+
+
+def prune(db: Session, older_than_days: float) -> int:
+    """Delete finished jobs older than ``older_than_days``; returns the count."""
+    cutoff = _now() - timedelta(days=older_than_days)
+    n = (
+        db.query(IngestionJob)
+        .filter(IngestionJob.state.in_(("done", "error")), IngestionJob.finished_at < cutoff)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return n
@@ -0,0 +1,289 @@
+"""Memory-mapped snapshot of Qdrant collections for local dense search.
+
+``export_collection`` dumps one collection into ``settings.local_index_dir``::
+
+    {dir}/{collection}/manifest.json   count, dim, distance, export time
+    {dir}/{collection}/vectors.npy     float32 (count, dim), L2-normalized
+    {dir}/{collection}/ids.json        point ids, row order
+    {dir}/{collection}/payloads.jsonl  one JSON payload per row
+    {dir}/{collection}/offsets.npy     int64 (count + 1) byte offsets into payloads.jsonl
+
+Vectors and payloads are memory-mapped, so opening a snapshot is cheap and
+only the pages a search touches are read.  ``LocalIndex.search`` scores the
+whole matrix in row blocks with one matrix-vector product per block, then
+applies the Qdrant filter to the best candidates.  Only dense search is
+supported; hybrid retrieval degrades to dense ranking on this backend.
+
+``retrieval`` uses it when ``settings.retrieval_backend`` is ``local``, or
+as a fallback for collections that fail in Qdrant when it is ``auto``.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from qdrant_client.http import models as qmodels
+
+from app.core.config import settings
+from app.core.logging import logger
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+# Rows scored per matrix-vector product (64k x 1536 float32 = 384 MB read per block)
+BLOCK_ROWS = 65536
+# Candidates examined per requested hit when a filter is applied; grows
+# geometrically if the filter rejects most of them
+FILTER_OVERFETCH = 4
+
+
+# ---------------------------------------------------------------------------
+# Filter evaluation (the subset of Qdrant filters the query path builds)
+# ---------------------------------------------------------------------------
+
+def _values(payload: dict, key: str) -> list:
+    v = payload.get(key)
+    if v is None:
+        return []
+    return v if isinstance(v, list) else [v]
+
+
+def _condition_matches(cond, point_id, payload: dict) -> bool:
+    if isinstance(cond, qmodels.Filter):
+        return matches(cond, point_id, payload)
+    if isinstance(cond, qmodels.IsEmptyCondition):
+        return not _values(payload, cond.is_empty.key)
+    if isinstance(cond, qmodels.IsNullCondition):
+        return cond.is_null.key in payload and payload[cond.is_null.key] is None
+    if isinstance(cond, qmodels.HasIdCondition):
+        return point_id in cond.has_id
+    if isinstance(cond, qmodels.FieldCondition):
+        values = _values(payload, cond.key)
+        m = cond.match
+        if isinstance(m, qmodels.MatchValue):
+            return m.value in values
+        if isinstance(m, qmodels.MatchAny):
+            return any(v in m.any for v in values)
+        if isinstance(m, qmodels.MatchExcept):
+            return bool(values) and not any(v in m.except_ for v in values)
+        if cond.range is not None:
+            r = cond.range
+            return any(
+                isinstance(v, (int, float))
+                and (r.gt is None or v > r.gt) and (r.gte is None or v >= r.gte)
+                and (r.lt is None or v < r.lt) and (r.lte is None or v <= r.lte)
+                for v in values
+            )
+    raise ValueError(f"Unsupported filter condition for local index: {type(cond).__name__}")
+
+
+def matches(flt: Optional[qmodels.Filter], point_id, payload: dict) -> bool:
+    """Evaluate a Qdrant ``Filter`` against one payload."""
+    if flt is None:
+        return True
+    if flt.must and not all(_condition_matches(c, point_id, payload) for c in flt.must):
+        return False
+    if flt.must_not and any(_condition_matches(c, point_id, payload) for c in flt.must_not):
+        return False
+    if flt.should and not any(_condition_matches(c, point_id, payload) for c in flt.should):
+        return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Snapshot reader
+# ---------------------------------------------------------------------------
+
+class LocalIndex:
+    """One exported collection, memory-mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.name = self.manifest["collection"]
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.normalized = self.manifest["distance"] == "Cosine"
+        with open(os.path.join(path, "ids.json")) as f:
+            self.ids = json.load(f)
+        if self.count:
+            self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+            with open(os.path.join(path, "payloads.jsonl"), "rb") as f:
+                self._payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    def payload(self, row: int) -> dict:
+        return json.loads(self._payloads[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+    def scores(self, vector) -> np.ndarray:
+        """Similarity of ``vector`` to every row, computed block by block."""
+        q = np.asarray(vector, dtype=np.float32)
+        if self.normalized:
+            norm = np.linalg.norm(q)
+            if norm > 0:
+                q = q / norm
+        out = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, self.count)
+            out[start:end] = self.vectors[start:end] @ q
+        return out
+
+    def search(self, vector, top_k: int, query_filter: Optional[qmodels.Filter] = None) -> List[qmodels.ScoredPoint]:
+        if not self.count or top_k <= 0:
+            return []
+        scores = self.scores(vector)
+        k = top_k if query_filter is None else top_k * FILTER_OVERFETCH
+        while True:
+            k = min(k, self.count)
+            rows = np.argpartition(-scores, k - 1)[:k] if k < self.count else np.arange(self.count)
+            rows = rows[np.argsort(-scores[rows], kind="stable")]
+            hits = []
+            for row in rows:
+                payload = self.payload(row)
+                if not matches(query_filter, self.ids[row], payload):
+                    continue
+                hits.append(qmodels.ScoredPoint(
+                    id=self.ids[row], version=0, score=float(scores[row]), payload=payload,
+                ))
+                if len(hits) == top_k:
+                    return hits
+            if k == self.count:
+                return hits
+            k *= FILTER_OVERFETCH
+
+
+_indexes: Dict[str, tuple] = {}
+_lock = threading.Lock()
+
+
+def _collection_dir(name: str) -> str:
+    return os.path.join(settings.local_index_dir, name)
+
+
+def available(name: str) -> bool:
+    return os.path.exists(os.path.join(_collection_dir(name), MANIFEST))
+
+
+def get(name: str) -> LocalIndex:
+    """Open (or reuse) the snapshot of ``name``; reopened after a re-export."""
+    manifest = os.path.join(_collection_dir(name), MANIFEST)
+    mtime = os.stat(manifest).st_mtime_ns
+    with _lock:
+        cached = _indexes.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    index = LocalIndex(_collection_dir(name))
+    with _lock:
+        _indexes[name] = (mtime, index)
+    return index
+
+
+def search(collection_name: str, vector, top_k: int, query_filter: Optional[qmodels.Filter] = None) -> list:
+    return get(collection_name).search(vector, top_k, query_filter)
+
+
+def manifests() -> List[dict]:
+    """Manifests of every exported collection."""
+    root = settings.local_index_dir
+    if not os.path.isdir(root):
+        return []
+    out = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                out.append(json.load(f))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Exporter
+# ---------------------------------------------------------------------------
+
+def _dense(vector):
+    # Collections with a sparse vector return {"": dense, "bm25": sparse}
+    if isinstance(vector, dict):
+        vector = vector.get("")
+    return vector
+
+
+def export_collection(client, collection_name: str, out_dir: str = None, batch_size: int = 1024) -> dict:
+    """Write a snapshot of ``collection_name`` and return its manifest.
+
+    The snapshot is built in a temporary directory and swapped in at the
+    end, so readers never see a partial export.
+    """
+    out_dir = out_dir or settings.local_index_dir
+    info = client.get_collection(collection_name)
+    params = info.config.params.vectors
+    if isinstance(params, dict):
+        params = params.get("")
+    dim = params.size
+    distance = params.distance.value if hasattr(params.distance, "value") else str(params.distance)
+    if distance not in ("Cosine", "Dot"):
+        raise ValueError(f"{collection_name}: {distance} distance is not supported by the local index")
+
+    final = os.path.join(out_dir, collection_name)
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    ids: list = []
+    chunks: List[np.ndarray] = []
+    offsets = [0]
+    with open(os.path.join(tmp, "payloads.jsonl"), "wb") as pf:
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                block = np.asarray([_dense(p.vector) for p in points], dtype=np.float32)
+                if distance == "Cosine":
+                    norms = np.linalg.norm(block, axis=1, keepdims=True)
+                    block /= np.where(norms > 0, norms, 1)
+                chunks.append(block)
+                for p in points:
+                    ids.append(p.id)
+                    line = json.dumps(p.payload or {}, ensure_ascii=False).encode("utf-8") + b"\n"
+                    pf.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            if offset is None:
+                break
+
+    vectors = np.concatenate(chunks) if chunks else np.zeros((0, dim), dtype=np.float32)
+    np.save(os.path.join(tmp, "vectors.npy"), vectors)
+    np.save(os.path.join(tmp, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp, "ids.json"), "w") as f:
+        json.dump(ids, f)
+    manifest = {
+        "format": FORMAT_VERSION,
+        "collection": collection_name,
+        "count": len(ids),
+        "dim": dim,
+        "distance": distance,
+        "exported_at": time.time(),
+    }
+    # Manifest last: its presence marks a complete snapshot
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+    old = final + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(final):
+        os.rename(final, old)
+    os.rename(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info("local_index_exported", collection=collection_name, points=len(ids), dim=dim)
+    return manifest
@@ -0,0 +1,155 @@
+"""Parallel PDF text extraction and OCR.
+
+pypdf's ``extract_text()`` is pure Python and CPU-bound, so long PDFs
+(100+ page RCTs) are split into page ranges that are extracted in a
+process pool, one ``PdfReader`` per range.  Results are reassembled in page
+order, so output is identical to a serial pass.  Short documents, or a
+pool of one worker, stay in-process.
+
+The pool uses the ``spawn`` start method: the ingestion worker is
+multi-threaded, and forking a threaded process can deadlock children on
+locks held by other threads.  The pool is created once and reused, so
+process start-up is paid only on the first long document.
+
+Scanned PDFs are OCR'd one page per task in a separate pool of OCR_WORKERS
+processes: each task rasterizes a single page (``first_page``/``last_page``)
+in grayscale and runs Tesseract on it, so at most one page image per worker
+is in memory however long the document is.  The DPI is chosen per page:
+OCR_DPI for ordinary page sizes, lowered for oversized pages so that no
+image exceeds OCR_MAX_PAGE_PIXELS.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+from pypdf import PdfReader
+
+from app.core.config import settings
+
+log = logging.getLogger("ingestion")
+
+# Ranges per worker; several smaller ranges even out pages of uneven cost
+RANGES_PER_WORKER = 3
+
+_pools: Dict[str, ProcessPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+
+def workers() -> int:
+    return settings.pdf_extract_workers or os.cpu_count() or 1
+
+
+def ocr_workers() -> int:
+    return settings.ocr_workers or os.cpu_count() or 1
+
+
+def _init_ocr_process() -> None:
+    # One Tesseract thread per process; parallelism comes from the pool
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def pool(kind: str = "text") -> ProcessPoolExecutor:
+    """Shared process pool for ``"text"`` extraction or ``"ocr"``."""
+    with _pool_lock:
+        if kind not in _pools:
+            if kind == "ocr":
+                _pools[kind] = ProcessPoolExecutor(max_workers=ocr_workers(), mp_context=get_context("spawn"),
+                                                   initializer=_init_ocr_process)
+            else:
+                _pools[kind] = ProcessPoolExecutor(max_workers=workers(), mp_context=get_context("spawn"))
+        return _pools[kind]
+
+
+def _reset_pool(kind: str = "text") -> None:
+    with _pool_lock:
+        old = _pools.pop(kind, None)
+        if old is not None:
+            old.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[str]:
+    """Text of pages ``[start, stop)``; runs in a pool process."""
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "").strip() for i in range(start, stop)]
+
+
+def page_ranges(n_pages: int, n_ranges: int) -> List[range]:
+    """Split ``n_pages`` into at most ``n_ranges`` contiguous, near-equal ranges."""
+    n_ranges = max(1, min(n_ranges, n_pages))
+    size, extra = divmod(n_pages, n_ranges)
+    out, start = [], 0
+    for i in range(n_ranges):
+        stop = start + size + (1 if i < extra else 0)
+        out.append(range(start, stop))
+        start = stop
+    return out
+
+
+def page_texts(path: str, reader: Optional[PdfReader] = None) -> List[str]:
+    """Stripped text of every page of the PDF at ``path``, in page order."""
+    reader = reader or PdfReader(path)
+    n_pages = len(reader.pages)
+    n_workers = workers()
+    if n_pages < settings.pdf_parallel_min_pages or n_workers <= 1:
+        return [(p.extract_text() or "").strip() for p in reader.pages]
+
+    ranges = page_ranges(n_pages, n_workers * RANGES_PER_WORKER)
+    try:
+        futures = [pool().submit(_extract_range, path, r.start, r.stop) for r in ranges]
+        texts: List[str] = []
+        for f in futures:
+            texts.extend(f.result())
+        return texts
+    except BrokenProcessPool as e:
+        # A child died (e.g. OOM-killed); start a fresh pool next time and
+        # finish this document in-process
+        log.warning("PDF extraction pool failed (%s); extracting %s serially", e, path)
+        _reset_pool()
+        return [(p.extract_text() or "").strip() for p in reader.pages]
+
+
+def ocr_dpi(width_pt: float, height_pt: float) -> int:
+    """Rasterization DPI for a page of ``width_pt`` x ``height_pt`` points.
+
+    OCR_DPI, lowered (not below OCR_MIN_DPI) so the image stays within
+    OCR_MAX_PAGE_PIXELS.  Letter and A4 pages keep the full 300 DPI.
+    """
+    area_in2 = max(float(width_pt) * float(height_pt), 1.0) / (72 * 72)
+    dpi = min(settings.ocr_dpi, int((settings.ocr_max_page_pixels / area_in2) ** 0.5))
+    return max(settings.ocr_min_dpi, dpi)
+
+
+def _ocr_page(path: str, page_number: int, dpi: int) -> str:
+    """Rasterize and OCR one page (1-based); runs in an OCR pool process."""
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    try:
+        return "\n".join(pytesseract.image_to_string(im) for im in images).strip()
+    finally:
+        for im in images:
+            im.close()
+
+
+def ocr_texts(path: str, reader: Optional[PdfReader] = None) -> List[str]:
+    """OCR text of every page of the PDF at ``path``, in page order."""
+    reader = reader or PdfReader(path)
+    dpis = [ocr_dpi(p.mediabox.width, p.mediabox.height) for p in reader.pages]
+    if ocr_workers() <= 1 or len(dpis) <= 1:
+        return [_ocr_page(path, i + 1, dpi) for i, dpi in enumerate(dpis)]
+
+    ocr_pool = pool("ocr")
+    try:
+        # Pages finish out of order but results are collected in page order
+        futures = [ocr_pool.submit(_ocr_page, path, i + 1, dpi) for i, dpi in enumerate(dpis)]
+        return [f.result() for f in futures]
+    except BrokenProcessPool as e:
+        log.warning("OCR pool failed (%s); running OCR on %s serially", e, path)
+        _reset_pool("ocr")
+        return [_ocr_page(path, i + 1, dpi) for i, dpi in enumerate(dpis)]
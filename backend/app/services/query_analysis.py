@@ -0,0 +1,686 @@
+"""Keyword analysis of questions and document titles.
+
+Routing, hit filtering, clarifying questions and the emergency guardrail
+all ask "does this text mention any of these keywords?" against the tables
+below.  Instead of a linear ``kw in text`` scan per table per call, every
+table is compiled once at import into a single multi-pattern regex, and a
+question is analyzed in one pass into a :class:`QueryAnalysis` that all
+downstream filters share.
+
+Matching keeps plain substring semantics (``"fai"`` matches ``"failed"``),
+so results are identical to the per-keyword scans it replaces; see
+``app/scripts/bench_query_analysis.py``.
+"""
+
+import json
+import re
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+from qdrant_client.http import models as qmodels
+
+# ---------------------------------------------------------------------------
+# Keyword tables
+# ---------------------------------------------------------------------------
+
+# Questions containing any of these are refused with an emergency notice.
+EMERGENCY_KEYWORDS: list[str] = ["chest pain", "shortness of breath", "suicid", "overdose"]
+
+# Keywords in the user question that signal a specific body-part focus.
+QUERY_BODY_PART_KEYWORDS: dict[str, list[str]] = {
+    "knee": [
+        "acl", "anterior cruciate", "meniscus", "meniscal", "knee",
+        "pcl", "posterior cruciate", "patella", "patellar", "hamstring graft",
+        "quadriceps tendon graft", "multiligament knee",
+    ],
+    "hip": [
+        "hip", "fai", "femoroacetabular", "acetabul", "femoral head",
+        "hip arthroscopy", "hip labr", "gluteal tendon", "sports hernia",
+        "athletic pubalgia",
+    ],
+    "shoulder": [
+        "shoulder", "rotator cuff", "bankart", "slap repair", "slap tear",
+        "supraspinatus", "infraspinatus", "subscapularis", "ac joint",
+        "acromioclavicular", "superior capsul",
+    ],
+    "elbow": [
+        "ucl", "ulnar collateral", "tommy john", "elbow", "epicondyl",
+        "olecranon",
+    ],
+    "spine": [
+        "spine", "spinal", "lumbar", "cervical", "thoracic",
+        "disc herniat", "stenosis", "spondyl", "vertebr",
+        "laminectomy", "laminoplasty", "discectomy",
+    ],
+    "foot_ankle": ["foot", "ankle", "achilles", "plantar"],
+    "hand_wrist": ["hand", "wrist", "carpal", "finger"],
+}
+
+# Substrings in collection names that indicate which body part the
+# collection belongs to.
+COLLECTION_BODY_PART_MAP: dict[str, str] = {
+    "acl": "knee",
+    "meniscus": "knee",
+    "knee": "knee",
+    "lower_leg": "knee",
+    "aaos_knee": "knee",
+    "hip": "hip",
+    "thigh": "hip",
+    "fai": "hip",
+    "shoulder": "shoulder",
+    "rotator_cuff": "shoulder",
+    "shoulder_replacement": "shoulder",
+    "ucl": "elbow",
+    "elbow": "elbow",
+    "back": "spine",
+    "neck": "spine",
+    "foot": "foot_ankle",
+    "ankle": "foot_ankle",
+    "hand": "hand_wrist",
+    "wrist": "hand_wrist",
+}
+
+
+# Keywords that signal a hit is about a specific procedure.
+# Checked against the lowercased title; if the title yields no signal,
+# the first 500 chars of chunk text are checked as a fallback.
+PROCEDURE_INDICATORS: dict[str, list[str]] = {
+    "acl": ["acl", "anterior cruciate", "aclr", "acl-r"],
+    "meniscus_root": [
+        "meniscus root", "meniscal root", "root repair", "root tear",
+    ],
+    "meniscus": ["meniscus", "meniscal", "meniscectomy"],
+    "rotator_cuff": [
+        "rotator cuff", "supraspinatus repair", "cuff repair",
+    ],
+    "shoulder_replacement": [
+        "shoulder replacement", "shoulder arthroplasty",
+        "reverse total shoulder", "anatomic total shoulder",
+        "reverse shoulder", "total shoulder",
+    ],
+    "ucl": ["ucl", "ulnar collateral", "tommy john"],
+    "hip_arthroscopy": [
+        "hip arthroscopy", "hip scope", "fai",
+        "femoroacetabular", "hip labr",
+    ],
+    "total_hip": ["total hip", "hip replacement", "hip arthroplasty"],
+    "total_knee": ["total knee", "knee replacement", "knee arthroplasty"],
+}
+
+# Title substrings that indicate a generic / non-procedure-specific document.
+# When procedure-specific hits are available, generic hits are removed so the
+# LLM does not cite them.
+GENERIC_DOC_PATTERNS: list[str] = [
+    "surgical booklet", "surgery booklet",
+    "operative booklet",
+    "operative guide", "operation guide",
+    "patient handbook", "clinical handbook",
+    "surgical handbook",
+    "general guide", "general instructions",
+    "general surgical", "general information",
+    "pre-operative packet", "pre op packet",
+    "surgical packet", "surgery packet",
+]
+
+
+PROCEDURE_CLARIFICATIONS: list[dict] = [
+    {
+        "keywords": ["acl", "anterior cruciate"],
+        # Detail keywords are grouped into categories.  The patient must
+        # provide information in at least ``categories_needed`` distinct
+        # categories before we skip clarification.  This prevents a
+        # descriptive procedure name (e.g. "ACL reconstruction with
+        # hamstring autograft") from satisfying the threshold when the
+        # patient still hasn't mentioned concomitant procedures or timeline.
+        "detail_categories": {
+            "graft_type": [
+                "graft", "autograft", "allograft", "hamstring", "patellar",
+                "quadriceps", "btb", "bone-patellar", "bone patellar",
+            ],
+            "revision_status": ["revision", "primary", "first time", "redo"],
+            "concomitant": ["meniscus", "meniscal", "cartilage", "chondral"],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,  # need ≥2 distinct categories to skip
+        "questions": [
+            "Did you have any other procedures done at the same time as your ACL reconstruction (for example, a meniscus repair or cartilage procedure)?",
+            "Do you know what type of graft was used (patellar tendon, hamstring, quadriceps tendon, or donor tissue)?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["meniscus", "meniscal"],
+        "detail_categories": {
+            "procedure_type": [
+                "repair", "meniscectomy", "removed", "stitched", "sutured",
+                "root", "transplant", "allograft",
+            ],
+            "concomitant": ["acl", "anterior cruciate", "ligament", "cartilage"],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "Was your meniscus repaired (stitched/sutured) or was a portion removed (partial meniscectomy)?",
+            "Were any other procedures done at the same time (for example, an ACL reconstruction or cartilage procedure)?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["rotator cuff"],
+        "detail_categories": {
+            "tear_type": ["partial", "full thickness", "complete", "massive"],
+            "revision_status": ["revision", "primary", "first time", "redo"],
+            "concomitant": [
+                "biceps", "tenodesis", "labr", "slap", "decompression",
+            ],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "Was your rotator cuff tear a partial tear or a full-thickness tear?",
+            "Were any other procedures done at the same time (for example, a biceps tenodesis, labral repair, or subacromial decompression)?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["ucl", "ulnar collateral", "tommy john"],
+        "detail_categories": {
+            "procedure_type": [
+                "graft", "autograft", "allograft", "palmaris", "gracilis",
+                "repair", "internal brace",
+            ],
+            "revision_status": ["revision", "primary", "first time", "redo"],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "Was this a UCL reconstruction (graft) or a UCL repair (with internal brace)?",
+            "Is this your first UCL surgery or a revision?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["hip arthroscopy", "hip scope"],
+        "detail_categories": {
+            "procedure_type": [
+                "labr", "labral", "labrum", "fai", "impingement",
+                "cam", "pincer", "cartilage", "microfracture",
+                "gluteal", "abductor",
+            ],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "What procedures were done during your hip arthroscopy (for example, labral repair, cam/pincer reshaping, cartilage work)?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["shoulder replacement", "shoulder arthroplasty",
+                      "reverse shoulder", "total shoulder"],
+        "detail_categories": {
+            "replacement_type": ["reverse", "total", "anatomic", "hemi"],
+            "revision_status": ["revision", "primary", "first time", "redo"],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "Was your shoulder replacement a reverse total shoulder or an anatomic total shoulder?",
+            "Is this your first shoulder replacement or a revision?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["knee replacement", "total knee", "tkr", "tka",
+                      "knee arthroplasty"],
+        "detail_categories": {
+            "replacement_type": ["total", "partial", "unicompartmental"],
+            "revision_status": ["revision", "primary", "first time", "redo"],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "Was your knee replacement a total knee replacement or a partial (unicompartmental) replacement?",
+            "Is this your first knee replacement or a revision?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+    {
+        "keywords": ["hip replacement", "total hip", "thr", "tha",
+                      "hip arthroplasty"],
+        "detail_categories": {
+            "approach_type": ["anterior", "posterior", "lateral", "approach"],
+            "revision_status": ["revision", "primary", "first time", "redo"],
+            "timeline": [
+                "weeks ago", "months ago", "days ago", "post-op", "postop",
+                "week post", "month post", "day post",
+            ],
+        },
+        "categories_needed": 2,
+        "questions": [
+            "What surgical approach was used (anterior, posterior, or lateral)?",
+            "Is this your first hip replacement or a revision?",
+            "How far along are you in your recovery — how many weeks or months since your surgery?",
+        ],
+    },
+]
+
+
+# Keywords that indicate the patient is asking about post-operative care,
+# recovery, or rehabilitation — contexts where surgical-detail clarifying
+# questions are helpful.
+POSTOP_SIGNALS: list[str] = [
+    "after my surgery", "after surgery", "after the surgery",
+    "after my operation", "after the operation",
+    "post-op", "postop", "post op", "post operative", "postoperative",
+    "recovery", "recovering", "rehab", "rehabilitation",
+    "i had", "i've had", "i just had", "i recently had",
+    "i underwent", "i got",
+    "weeks ago", "months ago", "days ago",
+    "week post", "month post", "day post",
+    "weeks since", "months since", "days since",
+    "surgery was", "my surgery",
+    "when can i", "can i start", "am i allowed",
+    "return to sport", "return to work", "back to normal",
+    "weight bearing", "weight-bearing",
+    "physical therapy", "pt exercises",
+    "how long until", "how long before",
+    "swelling", "sling", "brace", "crutches", "immobilizer",
+    "follow up appointment", "follow-up appointment",
+    "stitches", "incision", "wound",
+    "pain after", "still hurts",
+]
+
+# Keywords that indicate the patient is asking about treatment options,
+# diagnosis, or condition management — contexts where post-op clarifying
+# questions are NOT relevant.
+TREATMENT_INQUIRY_SIGNALS: list[str] = [
+    "how do you treat", "how would you treat", "how is it treated",
+    "how do you recommend", "what do you recommend",
+    "treatment option", "treatment for", "treat a", "treat my",
+    "what are my options", "what are the options",
+    "should i get surgery", "do i need surgery", "is surgery necessary",
+    "conservative", "non-surgical", "nonsurgical", "non surgical",
+    "what is a", "what is the", "what are",
+    "how is a", "how do you fix", "how do you repair",
+    "manage", "management of",
+    "diagnos", "torn", "tear", "tearing", "injury",
+    "what causes", "why does",
+    "can it heal", "will it heal", "heal on its own",
+    "injection", "cortisone", "prp", "platelet",
+    "therapy for", "exercises for",
+]
+
+
+# ---------------------------------------------------------------------------
+# Multi-pattern matcher
+# ---------------------------------------------------------------------------
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex alternation for ``words`` factored as a trie.
+
+    Branches at each node start with distinct characters and optional
+    continuations are greedy, so at any position the pattern matches the
+    longest keyword that occurs there.
+    """
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def _node(node: dict) -> str:
+        alts = [re.escape(ch) + _node(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        pattern = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return _node(trie)
+
+
+class KeywordMatcher:
+    """Find which labels' keywords occur (as substrings) in a text.
+
+    Built from ``(label, keywords)`` pairs.  A zero-width lookahead lets the
+    regex report a match at every position, including overlapping ones.
+    Only the longest keyword at a position is reported, so each keyword
+    carries the labels of every keyword that is a prefix of it (the only
+    other keywords that can match at the same position).
+    """
+
+    def __init__(self, tables: Iterable[Tuple[Hashable, Iterable[str]]]):
+        own: Dict[str, set] = {}
+        for label, keywords in tables:
+            for kw in keywords:
+                own.setdefault(kw.lower(), set()).add(label)
+        self._labels: Dict[str, FrozenSet[Hashable]] = {
+            kw: frozenset().union(*(own.get(kw[:n], ()) for n in range(1, len(kw) + 1)))
+            for kw in own
+        }
+        self._re = re.compile("(?=(" + _trie_pattern(own) + "))") if own else None
+
+    def labels(self, text: str) -> FrozenSet[Hashable]:
+        if not text or self._re is None:
+            return frozenset()
+        found: set = set()
+        for m in self._re.finditer(text.lower()):
+            found |= self._labels[m.group(1)]
+        return frozenset(found)
+
+
+# Questions: every table that is checked against the user's question.
+_QUERY_MATCHER = KeywordMatcher(
+    [("emergency", EMERGENCY_KEYWORDS)]
+    + [(("body_part", bp), kws) for bp, kws in QUERY_BODY_PART_KEYWORDS.items()]
+    + [(("procedure", proc), kws) for proc, kws in PROCEDURE_INDICATORS.items()]
+    + [("postop", POSTOP_SIGNALS), ("treatment", TREATMENT_INQUIRY_SIGNALS)]
+    + [(("clarify", i), entry["keywords"]) for i, entry in enumerate(PROCEDURE_CLARIFICATIONS)]
+    + [
+        (("clarify_detail", i, category), kws)
+        for i, entry in enumerate(PROCEDURE_CLARIFICATIONS)
+        for category, kws in entry["detail_categories"].items()
+    ]
+)
+
+# Document titles: body part, procedure and generic-document signals.
+_TITLE_MATCHER = KeywordMatcher(
+    [(("body_part", bp), kws) for bp, kws in QUERY_BODY_PART_KEYWORDS.items()]
+    + [(("procedure", proc), kws) for proc, kws in PROCEDURE_INDICATORS.items()]
+    + [("generic", GENERIC_DOC_PATTERNS)]
+)
+
+# Chunk text fallback for procedure detection.
+_PROCEDURE_MATCHER = KeywordMatcher(
+    [(("procedure", proc), kws) for proc, kws in PROCEDURE_INDICATORS.items()]
+)
+
+
+def _tagged(labels: FrozenSet[Hashable], kind: str) -> FrozenSet[str]:
+    return frozenset(l[1] for l in labels if isinstance(l, tuple) and l[0] == kind)
+
+
+# ---------------------------------------------------------------------------
+# Analyses
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    """Everything the RAG pipeline needs to know about a question's wording."""
+    question: str
+    labels: FrozenSet[Hashable]
+
+    @property
+    def emergency(self) -> bool:
+        return "emergency" in self.labels
+
+    @property
+    def body_parts(self) -> FrozenSet[str]:
+        """Body parts the question is about; empty means search everything."""
+        return _tagged(self.labels, "body_part")
+
+    @property
+    def procedures(self) -> FrozenSet[str]:
+        return _tagged(self.labels, "procedure")
+
+    @property
+    def is_treatment_inquiry(self) -> bool:
+        return "treatment" in self.labels
+
+    @property
+    def is_postop_or_recovery(self) -> bool:
+        """Whether a (patient) question is about post-op care or recovery.
+
+        Treatment-inquiry language without post-op language means the
+        patient is exploring options; post-op language means recovery.  A
+        question with neither (e.g. "rotator cuff tear") is more likely
+        informational, so it defaults to not post-op.
+        """
+        if self.is_treatment_inquiry and "postop" not in self.labels:
+            return False
+        return "postop" in self.labels
+
+    def clarifying_questions(self) -> Optional[List[str]]:
+        """Questions to ask before answering, if the first mentioned
+        procedure is missing details in too few categories.
+
+        Detail matching is category-based: a descriptive procedure name
+        like "meniscus root repair" has two keywords in the *same* category
+        and only counts once.  Applies to patients in a post-op context
+        only; the caller checks the actor.
+        """
+        if not self.is_postop_or_recovery:
+            return None
+        for i, entry in enumerate(PROCEDURE_CLARIFICATIONS):
+            if ("clarify", i) not in self.labels:
+                continue
+            satisfied = sum(
+                1 for category in entry["detail_categories"]
+                if ("clarify_detail", i, category) in self.labels
+            )
+            if satisfied < entry["categories_needed"]:
+                return entry["questions"]
+        return None
+
+
+@dataclass(frozen=True)
+class TitleAnalysis:
+    body_parts: FrozenSet[str]
+    procedures: FrozenSet[str]
+    generic: bool
+
+
+def analyze_query(question: str) -> QueryAnalysis:
+    return QueryAnalysis(question=question, labels=_QUERY_MATCHER.labels(question))
+
+
+@lru_cache(maxsize=8192)
+def analyze_title(title: str) -> TitleAnalysis:
+    """Analyze a document title.  Cached: the same titles recur across queries."""
+    labels = _TITLE_MATCHER.labels(title)
+    return TitleAnalysis(
+        body_parts=_tagged(labels, "body_part"),
+        procedures=_tagged(labels, "procedure"),
+        generic="generic" in labels,
+    )
+
+
+def title_cache_stats() -> dict:
+    info = analyze_title.cache_info()
+    return {"entries": info.currsize, "max_entries": info.maxsize, "hits": info.hits, "misses": info.misses}
+
+
+def hit_procedures(title: str, text: str) -> FrozenSet[str]:
+    """Procedures a hit is about.
+
+    The title is checked first; only when it yields no procedure signal is
+    the first 500 characters of chunk text used, so incidental mentions in
+    the body cannot override a clear, procedure-specific title.
+    """
+    procs = analyze_title(title).procedures
+    if not procs and text:
+        procs = _tagged(_PROCEDURE_MATCHER.labels(text[:500]), "procedure")
+    return procs
+
+
+# ---------------------------------------------------------------------------
+# Stored hit tags
+# ---------------------------------------------------------------------------
+# Ingestion stores each chunk's body parts, procedures and generic flag in
+# the Qdrant payload so query-time filters are set lookups.  The version is
+# a checksum of the tables they derive from: editing a table makes stored
+# tags stale, and they are recomputed on the fly until
+# ``app/scripts/backfill_hit_tags.py`` rewrites them.
+
+TAGS_VERSION = zlib.crc32(
+    json.dumps([QUERY_BODY_PART_KEYWORDS, PROCEDURE_INDICATORS, GENERIC_DOC_PATTERNS]).encode()
+)
+TAG_KEYS = ("body_parts", "procedures", "is_generic", "tags_version")
+
+
+@dataclass(frozen=True)
+class HitTags:
+    body_parts: FrozenSet[str]
+    procedures: FrozenSet[str]
+    generic: bool
+
+
+def document_tags(title: str, text: str) -> dict:
+    """Payload fields describing what a chunk is about (see :func:`hit_tags`)."""
+    t = analyze_title(title)
+    return {
+        "body_parts": sorted(t.body_parts),
+        "procedures": sorted(hit_procedures(title, text)),
+        "is_generic": t.generic,
+        "tags_version": TAGS_VERSION,
+    }
+
+
+def hit_tags(payload: dict) -> HitTags:
+    """Tags for a retrieved chunk: stored ones when current, else computed.
+
+    Body parts and the generic flag come from the title; procedures from
+    the title with a chunk-text fallback.
+    """
+    if payload.get("tags_version") == TAGS_VERSION:
+        return HitTags(
+            body_parts=frozenset(payload.get("body_parts") or ()),
+            procedures=frozenset(payload.get("procedures") or ()),
+            generic=bool(payload.get("is_generic")),
+        )
+    title = payload.get("title", "")
+    t = analyze_title(title)
+    return HitTags(
+        body_parts=t.body_parts,
+        procedures=hit_procedures(title, payload.get("text", "")),
+        generic=t.generic,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Exclusion rules
+# ---------------------------------------------------------------------------
+# Within one body part, different procedures have different protocols.  The
+# rules are data so the same definition drives the Python hit filter and
+# the Qdrant search filter.
+
+@dataclass(frozen=True)
+class ProcedureExclusion:
+    """Exclude a hit tagged with any of ``any_of`` but none of ``none_of``."""
+    any_of: FrozenSet[str]
+    none_of: FrozenSet[str] = frozenset()
+
+    def excludes(self, hit_procs: FrozenSet[str]) -> bool:
+        return bool(hit_procs & self.any_of) and not (hit_procs & self.none_of)
+
+
+def procedure_exclusions(query_procs: FrozenSet[str]) -> List[ProcedureExclusion]:
+    rules: List[ProcedureExclusion] = []
+    E = ProcedureExclusion
+
+    # --- Meniscus (any kind) without ACL → exclude ACL-primary hits ---
+    # "Meniscus root repair" and "meniscus repair" are distinct from
+    # "ACL reconstruction with meniscal repair".  If the user did not
+    # mention ACL, any hit that is (even partly) about ACL is excluded.
+    if query_procs & {"meniscus", "meniscus_root"} and "acl" not in query_procs:
+        rules.append(E(frozenset({"acl"})))
+
+    # --- ACL without meniscus → exclude standalone meniscus hits ---
+    # Combined ACL + meniscus docs are kept (concomitant work is common).
+    if "acl" in query_procs and not query_procs & {"meniscus", "meniscus_root"}:
+        rules.append(E(frozenset({"meniscus_root", "meniscus"}), frozenset({"acl"})))
+
+    # --- Rotator cuff ↔ shoulder replacement ---
+    if "rotator_cuff" in query_procs and "shoulder_replacement" not in query_procs:
+        rules.append(E(frozenset({"shoulder_replacement"}), frozenset({"rotator_cuff"})))
+    if "shoulder_replacement" in query_procs and "rotator_cuff" not in query_procs:
+        rules.append(E(frozenset({"rotator_cuff"}), frozenset({"shoulder_replacement"})))
+
+    # --- Hip arthroscopy ↔ total hip replacement ---
+    if "hip_arthroscopy" in query_procs and "total_hip" not in query_procs:
+        rules.append(E(frozenset({"total_hip"}), frozenset({"hip_arthroscopy"})))
+    if "total_hip" in query_procs and "hip_arthroscopy" not in query_procs:
+        rules.append(E(frozenset({"hip_arthroscopy"}), frozenset({"total_hip"})))
+
+    # --- Total knee ↔ ACL/meniscus ---
+    if "total_knee" in query_procs:
+        rules.append(E(frozenset({"acl", "meniscus_root"}), frozenset({"total_knee"})))
+    if query_procs & {"acl", "meniscus"} and "total_knee" not in query_procs:
+        rules.append(E(frozenset({"total_knee"}), frozenset(query_procs)))
+
+    return rules
+
+
+def search_must_not(analysis: QueryAnalysis) -> List[qmodels.Filter]:
+    """Qdrant ``must_not`` conditions equivalent to the hit-level filters.
+
+    Each condition only applies to points whose stored tags are current
+    (``tags_version``); untagged or stale points pass through and are
+    handled by the Python post-filters.  Generic-document demotion depends
+    on the other hits, so it stays in Python.
+    """
+    current = qmodels.FieldCondition(key="tags_version", match=qmodels.MatchValue(value=TAGS_VERSION))
+    conditions: List[qmodels.Filter] = []
+
+    # Title names a body part, and none of the question's
+    if analysis.body_parts:
+        conditions.append(qmodels.Filter(
+            must=[
+                current,
+                qmodels.Filter(must_not=[qmodels.IsEmptyCondition(is_empty=qmodels.PayloadField(key="body_parts"))]),
+            ],
+            must_not=[qmodels.FieldCondition(key="body_parts", match=qmodels.MatchAny(any=sorted(analysis.body_parts)))],
+        ))
+
+    for rule in procedure_exclusions(analysis.procedures):
+        conditions.append(qmodels.Filter(
+            must=[
+                current,
+                qmodels.FieldCondition(key="procedures", match=qmodels.MatchAny(any=sorted(rule.any_of))),
+            ],
+            must_not=[
+                qmodels.FieldCondition(key="procedures", match=qmodels.MatchAny(any=sorted(rule.none_of)))
+            ] if rule.none_of else None,
+        ))
+    return conditions
+
+
+@lru_cache(maxsize=1024)
+def collection_body_part(collection_name: str) -> Optional[str]:
+    """Body part a collection covers, inferred from its name.
+
+    ``None`` when it cannot be inferred (e.g.
+    ``dr_joshua_dines_clinic_protocols``); such collections are never
+    filtered out.  The first matching entry of
+    :data:`COLLECTION_BODY_PART_MAP` wins.
+    """
+    for keyword, body_part in COLLECTION_BODY_PART_MAP.items():
+        if keyword in collection_name:
+            return body_part
+    return None
@@ -1,5 +1,6 @@
 """Service for logging and querying patient/provider questions."""
 
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -7,6 +8,7 @@ from sqlalchemy import func, case
 from sqlalchemy.orm import Session
 
 from app.core.logging import logger
+from app.core.metrics import QUESTION_LOG_WRITE_SECONDS
 from app.models.question_log import QuestionLog
 
 
@@ -31,6 +33,7 @@ def log_question(
     Non-fatal: if the database is unavailable the RAG query should still
     succeed — we just skip logging and return None.
     """
+    t = time.perf_counter()
     try:
         entry = QuestionLog(
             actor=actor,
@@ -49,6 +52,7 @@ def log_question(
         db.add(entry)
         db.commit()
         db.refresh(entry)
+        QUESTION_LOG_WRITE_SECONDS.observe(time.perf_counter() - t)
         logger.info(
             "question_logged",
             question_id=entry.id,
@@ -1,89 +1,412 @@
+import asyncio
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Optional
-from openai import OpenAI
-import anthropic
 import uuid
 
-from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
 from app.core.config import settings
 from app.core.logging import logger
+from app.core import timing
+from app.core.metrics import RAG_COLLECTION_SEARCH_FAILURES, external_call
+from app.services import clients, local_index
+from app.services.sparse import SPARSE_VECTOR_NAME, query_vector as sparse_query_vector
 
-_client: Optional[QdrantClient] = None
-_oa: Optional[OpenAI] = None
-_anthropic: Optional[anthropic.Anthropic] = None
+_search_pool: Optional[ThreadPoolExecutor] = None
 
-def client() -> QdrantClient:
-    global _client
-    if _client is None:
-        try:
-            # Simple initialization - let Qdrant client handle the details
-            if settings.qdrant_api_key:
-                _client = QdrantClient(
-                    url=settings.qdrant_url,
-                    api_key=settings.qdrant_api_key,
-                    timeout=60,
-                    prefer_grpc=False  # Use HTTP instead of gRPC to avoid connection issues
-                )
-            else:
-                _client = QdrantClient(
-                    url=settings.qdrant_url,
-                    timeout=60,
-                    prefer_grpc=False
-                )
-            logger.info("qdrant_client_initialized", url=settings.qdrant_url)
-        except Exception as e:
-            logger.error("qdrant_client_init_failed", error=str(e))
-            raise
-    return _client
-
-def openai_client() -> OpenAI:
-    """OpenAI client — used for embeddings only."""
-    global _oa
-    if _oa is None:
-        _oa = OpenAI(api_key=settings.openai_api_key)
-    return _oa
-
-def anthropic_client() -> anthropic.Anthropic:
-    """Anthropic client — used for LLM generation (Claude Sonnet 4.5)."""
-    global _anthropic
-    if _anthropic is None:
-        _anthropic = anthropic.Anthropic(api_key=settings.anthropic_api_key)
-        logger.info("anthropic_client_initialized")
-    return _anthropic
+EMBED_MODEL = "text-embedding-3-small"
+# Reciprocal-rank fusion constant (Cormack et al.); damps the weight of the
+# very top ranks so neither dense nor sparse results dominate on their own
+RRF_K = 60
 
 def ensure_collection(collection_name: str = None):
-    c = client()
+    """Create the collection if Qdrant confirms it does not exist.
+
+    Only used by write paths (seeding).  A transient error while checking
+    propagates instead of falling through to a create, so a live collection
+    can never be wiped.
+    """
+    c = clients.qdrant()
     coll_name = collection_name or settings.collection
-    try:
-        c.get_collection(coll_name)
-    except Exception:
+    if not c.collection_exists(coll_name):
         logger.info("creating_collection", name=coll_name)
-        c.recreate_collection(
+        c.create_collection(
             collection_name=coll_name,
             vectors_config=qmodels.VectorParams(size=1536, distance=qmodels.Distance.COSINE),
         )
 
+class EmbeddingCache:
+    """Bounded LRU cache of query embeddings.
+
+    Keyed by (model, normalized text) so that repeats of the same question
+    that differ only in case or whitespace share an entry.  Vectors are
+    stored as float32 arrays (~6 KB for 1536 dims) and the least recently
+    used entries are evicted once ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[tuple[str, str], array]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).casefold()
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        key = (model, self.normalize(text))
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return vec.tolist()
+
+    def put(self, model: str, text: str, vector: list[float]) -> None:
+        if self.max_bytes <= 0:
+            return
+        key = (model, self.normalize(text))
+        vec = array("f", vector)
+        size = vec.itemsize * len(vec)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.itemsize * len(old)
+            self._entries[key] = vec
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.itemsize * len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+embedding_cache = EmbeddingCache(max_bytes=settings.embed_cache_max_mb * 1024 * 1024)
+
 def embed(text: str) -> list[float]:
     """Return a single 1536-dim embedding using text-embedding-3-small."""
-    oa = openai_client()
-    out = oa.embeddings.create(model="text-embedding-3-small", input=text)
-    return out.data[0].embedding
+    cached = embedding_cache.get(EMBED_MODEL, text)
+    if cached is not None:
+        return cached
+    oa = clients.openai()
+    with external_call("openai", "embeddings"):
+        out = oa.embeddings.create(model=EMBED_MODEL, input=text)
+    vec = out.data[0].embedding
+    embedding_cache.put(EMBED_MODEL, text, vec)
+    return vec
+
+def _query_filter(must: list = None, must_not: list = None):
+    if not must and not must_not:
+        return None
+    return qmodels.Filter(must=must or None, must_not=must_not or None)
+
+def _can_fall_back(collection_name: str) -> bool:
+    """Whether a failed Qdrant search may be served from the local snapshot."""
+    return settings.retrieval_backend == "auto" and local_index.available(collection_name)
 
-def search(question: str, top_k: int = 6, collection_name: str = None):
-    vec = embed(question)
-    c = client()
+def search(question: str = None, top_k: int = 6, collection_name: str = None, vector: list[float] = None, timeout: int = None,
+           must: list = None, must_not: list = None):
+    """Search one collection.
+
+    Pass ``vector`` when the question has already been embedded so that
+    searching several collections for the same question does not pay for
+    an embedding round trip per collection.  ``must`` / ``must_not`` are
+    Qdrant filter conditions applied server-side, so excluded chunks do not
+    use up ``top_k`` slots.
+
+    ``settings.retrieval_backend`` selects Qdrant, the memory-mapped
+    snapshots in :mod:`app.services.local_index`, or Qdrant with a snapshot
+    fallback (``auto``).
+    """
+    vec = vector if vector is not None else embed(question)
     coll_name = collection_name or settings.collection
-    return c.search(
-        collection_name=coll_name,
-        query_vector=vec,
-        limit=top_k,
-        with_payload=True,
-    )
+    flt = _query_filter(must, must_not)
+    if settings.retrieval_backend == "local":
+        return local_index.search(coll_name, vec, top_k, flt)
+    try:
+        with external_call("qdrant", "search"):
+            return clients.qdrant().search(
+                collection_name=coll_name,
+                query_vector=vec,
+                query_filter=flt,
+                limit=top_k,
+                with_payload=True,
+                timeout=timeout,
+            )
+    except Exception as e:
+        if not _can_fall_back(coll_name):
+            raise
+        logger.warning("local_index_fallback", collection=coll_name, error=str(e))
+        return local_index.search(coll_name, vec, top_k, flt)
+
+def _pool() -> ThreadPoolExecutor:
+    global _search_pool
+    if _search_pool is None:
+        _search_pool = ThreadPoolExecutor(
+            max_workers=settings.search_max_workers,
+            thread_name_prefix="qdrant-search",
+        )
+    return _search_pool
+
+def search_many(question: str = None, collections: list[str] = (), top_k: int = 6, vector: list[float] = None,
+                must: list = None, must_not: list = None) -> dict:
+    """Search several collections concurrently with a single embedding.
+
+    Every collection is searched on a bounded thread pool and gets its own
+    ``settings.search_timeout_seconds`` deadline (also passed to Qdrant as
+    the server-side search timeout).  Collections that fail or miss the
+    deadline are logged and left out of the result, so retrieval latency
+    tracks the slowest healthy collection rather than the sum of all of them.
+    In ``auto`` mode a collection that misses the deadline is served from
+    its local snapshot instead, when there is one.
+
+    Returns ``{collection_name: hits}`` in the order of ``collections``.
+    """
+    if not collections:
+        return {}
+    vec = vector if vector is not None else embed(question)
+    deadline = settings.search_timeout_seconds
+    server_timeout = max(1, int(deadline))
+    futures = {
+        _pool().submit(
+            search, top_k=top_k, collection_name=coll_name, vector=vec, timeout=server_timeout,
+            must=must, must_not=must_not,
+        ): coll_name
+        for coll_name in collections
+    }
+    t0 = time.monotonic()
+    _done, not_done = wait(futures, timeout=deadline)
+    fallbacks = {}
+    for fut in not_done:
+        fut.cancel()
+        coll_name = futures[fut]
+        if _can_fall_back(coll_name):
+            logger.warning("local_index_fallback", collection=coll_name, error="timeout")
+            fallbacks[coll_name] = local_index.search(
+                coll_name, vec, top_k, _query_filter(must, must_not)
+            )
+            continue
+        RAG_COLLECTION_SEARCH_FAILURES.labels("timeout").inc()
+        logger.warning(
+            "collection_search_timeout",
+            collection=coll_name,
+            timeout_s=deadline,
+            waited_ms=int((time.monotonic() - t0) * 1000),
+        )
+
+    results = {}
+    for fut, coll_name in futures.items():
+        if coll_name in fallbacks:
+            results[coll_name] = fallbacks[coll_name]
+            continue
+        if fut in not_done:
+            continue
+        try:
+            results[coll_name] = fut.result()
+        except Exception as e:
+            RAG_COLLECTION_SEARCH_FAILURES.labels("error").inc()
+            logger.warning("collection_search_failed", collection=coll_name, error=str(e))
+    return results
+
+async def aembed(text: str) -> list[float]:
+    """Async variant of :func:`embed`."""
+    cached = embedding_cache.get(EMBED_MODEL, text)
+    if cached is not None:
+        return cached
+    oa = clients.async_openai()
+    with external_call("openai", "embeddings"):
+        out = await oa.embeddings.create(model=EMBED_MODEL, input=text)
+    vec = out.data[0].embedding
+    embedding_cache.put(EMBED_MODEL, text, vec)
+    return vec
+
+async def asearch(question: str = None, top_k: int = 6, collection_name: str = None, vector: list[float] = None, timeout: int = None,
+                  must: list = None, must_not: list = None):
+    """Async variant of :func:`search`."""
+    vec = vector if vector is not None else await aembed(question)
+    coll_name = collection_name or settings.collection
+    flt = _query_filter(must, must_not)
+    if settings.retrieval_backend == "local":
+        return await asyncio.to_thread(local_index.search, coll_name, vec, top_k, flt)
+    try:
+        with external_call("qdrant", "search"):
+            return await clients.async_qdrant().search(
+                collection_name=coll_name,
+                query_vector=vec,
+                query_filter=flt,
+                limit=top_k,
+                with_payload=True,
+                timeout=timeout,
+            )
+    except Exception as e:
+        if not _can_fall_back(coll_name):
+            raise
+        logger.warning("local_index_fallback", collection=coll_name, error=str(e))
+        return await asyncio.to_thread(local_index.search, coll_name, vec, top_k, flt)
+
+async def ahybrid_search(top_k: int, collection_name: str, vector: list[float], sparse: qmodels.SparseVector,
+                         timeout: int = None, must: list = None, must_not: list = None):
+    """Dense and sparse search of one collection in a single batch request.
+
+    Returns ``(dense_hits, sparse_hits)``; both use the same filter.  When
+    falling back to the local snapshot only dense hits are available and
+    ``sparse_hits`` is ``None``.
+    """
+    flt = _query_filter(must, must_not)
+    requests = [
+        qmodels.SearchRequest(vector=vector, filter=flt, limit=top_k, with_payload=True),
+        qmodels.SearchRequest(
+            vector=qmodels.NamedSparseVector(name=SPARSE_VECTOR_NAME, vector=sparse),
+            filter=flt, limit=top_k, with_payload=True,
+        ),
+    ]
+    try:
+        with external_call("qdrant", "search_batch"):
+            dense, lexical = await clients.async_qdrant().search_batch(
+                collection_name=collection_name, requests=requests, timeout=timeout,
+            )
+    except Exception as e:
+        if not _can_fall_back(collection_name):
+            raise
+        logger.warning("local_index_fallback", collection=collection_name, error=str(e))
+        dense = await asyncio.to_thread(local_index.search, collection_name, vector, top_k, flt)
+        return dense, None
+    return dense, lexical
+
+def fuse_rankings(results: dict, top_k: int, hybrid_top_k: int = None) -> dict:
+    """Reciprocal-rank fusion of ``{collection: (dense_hits, sparse_hits)}``.
+
+    Dense hits of every collection form one ranking and sparse hits another
+    (``sparse_hits`` is ``None`` for collections without sparse vectors, which
+    then only take part in the dense ranking).  Ranking globally rather than
+    per collection keeps scores comparable across collections, which the
+    tiered ranking in ``rag_query`` relies on.  A dense-only hit counts its
+    dense rank for both rankings, so it is not outranked by hybrid hits just
+    for lacking a sparse vector.  Each hit's ``score`` is replaced by its
+    fused score; at most ``hybrid_top_k`` hits are kept per hybrid collection
+    and ``top_k`` per dense-only one, best first.
+    """
+    fused = {}
+    for which in (0, 1):
+        ranking = sorted(
+            ((coll, h) for coll, pair in results.items() for h in (pair[which] or ())),
+            key=lambda ch: ch[1].score, reverse=True,
+        )
+        for rank, (coll, h) in enumerate(ranking, start=1):
+            entry = fused.setdefault((coll, h.id), [0.0, h])
+            weight = 2.0 if which == 0 and results[coll][1] is None else 1.0
+            entry[0] += weight / (RRF_K + rank)
+
+    limits = {
+        coll: top_k if pair[1] is None else (hybrid_top_k or top_k)
+        for coll, pair in results.items()
+    }
+    out = {coll: [] for coll in results}
+    for (coll, _id), (score, h) in sorted(fused.items(), key=lambda kv: kv[1][0], reverse=True):
+        if len(out[coll]) < limits[coll]:
+            h.score = score
+            out[coll].append(h)
+    return out
+
+async def asearch_many(question: str = None, collections: list[str] = (), top_k: int = 6, vector: list[float] = None,
+                       must: list = None, must_not: list = None, sparse_collections: list[str] = (),
+                       hybrid_top_k: int = None) -> dict:
+    """Async variant of :func:`search_many`.
+
+    Searches run concurrently on the event loop (at most
+    ``settings.search_max_workers`` in flight) and each one is cancelled
+    when it exceeds ``settings.search_timeout_seconds``; in ``auto`` mode
+    the collection is then searched in its local snapshot, if it has one.
+
+    Collections listed in ``sparse_collections`` (those that store the
+    ``bm25`` sparse vector) are also searched lexically for ``question``
+    when ``settings.hybrid_search`` is on, with ``hybrid_top_k`` hits per
+    ranking (default ``top_k``), and all results are merged with
+    :func:`fuse_rankings`.  Otherwise hits keep their cosine scores.
+    """
+    if not collections:
+        return {}
+    vec = vector if vector is not None else await aembed(question)
+    deadline = settings.search_timeout_seconds
+    server_timeout = max(1, int(deadline))
+    sem = asyncio.Semaphore(settings.search_max_workers)
+    sparse = None
+    if settings.hybrid_search and settings.retrieval_backend != "local" and question and sparse_collections:
+        sparse = sparse_query_vector(question)
+    hybrid = set(sparse_collections) if sparse is not None else set()
+
+    async def _one(coll_name: str):
+        async with sem:
+            if coll_name in hybrid:
+                call = ahybrid_search(
+                    top_k=hybrid_top_k or top_k, collection_name=coll_name, vector=vec, sparse=sparse,
+                    timeout=server_timeout, must=must, must_not=must_not,
+                )
+            else:
+                call = asearch(
+                    top_k=top_k, collection_name=coll_name, vector=vec, timeout=server_timeout,
+                    must=must, must_not=must_not,
+                )
+            t = time.perf_counter()
+            try:
+                return await asyncio.wait_for(call, timeout=deadline)
+            except asyncio.TimeoutError:
+                # The fallback inside asearch/ahybrid_search was cancelled
+                # along with the hung Qdrant call, so it is done here.
+                if not _can_fall_back(coll_name):
+                    raise
+                logger.warning("local_index_fallback", collection=coll_name, error="timeout")
+                if coll_name in hybrid:
+                    dense = await asyncio.to_thread(
+                        local_index.search, coll_name, vec, hybrid_top_k or top_k, _query_filter(must, must_not)
+                    )
+                    return dense, None
+                return await asyncio.to_thread(
+                    local_index.search, coll_name, vec, top_k, _query_filter(must, must_not)
+                )
+            finally:
+                timing.record_collection(coll_name, (time.perf_counter() - t) * 1000)
+
+    outcomes = await asyncio.gather(*(_one(name) for name in collections), return_exceptions=True)
+
+    results = {}
+    for coll_name, outcome in zip(collections, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            RAG_COLLECTION_SEARCH_FAILURES.labels("timeout").inc()
+            logger.warning("collection_search_timeout", collection=coll_name, timeout_s=deadline)
+        elif isinstance(outcome, Exception):
+            RAG_COLLECTION_SEARCH_FAILURES.labels("error").inc()
+            logger.warning("collection_search_failed", collection=coll_name, error=str(outcome))
+        else:
+            results[coll_name] = outcome
+    if not hybrid:
+        return results
+    pairs = {name: hits if name in hybrid else (hits, None) for name, hits in results.items()}
+    return fuse_rankings(pairs, top_k, hybrid_top_k)
 
 # Dev-only seeder for testing
 def seed_demo():
     ensure_collection()
-    c = client()
+    c = clients.qdrant()
     points = [
         qmodels.PointStruct(
             id=str(uuid.uuid4()),
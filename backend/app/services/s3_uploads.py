@@ -1,19 +1,8 @@
+import threading
+import time
 import uuid
-import boto3
-from botocore.config import Config as BotoConfig
 from app.core.config import settings
-
-_s3 = None
-
-def s3():
-    global _s3
-    if _s3 is None:
-        _s3 = boto3.client(
-            "s3",
-            region_name=settings.aws_region,
-            config=BotoConfig(retries={"max_attempts": 3}),
-        )
-    return _s3
+from app.services.clients import s3
 
 def new_object_key(org_id: str, filename: str) -> str:
     ext = filename.split(".")[-1].lower() if "." in filename else "bin"
@@ -56,3 +45,41 @@ def presign_get(key: str, expiry_seconds: int = 3600) -> str:
         Params={"Bucket": settings.s3_bucket, "Key": key},
         ExpiresIn=expiry_seconds,
     )
+
+
+# Presigned GET URLs reused across requests.  Each entry is handed out only
+# until a safety margin before it expires, so a redirect never points at a
+# URL that dies while the browser is following it.
+_signed_urls: dict = {}
+_signed_urls_lock = threading.Lock()
+_SIGNED_URL_MARGIN = 0.2  # fraction of the lifetime kept in reserve
+_SIGNED_URLS_MAX = 10000
+_signed_url_stats = {"hits": 0, "misses": 0}
+
+
+def presign_get_cached(key: str, expiry_seconds: int = None) -> str:
+    """:func:`presign_get` with a process-wide cache of signatures."""
+    expiry_seconds = expiry_seconds or settings.document_link_expiry
+    now = time.monotonic()
+    with _signed_urls_lock:
+        hit = _signed_urls.get(key)
+        if hit is not None and hit[1] > now:
+            _signed_url_stats["hits"] += 1
+            return hit[0]
+        _signed_url_stats["misses"] += 1
+
+    url = presign_get(key, expiry_seconds=expiry_seconds)
+    reuse_until = now + expiry_seconds * (1 - _SIGNED_URL_MARGIN)
+    with _signed_urls_lock:
+        if len(_signed_urls) >= _SIGNED_URLS_MAX:
+            for k in [k for k, (_, until) in _signed_urls.items() if until <= now]:
+                del _signed_urls[k]
+            if len(_signed_urls) >= _SIGNED_URLS_MAX:
+                _signed_urls.clear()
+        _signed_urls[key] = (url, reuse_until)
+    return url
+
+
+def presign_cache_stats() -> dict:
+    with _signed_urls_lock:
+        return {"entries": len(_signed_urls), "max_entries": _SIGNED_URLS_MAX, **_signed_url_stats}
@@ -0,0 +1,92 @@
+"""Locally computed BM25-style sparse vectors for hybrid retrieval.
+
+Protocol questions hinge on exact tokens ("PWB 0-25%", "UCL", "BTB",
+"week 6") that dense embeddings blur.  Each chunk is stored with a sparse
+vector alongside its dense one, and ``retrieval`` fuses dense and sparse
+rankings with reciprocal-rank fusion.
+
+Tokens are hashed (crc32) into the sparse index space, so no vocabulary has
+to be kept in sync between ingestion and query time.  Document weights use
+BM25 term-frequency saturation and length normalization against a fixed
+average chunk length; query terms weigh 1.  There is no IDF term — it would
+need corpus statistics at query time — so common words are removed with a
+stopword list instead.
+"""
+
+import re
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+from qdrant_client.http import models as qmodels
+
+# Name of the sparse vector in Qdrant collections
+SPARSE_VECTOR_NAME = "bm25"
+
+K1 = 1.2
+B = 0.75
+# ~1800-char chunks (see ingestion._split) are roughly 300 tokens
+AVG_DOC_TOKENS = 300
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before
+being between both but by can could did do does doing during each few for
+from further had has have having he her here hers him his how i if in into
+is it its itself just me more most my no nor not now of off on once only or
+other our out over own same she should so some such than that the their them
+then there these they this those through to too under until up very was we
+were what when where which while who whom why will with would you your
+""".split())
+
+# Words, numbers and compounds such as "0-25%", "2.5", "acl-r", "s/p"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*%?")
+_PART_SPLIT_RE = re.compile(r"[-./%]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms, plus the parts of compound tokens and word-number
+    bigrams ("week 6", "pwb 0-25%") so both exact phrases and their pieces
+    can match."""
+    words = _TOKEN_RE.findall(text.lower())
+    out: List[str] = []
+    prev: Optional[str] = None
+    for w in words:
+        if w in STOPWORDS:
+            prev = None
+            continue
+        out.append(w)
+        if _PART_SPLIT_RE.search(w):
+            out.extend(p for p in _PART_SPLIT_RE.split(w) if p and p not in STOPWORDS)
+        if prev is not None and prev.isalpha() and w[0].isdigit():
+            out.append(f"{prev} {w}")
+        prev = w
+    return out
+
+
+def _index(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def _vector(weights: dict) -> Optional[qmodels.SparseVector]:
+    if not weights:
+        return None
+    indices = sorted(weights)
+    return qmodels.SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+
+def document_vector(text: str) -> Optional[qmodels.SparseVector]:
+    """Sparse vector for a stored chunk (``None`` if it has no terms)."""
+    terms = tokenize(text)
+    if not terms:
+        return None
+    norm = K1 * (1 - B + B * len(terms) / AVG_DOC_TOKENS)
+    weights: dict = {}
+    for term, tf in Counter(terms).items():
+        idx = _index(term)
+        weights[idx] = weights.get(idx, 0.0) + tf * (K1 + 1) / (tf + norm)
+    return _vector(weights)
+
+
+def query_vector(text: str) -> Optional[qmodels.SparseVector]:
+    """Sparse vector for a question (``None`` if it has no terms)."""
+    return _vector({_index(term): 1.0 for term in set(tokenize(text))})
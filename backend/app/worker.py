@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Ingestion worker: processes queued documents from the ``ingestion_jobs`` table.
+
+Run it as its own process (or service) next to the API, so parsing, OCR and
+embedding never share CPU with query traffic:
+
+    python -m app.worker [--concurrency 2] [--metrics-port 9101]
+
+Each of ``--concurrency`` threads claims one job at a time (see
+``app.services.job_queue``); leases of running jobs are renewed in the
+background.  On SIGTERM/SIGINT the worker stops claiming and drains: running
+jobs get up to INGEST_DRAIN_SECONDS to finish, anything still running after
+that is handed back to the queue for another worker.
+
+The API also starts INGEST_INLINE_WORKERS (default 1) of these threads in
+its own process, so a single-service deploy ingests without this command.
+When running it as a separate service (``railway-worker.json``), set
+INGEST_INLINE_WORKERS=0 on the API and give both the same DATABASE_URL
+(e.g. PostgreSQL): a worker in another container cannot see the API's
+SQLite file.
+"""
+
+import argparse
+import signal
+import threading
+import time
+from typing import Optional, Set
+
+from app.core.config import settings
+from app.core.database import DATABASE_URL, SessionLocal, init_db
+from app.core.logging import logger
+from app.services import job_queue
+
+# Finished jobs are pruned at most this often
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+class Worker:
+    def __init__(self, concurrency: int, worker_id: Optional[str] = None):
+        self.concurrency = concurrency
+        self.worker_id = worker_id or job_queue.default_worker_id()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight: Set[str] = set()
+        self._threads: list = []
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        threading.Thread(target=self._maintain, name="ingest-lease", daemon=True).start()
+        logger.info("ingest_worker_started", worker_id=self.worker_id, concurrency=self.concurrency)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            db = SessionLocal()
+            try:
+                job = job_queue.claim(db, self.worker_id)
+                if job is None:
+                    self._stopping.wait(settings.ingest_poll_seconds)
+                    continue
+                with self._lock:
+                    self._in_flight.add(job.id)
+                try:
+                    job_queue.execute(db, job, self.worker_id)
+                finally:
+                    with self._lock:
+                        self._in_flight.discard(job.id)
+            except Exception as e:
+                # Database unreachable etc.; keep polling
+                logger.warning("ingest_worker_error", error=str(e))
+                self._stopping.wait(settings.ingest_poll_seconds)
+            finally:
+                db.close()
+
+    def _maintain(self) -> None:
+        """Renew leases of running jobs and prune old finished ones."""
+        last_prune = 0.0
+        while not self._stopping.wait(settings.ingest_job_lease_seconds / 3):
+            db = SessionLocal()
+            try:
+                with self._lock:
+                    running = list(self._in_flight)
+                job_queue.renew(db, running, self.worker_id)
+                if time.monotonic() - last_prune > PRUNE_INTERVAL_SECONDS:
+                    last_prune = time.monotonic()
+                    pruned = job_queue.prune(db, settings.ingest_job_retention_days)
+                    if pruned:
+                        logger.info("ingest_jobs_pruned", count=pruned)
+            except Exception as e:
+                logger.warning("ingest_lease_renewal_failed", error=str(e))
+            finally:
+                db.close()
+
+    def drain(self, timeout: float) -> None:
+        """Stop claiming, wait up to ``timeout`` s for running jobs, then
+        hand the rest back to the queue."""
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            unfinished = list(self._in_flight)
+        if unfinished:
+            db = SessionLocal()
+            try:
+                for job_id in unfinished:
+                    job_queue.release(db, job_id, self.worker_id)
+            finally:
+                db.close()
+        logger.info("ingest_worker_stopped", worker_id=self.worker_id, released=len(unfinished))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued document ingestion jobs")
+    parser.add_argument('--concurrency', type=int, default=settings.ingest_worker_concurrency,
+                        help='Jobs processed in parallel (default: INGEST_WORKER_CONCURRENCY)')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port')
+    args = parser.parse_args()
+
+    init_db()
+    if DATABASE_URL.startswith("sqlite"):
+        logger.warning(
+            "ingest_worker_sqlite",
+            detail="jobs are only visible to an API using the same SQLite file; "
+                   "use a shared DATABASE_URL (e.g. PostgreSQL) for separate services",
+        )
+    if args.metrics_port:
+        from prometheus_client import start_http_server
+        start_http_server(args.metrics_port)
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    worker = Worker(args.concurrency)
+    worker.start()
+    stop.wait()
+    logger.info("ingest_worker_draining", timeout_s=settings.ingest_drain_seconds)
+    worker.drain(settings.ingest_drain_seconds)
+
+
+if __name__ == "__main__":
+    main()
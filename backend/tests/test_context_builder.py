@@ -0,0 +1,59 @@
+from app.services.context_builder import MergedHit, estimate_tokens, pack_context
+
+
+def _hit(i: int, text: str) -> MergedHit:
+    return MergedHit(id=i, score=1.0, payload={"text": text, "title": f"Doc {i}"})
+
+
+def test_small_chunk_after_oversized_one_is_kept():
+    hits = [_hit(1, "a " * 200), _hit(2, "b " * 2000), _hit(3, "c " * 50)]
+
+    packed = pack_context(hits, max_tokens=200)
+
+    assert [c.hit.id for c in packed.chunks] == [1, 3]
+    assert packed.dropped == 1
+    assert packed.truncated == 0
+    assert packed.tokens <= 200
+
+
+def test_leftover_budget_truncates_first_skipped_chunk_in_place():
+    hits = [_hit(1, "a " * 100), _hit(2, "Sentence. " * 400), _hit(3, "c " * 20)]
+
+    packed = pack_context(hits, max_tokens=400)
+
+    assert [c.hit.id for c in packed.chunks] == [1, 2, 3]
+    assert [c.truncated for c in packed.chunks] == [False, True, False]
+    assert packed.truncated == 1
+    assert packed.dropped == 0
+    assert packed.tokens <= 400
+    assert estimate_tokens(packed.chunks[1].text) < estimate_tokens(hits[1].payload["text"])
+
+
+def test_zero_budget_keeps_everything():
+    hits = [_hit(i, "x " * 1000) for i in range(3)]
+
+    packed = pack_context(hits, max_tokens=0)
+
+    assert len(packed.chunks) == 3
+    assert packed.dropped == 0
+
+
+def test_supplementary_chunk_packed_after_skipped_own_chunk_is_not_own():
+    from app.routers.rag import CollectionRoute
+
+    route = CollectionRoute(own=["dr_x_acl"], supplementary=["general_acl"])
+
+    def _tokens_hit(i: int, collection: str, tokens: int) -> MergedHit:
+        return MergedHit(id=i, score=1.0, payload={"text": "w " * (tokens * 2), "_source_collection": collection})
+
+    hits = [
+        _tokens_hit(0, "dr_x_acl", 2000),
+        _tokens_hit(1, "dr_x_acl", 6000),
+        _tokens_hit(2, "dr_x_acl", 4000),
+        _tokens_hit(3, "general_acl", 800),
+    ]
+
+    packed = pack_context(hits, max_tokens=3500)
+
+    assert [c.hit.id for c in packed.chunks] == [0, 1, 3]
+    assert [route.is_own(c.hit) for c in packed.chunks] == [True, True, False]
@@ -9,13 +9,13 @@ import os
 import sys
 import uuid
 from pathlib import Path
-import boto3
 from dotenv import load_dotenv
 
 # Add parent directory to path to import from app
 sys.path.insert(0, str(Path(__file__).parent))
 from app.services.ingestion import process_document
 from app.core.config import settings
+from app.services import clients
 
 load_dotenv()
 
@@ -25,7 +25,7 @@ def slugify(text):
 
 def upload_to_s3(file_path, doctor_slug, protocol_slug):
     """Upload file to S3 and return the key."""
-    s3 = boto3.client('s3', region_name=settings.aws_region)
+    s3 = clients.s3()
     
     file_name = Path(file_path).name
     ext = Path(file_path).suffix